@@ -0,0 +1,329 @@
+"""
+Per-user behavioural baselines
+
+Each user has a compact profile of what is normal for them: known countries,
+cities, devices and apps with sighting counts, an hour-of-day histogram and a
+sign-in rate per active day. Observing an event is a handful of dict and list
+updates; value maps are capped so a profile never grows past a few kilobytes.
+Profiles live in memory, are loaded from ``user_baselines`` on first use and
+dirty profiles are written back at most every ``BASELINE_PERSIST_SECONDS``.
+With several server workers only the stream owner (``app.components.stream``)
+observes events, persisting profiles in the transaction that advances its
+watermark; every worker re-reads changed rows every ``BASELINE_SYNC_SECONDS``.
+"""
+from datetime import datetime, timedelta
+from threading import RLock
+from time import monotonic
+from typing import Dict, Optional
+import json
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import SessionLocal, SecurityEvent, UserBaseline
+from app.components import leases
+
+EPOCH = datetime(1970, 1, 1)
+
+BASELINE_PERSIST_SECONDS = float(os.getenv("BASELINE_PERSIST_SECONDS", "60"))
+BASELINE_SYNC_SECONDS = float(os.getenv("BASELINE_SYNC_SECONDS", "5"))
+MAX_VALUES_PER_FIELD = 64
+# Events a profile needs before novelty verdicts are trusted
+MIN_EVENTS_FOR_BASELINE = 20
+# An hour holding less than this share of a user's activity is unusual for them
+UNUSUAL_HOUR_SHARE = 0.02
+
+FIELDS = {
+    "countries": "geo_country",
+    "cities": "geo_city",
+    "devices": "device_id",
+    "apps": "app_name",
+    "oauth_apps": "oauth_app_name",
+}
+
+
+class UserProfile:
+    """Behavioural profile of one user"""
+    __slots__ = ("user", "values", "hours", "events", "sign_ins", "active_days", "last_day",
+                 "first_seen", "last_seen")
+
+    def __init__(self, user: str):
+        self.user = user
+        self.values: Dict[str, Dict[str, int]] = {name: {} for name in FIELDS}
+        self.hours = [0] * 24
+        self.events = 0
+        self.sign_ins = 0
+        self.active_days = 0
+        self.last_day = -1
+        self.first_seen = 0
+        self.last_seen = 0
+
+    def observe(self, event: SecurityEvent):
+        for name, column in FIELDS.items():
+            value = getattr(event, column)
+            if value:
+                _increment(self.values[name], value)
+        if event.sign_in_result is not None:
+            self.sign_ins += 1
+        ts = int((event.timestamp - EPOCH).total_seconds())
+        self.hours[event.timestamp.hour] += 1
+        day = ts // 86400
+        if day != self.last_day:
+            self.active_days += 1
+            self.last_day = day
+        if not self.first_seen or ts < self.first_seen:
+            self.first_seen = ts
+        if ts > self.last_seen:
+            self.last_seen = ts
+        self.events += 1
+
+    def knows(self, field: str, value: Optional[str], own: int = 0) -> bool:
+        """Whether ``value`` was seen, not counting ``own`` sightings of the event being assessed"""
+        return not value or self.values[field].get(value, 0) > own
+
+    def hour_share(self, hour: int, own: int = 0) -> float:
+        events = self.events - own
+        return (self.hours[hour] - own) / events if events > 0 else 0.0
+
+    @property
+    def sign_in_rate(self) -> float:
+        """Sign-ins per active day"""
+        return self.sign_ins / self.active_days if self.active_days else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "values": self.values,
+            "hours": self.hours,
+            "events": self.events,
+            "sign_ins": self.sign_ins,
+            "active_days": self.active_days,
+            "last_day": self.last_day,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, user: str, data: dict) -> "UserProfile":
+        profile = cls(user)
+        profile.values.update(data.get("values", {}))
+        profile.hours = data.get("hours", profile.hours)
+        for name in ("events", "sign_ins", "active_days", "last_day", "first_seen", "last_seen"):
+            setattr(profile, name, data.get(name, getattr(profile, name)))
+        return profile
+
+    def summary(self, top: int = 10) -> dict:
+        busiest = sorted(range(24), key=lambda h: self.hours[h], reverse=True)
+        return {
+            "user": self.user,
+            "events": self.events,
+            "established": self.events >= MIN_EVENTS_FOR_BASELINE,
+            "first_seen": _iso(self.first_seen),
+            "last_seen": _iso(self.last_seen),
+            "sign_ins": self.sign_ins,
+            "active_days": self.active_days,
+            "sign_in_rate_per_day": round(self.sign_in_rate, 3),
+            "hour_histogram": self.hours,
+            "typical_hours": sorted(h for h in busiest if self.hour_share(h) >= UNUSUAL_HOUR_SHARE),
+            **{
+                name: [
+                    {"value": v, "count": c}
+                    for v, c in sorted(values.items(), key=lambda item: item[1], reverse=True)[:top]
+                ]
+                for name, values in self.values.items()
+            },
+        }
+
+
+def _increment(counts: Dict[str, int], value: str):
+    if value in counts:
+        counts[value] += 1
+        return
+    if len(counts) >= MAX_VALUES_PER_FIELD:
+        # Forget the rarest value; bounded by the cap so observation stays constant time
+        del counts[min(counts, key=counts.get)]
+    counts[value] = 1
+
+
+def _iso(ts: int) -> Optional[str]:
+    return (EPOCH + timedelta(seconds=ts)).isoformat() if ts else None
+
+
+class BaselineStore:
+    """In-memory profiles with periodic write-back of dirty users"""
+
+    def __init__(self, persist_seconds: float = BASELINE_PERSIST_SECONDS,
+                 sync_seconds: float = BASELINE_SYNC_SECONDS):
+        self.profiles: Dict[str, UserProfile] = {}
+        self.dirty = set()
+        self.loaded = False
+        self.persist_seconds = persist_seconds
+        self.sync_seconds = sync_seconds
+        # Newest ``updated_at`` this store has read or written
+        self.synced_through: Optional[datetime] = None
+        self._last_persist = monotonic()
+        self._last_sync = monotonic()
+        self.lock = RLock()
+
+    def get(self, user: str) -> Optional[UserProfile]:
+        return self.profiles.get(user)
+
+    def observe(self, event: SecurityEvent):
+        if not event.user or event.timestamp is None:
+            return
+        profile = self.profiles.get(event.user)
+        if profile is None:
+            profile = self.profiles[event.user] = UserProfile(event.user)
+        profile.observe(event)
+        self.dirty.add(event.user)
+
+    def assess(self, event: SecurityEvent, observed: bool = False) -> dict:
+        """Novelty of an event against the user's baseline
+
+        ``observed`` discounts the event's own contribution, for events the
+        store has already folded in.
+        """
+        profile = self.profiles.get(event.user)
+        own = 1 if observed else 0
+        if profile is None or profile.events - own < MIN_EVENTS_FOR_BASELINE:
+            return {"established": False}
+        return {
+            "established": True,
+            "new_country": not profile.knows("countries", event.geo_country, own),
+            "new_city": not profile.knows("cities", event.geo_city, own),
+            "new_device": not profile.knows("devices", event.device_id, own),
+            "new_app": not profile.knows("apps", event.app_name, own),
+            "unusual_hour": event.timestamp is not None
+            and profile.hour_share(event.timestamp.hour, own) < UNUSUAL_HOUR_SHARE,
+        }
+
+    def assess_stored(self, event) -> dict:
+        """``assess`` for a stored event, which ingest may not have folded in yet"""
+        profile = self.profiles.get(event.user)
+        observed = profile is not None and event.timestamp is not None \
+            and int((event.timestamp - EPOCH).total_seconds()) <= profile.last_seen
+        return self.assess(event, observed=observed)
+
+    def _read_rows(self, rows) -> int:
+        for user, profile, updated_at in rows:
+            self.profiles[user] = UserProfile.from_dict(user, json.loads(profile or "{}"))
+            if updated_at and (self.synced_through is None or updated_at > self.synced_through):
+                self.synced_through = updated_at
+        return len(rows)
+
+    def load(self, db: Session, rebuild: bool = True):
+        """Load persisted profiles, or build them from history when none exist and ``rebuild`` is set"""
+        with self.lock:
+            if self.loaded:
+                return
+            self._last_sync = monotonic()
+            rows = db.query(UserBaseline.user, UserBaseline.profile, UserBaseline.updated_at).all()
+            if rows or not rebuild:
+                self._read_rows(rows)
+                self.loaded = True
+            else:
+                rebuild_baselines(db, self)
+
+    def reload(self, db: Session, rebuild: bool = True):
+        """Drop the in-memory profiles and load them again from the table"""
+        with self.lock:
+            self.profiles.clear()
+            self.dirty.clear()
+            self.synced_through = None
+            self.loaded = False
+            self.load(db, rebuild=rebuild)
+
+    def sync(self, db: Session) -> int:
+        """Read profiles another worker persisted, reloading fully when users were removed
+
+        Returns the number of profiles read.
+        """
+        with self.lock:
+            self._last_sync = monotonic()
+            query = db.query(UserBaseline.user, UserBaseline.profile, UserBaseline.updated_at)
+            if self.synced_through is not None:
+                query = query.filter(UserBaseline.updated_at > self.synced_through)
+            changed = self._read_rows(query.all())
+            total = db.query(func.count(UserBaseline.id)).scalar() or 0
+            if total != len(self.profiles):
+                # A rebuild dropped users this store still holds
+                self.reload(db, rebuild=False)
+                return total
+            return changed
+
+    def maybe_sync(self, db: Session) -> int:
+        if monotonic() - self._last_sync < self.sync_seconds:
+            return 0
+        return self.sync(db)
+
+    def persist(self, db: Session, commit: bool = True) -> int:
+        """Write dirty profiles back to ``user_baselines``; ``commit=False`` leaves the commit to the caller"""
+        with self.lock:
+            users = list(self.dirty)
+            self.dirty.clear()
+            self._last_persist = monotonic()
+            if not users:
+                return 0
+            existing = {
+                row.user: row for row in db.query(UserBaseline).filter(UserBaseline.user.in_(users)).all()
+            }
+            now = datetime.utcnow()
+            for user in users:
+                profile = self.profiles[user]
+                row = existing.get(user) or UserBaseline(user=user)
+                row.profile = json.dumps(profile.to_dict())
+                row.events_seen = profile.events
+                row.last_seen = EPOCH + timedelta(seconds=profile.last_seen) if profile.last_seen else None
+                row.updated_at = now
+                db.add(row)
+            if commit:
+                db.commit()
+            else:
+                db.flush()
+            self.synced_through = now
+            return len(users)
+
+    def maybe_persist(self, db: Session) -> int:
+        if monotonic() - self._last_persist < self.persist_seconds:
+            return 0
+        return self.persist(db)
+
+
+baseline_store = BaselineStore()
+
+
+def ensure_baselines(db: Session) -> BaselineStore:
+    if not baseline_store.loaded:
+        # The first load may rebuild and persist profiles, which a read-only request session cannot do
+        write_db = SessionLocal()
+        try:
+            # With several workers, building missing profiles is left to the stream owner
+            baseline_store.load(write_db, rebuild=leases.SERVER_WORKERS == 1)
+        finally:
+            write_db.close()
+    elif leases.SERVER_WORKERS > 1:
+        baseline_store.maybe_sync(db)
+    return baseline_store
+
+
+def rebuild_baselines(db: Session, store: Optional[BaselineStore] = None, batch_size: int = 10000) -> int:
+    """Rebuild every profile from ``security_events`` and persist them"""
+    store = store or baseline_store
+    with store.lock:
+        store.profiles.clear()
+        store.dirty.clear()
+        query = db.query(SecurityEvent).order_by(SecurityEvent.timestamp.asc()).yield_per(batch_size)
+        for event in query:
+            store.observe(event)
+        db.query(UserBaseline).delete()
+        store.loaded = True
+        return store.persist(db)
+
+
+def observe_events(db: Session, events):
+    """Fold freshly ingested events into the baselines (single-worker ingest path)"""
+    store = ensure_baselines(db)
+    with store.lock:
+        for event in events:
+            store.observe(event)
+        store.maybe_persist(db)
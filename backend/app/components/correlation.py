@@ -0,0 +1,378 @@
+"""
+Alert-to-incident correlation engine
+
+Alerts are clustered incrementally with a disjoint-set (union-find) over entity
+keys. Every alert contributes one key per entity it carries (user, IP address,
+device) scoped to a fixed time bucket, and unions with the same keys in its own
+and the adjacent buckets. Each cluster maps to exactly one incident; membership
+is persisted in the ``incident_alerts`` link table. An incident's MTTD runs
+from the earliest event behind its alerts to its detection, and is recomputed
+when it absorbs other incidents.
+"""
+from datetime import datetime, timedelta
+from threading import Lock
+from time import perf_counter
+from typing import Optional, List, Dict, Tuple
+from itertools import count
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Alert, Incident, IncidentAlert, SecurityEvent, IncidentStatus, SeverityLevel
+
+CORRELATION_WINDOW_MINUTES = int(os.getenv("CORRELATION_WINDOW_MINUTES", "60"))
+CORRELATION_RETENTION_BUCKETS = int(os.getenv("CORRELATION_RETENTION_BUCKETS", "48"))
+WARM_BATCH_SIZE = 5000
+
+EPOCH = datetime(1970, 1, 1)
+
+SEVERITY_RANK = {
+    SeverityLevel.LOW: 0,
+    SeverityLevel.MEDIUM: 1,
+    SeverityLevel.HIGH: 2,
+    SeverityLevel.CRITICAL: 3,
+}
+
+
+class DisjointSet:
+    """Union-find with path halving and union by size"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+
+class Cluster:
+    """State carried by the root of each alert cluster"""
+    __slots__ = ("incident_id", "first_seen", "last_seen", "alert_count", "severity_rank")
+
+    def __init__(self, timestamp: datetime, severity_rank: int):
+        self.incident_id = None
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.alert_count = 0
+        self.severity_rank = severity_rank
+
+
+class CorrelationEngine:
+    """Incrementally groups alerts sharing an entity within nearby time buckets"""
+
+    entity_kinds = ("user", "ip", "device")
+
+    def __init__(self, window_minutes: int = CORRELATION_WINDOW_MINUTES,
+                 retention_buckets: int = CORRELATION_RETENTION_BUCKETS):
+        self.window_seconds = window_minutes * 60
+        self.retention_buckets = retention_buckets
+        self._anonymous = count()
+        self.clear()
+
+    def clear(self):
+        """Forget all clusters; the next ``correlate_pending`` warms the engine from the database again"""
+        self.sets = DisjointSet()
+        self.clusters: Dict[tuple, Cluster] = {}
+        self.bucket_keys: Dict[int, List[tuple]] = {}
+        self.newest_bucket = None
+        self.warmed = False
+
+    def bucket_of(self, timestamp: datetime) -> int:
+        return int((timestamp - EPOCH).total_seconds() // self.window_seconds)
+
+    def add(self, timestamp: datetime, user: Optional[str], ip_address: Optional[str] = None,
+            device_id: Optional[str] = None, severity: Optional[SeverityLevel] = None,
+            incident_id: Optional[str] = None) -> Tuple[tuple, Cluster, List[str]]:
+        """
+        Add one alert and return ``(cluster_key, cluster, absorbed_incident_ids)``.
+
+        ``cluster.incident_id`` is ``None`` when the alert started a new cluster
+        that has no incident yet; the caller is expected to ``bind`` one.
+        Incidents of clusters merged into this one are returned as absorbed.
+        """
+        bucket = self.bucket_of(timestamp)
+        rank = SEVERITY_RANK.get(severity, 0)
+        values = [v for v in zip(self.entity_kinds, (user, ip_address, device_id)) if v[1]]
+        own_keys = [(kind, value, bucket) for kind, value in values] or [("alert", next(self._anonymous), bucket)]
+
+        roots = set()
+        for kind, value in values:
+            for neighbour in (bucket - 1, bucket, bucket + 1):
+                key = (kind, value, neighbour)
+                if key in self.sets:
+                    roots.add(self.sets.find(key))
+        states = [self.clusters.pop(r) for r in roots]
+
+        for key in own_keys:
+            if key not in self.sets:
+                self.sets.add(key)
+                self.bucket_keys.setdefault(bucket, []).append(key)
+        root = own_keys[0]
+        for other in list(roots) + own_keys[1:]:
+            root = self.sets.union(root, other)
+        root = self.sets.find(root)
+
+        cluster, absorbed = self._merge(states, timestamp, rank)
+        if incident_id and cluster.incident_id is None:
+            cluster.incident_id = incident_id
+        elif incident_id and incident_id != cluster.incident_id:
+            absorbed.append(incident_id)
+        cluster.alert_count += 1
+        cluster.first_seen = min(cluster.first_seen, timestamp)
+        cluster.last_seen = max(cluster.last_seen, timestamp)
+        cluster.severity_rank = max(cluster.severity_rank, rank)
+        self.clusters[root] = cluster
+
+        if self.newest_bucket is None or bucket > self.newest_bucket:
+            self.newest_bucket = bucket
+            self._evict()
+        return root, cluster, absorbed
+
+    def bind(self, cluster_key: tuple, incident_id: str):
+        self.clusters[self.sets.find(cluster_key)].incident_id = incident_id
+
+    @staticmethod
+    def _merge(states: List[Cluster], timestamp: datetime, rank: int) -> Tuple[Cluster, List[str]]:
+        """Fold cluster states into one; the incident detected first survives"""
+        if not states:
+            return Cluster(timestamp, rank), []
+        bound = sorted((s for s in states if s.incident_id), key=lambda s: s.first_seen)
+        cluster = bound[0] if bound else states[0]
+        absorbed = [s.incident_id for s in bound[1:] if s.incident_id != cluster.incident_id]
+        for other in states:
+            if other is cluster:
+                continue
+            cluster.alert_count += other.alert_count
+            cluster.first_seen = min(cluster.first_seen, other.first_seen)
+            cluster.last_seen = max(cluster.last_seen, other.last_seen)
+            cluster.severity_rank = max(cluster.severity_rank, other.severity_rank)
+        return cluster, absorbed
+
+    def _evict(self):
+        """Drop keys of buckets beyond the retention horizon and re-root survivors"""
+        horizon = self.newest_bucket - self.retention_buckets
+        expired = [b for b in self.bucket_keys if b < horizon]
+        if not expired:
+            return
+        dead = set()
+        for bucket in expired:
+            dead.update(self.bucket_keys.pop(bucket))
+
+        groups: Dict[tuple, List[tuple]] = {}
+        for key in self.sets.parent:
+            if key not in dead:
+                groups.setdefault(self.sets.find(key), []).append(key)
+
+        sets = DisjointSet()
+        clusters = {}
+        for old_root, members in groups.items():
+            new_root = members[0]
+            for key in members:
+                sets.add(key)
+                sets.union(new_root, key)
+            clusters[sets.find(new_root)] = self.clusters[old_root]
+        self.sets = sets
+        self.clusters = clusters
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.sets),
+            "clusters": len(self.clusters),
+            "buckets": len(self.bucket_keys),
+            "window_minutes": self.window_seconds // 60,
+        }
+
+
+correlation_engine = CorrelationEngine()
+_correlation_lock = Lock()
+
+
+def reset_engine(engine: Optional[CorrelationEngine] = None):
+    """Clear the engine between correlation runs"""
+    with _correlation_lock:
+        (engine or correlation_engine).clear()
+
+
+def _warm(db: Session, engine: CorrelationEngine):
+    """Replay already linked alerts inside the retention horizon into the engine"""
+    newest = db.query(Alert.timestamp).order_by(Alert.timestamp.desc()).first()
+    if newest and newest[0]:
+        since = EPOCH + timedelta(
+            seconds=(engine.bucket_of(newest[0]) - engine.retention_buckets) * engine.window_seconds
+        )
+        rows = db.query(
+            Alert.timestamp, Alert.user, Alert.ip_address, Alert.severity, Alert.detection_id,
+            IncidentAlert.incident_id
+        ).join(IncidentAlert, IncidentAlert.alert_id == Alert.id).filter(
+            Alert.timestamp >= since
+        ).order_by(Alert.timestamp.asc(), Alert.id.asc()).all()
+        # Same keys as the live path, so a restarted engine groups alerts the same way
+        for lo in range(0, len(rows), WARM_BATCH_SIZE):
+            batch = rows[lo:lo + WARM_BATCH_SIZE]
+            devices = _device_ids(db, {r.timestamp for r in batch})
+            for ts, user, ip, severity, detection_id, incident_id in batch:
+                engine.add(ts, user, ip, devices.get((user, detection_id, ts)), severity, incident_id)
+    engine.warmed = True
+
+
+def _device_ids(db: Session, timestamps: set) -> dict:
+    """Devices of the triggering events, keyed by ``(user, detection_id, timestamp)``"""
+    return {
+        (user, detection_id, ts): device
+        for user, detection_id, ts, device in db.query(
+            SecurityEvent.user, SecurityEvent.detection_id, SecurityEvent.timestamp, SecurityEvent.device_id
+        ).filter(
+            SecurityEvent.detection_triggered == True,
+            SecurityEvent.timestamp.in_(timestamps)
+        ).all()
+    }
+
+
+def correlate_pending(db: Session, engine: Optional[CorrelationEngine] = None, batch_size: int = 5000) -> dict:
+    """Assign every alert without an incident link to a correlated incident"""
+    engine = engine or correlation_engine
+    started = perf_counter()
+    processed = created = 0
+    merged_into = {}
+
+    with _correlation_lock:
+        if not engine.warmed:
+            _warm(db, engine)
+
+        while True:
+            alerts = db.query(Alert).outerjoin(
+                IncidentAlert, IncidentAlert.alert_id == Alert.id
+            ).filter(IncidentAlert.id.is_(None)).order_by(
+                Alert.timestamp.asc(), Alert.id.asc()
+            ).limit(batch_size).all()
+            if not alerts:
+                break
+
+            alert_ids = [a.id for a in alerts]
+            seeded = dict(db.query(Incident.alert_id, Incident.incident_id).filter(
+                Incident.alert_id.in_(alert_ids)
+            ).all())
+            devices = _device_ids(db, {a.timestamp for a in alerts})
+
+            new_incidents = []
+            links = []
+            touched = {}
+            for alert in alerts:
+                key, cluster, absorbed = engine.add(
+                    alert.timestamp, alert.user, alert.ip_address,
+                    devices.get((alert.user, alert.detection_id, alert.timestamp)),
+                    alert.severity, seeded.get(alert.id)
+                )
+                if cluster.incident_id is None:
+                    incident_id = f"INC-{alert.id:06d}"
+                    engine.bind(key, incident_id)
+                    new_incidents.append(Incident(
+                        incident_id=incident_id,
+                        title=f"{alert.alert_name} - {alert.user}",
+                        description=(
+                            f"Correlated incident for {alert.user}: alerts sharing a user, IP address "
+                            f"or device within {engine.window_seconds // 60} minutes"
+                        ),
+                        severity=alert.severity,
+                        status=IncidentStatus.OPEN,
+                        scenario_type=alert.scenario_type,
+                        user=alert.user,
+                        detection_id=alert.detection_id,
+                        alert_id=alert.id,
+                        detected_at=alert.timestamp,
+                        mttd_minutes=_minutes_between(alert.first_event_at or alert.timestamp, alert.timestamp),
+                    ))
+                for incident_id in absorbed:
+                    merged_into[incident_id] = cluster.incident_id
+                touched[cluster.incident_id] = cluster
+                links.append({
+                    "incident_id": cluster.incident_id,
+                    "alert_id": alert.id,
+                    "linked_at": datetime.utcnow(),
+                })
+
+            db.add_all(new_incidents)
+            db.flush()
+            db.execute(IncidentAlert.__table__.insert(), links)
+            _apply_merges(db, merged_into, touched)
+            db.commit()
+            processed += len(alerts)
+            created += len(new_incidents)
+
+    return {
+        "processed_alerts": processed,
+        "incidents_created": created,
+        "incidents_merged": len(merged_into),
+        "elapsed_ms": round((perf_counter() - started) * 1000, 2),
+        "engine": engine.stats(),
+    }
+
+
+def _minutes_between(start: datetime, end: datetime) -> float:
+    return max((end - start).total_seconds() / 60, 0.0)
+
+
+def _apply_merges(db: Session, merged_into: dict, touched: dict):
+    """Move links of absorbed incidents to their survivors, raise severities and recompute survivors' MTTD"""
+    for absorbed_id in list(merged_into):
+        survivor, seen = merged_into[absorbed_id], {absorbed_id}
+        while survivor in merged_into and survivor not in seen:
+            seen.add(survivor)
+            survivor = merged_into[survivor]
+        merged_into[absorbed_id] = survivor
+
+    if merged_into:
+        for incident in db.query(Incident).filter(Incident.incident_id.in_(list(merged_into))).all():
+            survivor = merged_into[incident.incident_id]
+            db.query(IncidentAlert).filter(IncidentAlert.incident_id == incident.incident_id).update(
+                {IncidentAlert.incident_id: survivor}, synchronize_session=False
+            )
+            if incident.merged_into is None:
+                incident.description = f"{incident.description} (merged into {survivor})"
+            incident.merged_into = survivor
+
+    levels = {rank: level for level, rank in SEVERITY_RANK.items()}
+    live = [i for i in touched if i not in merged_into]
+    survivors = set(merged_into.values())
+    earliest = dict(db.query(
+        IncidentAlert.incident_id, func.min(func.coalesce(Alert.first_event_at, Alert.timestamp))
+    ).join(Alert, Alert.id == IncidentAlert.alert_id).filter(
+        IncidentAlert.incident_id.in_(survivors)
+    ).group_by(IncidentAlert.incident_id).all()) if survivors else {}
+    for incident in db.query(Incident).filter(Incident.incident_id.in_(live)).all():
+        cluster = touched[incident.incident_id]
+        if SEVERITY_RANK.get(incident.severity, 0) < cluster.severity_rank:
+            incident.severity = levels[cluster.severity_rank]
+        first = earliest.get(incident.incident_id)
+        if first is not None and incident.detected_at:
+            if isinstance(first, str):
+                first = datetime.fromisoformat(first)
+            mttd = _minutes_between(first, incident.detected_at)
+            if incident.mttd_minutes is None or mttd > incident.mttd_minutes:
+                incident.mttd_minutes = mttd
@@ -0,0 +1,212 @@
+"""
+Materialized per-detection alert statistics
+
+Counters are maintained from a session ``after_flush`` hook: every flush that
+inserts alerts upserts the per-detection totals and hourly buckets in the same
+transaction, and flushed events that triggered a detection are kept as recent
+examples. Reading stats for every rule therefore costs one small query per
+table, independent of the size of ``alerts``.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+import json
+
+from sqlalchemy import event, func
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import Alert, SecurityEvent, Detection, DetectionStats, DetectionAlertBucket
+
+EXAMPLE_EVENT_LIMIT = 5
+BUCKET_RETENTION = timedelta(days=8)
+
+_last_prune_hour = None
+
+
+def _hour(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(connection, table, index_elements, values, increments, latest=()):
+    """Insert rows or add ``increments`` (and keep the max of ``latest``) on conflict"""
+    dialect = connection.dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(table)
+    updates = {name: getattr(table.c, name) + getattr(statement.excluded, name) for name in increments}
+    for name in latest:
+        column = getattr(table.c, name)
+        updates[name] = func.coalesce(
+            func.max(column, getattr(statement.excluded, name)) if dialect == "sqlite"
+            else func.greatest(column, getattr(statement.excluded, name)),
+            getattr(statement.excluded, name)
+        )
+    connection.execute(statement.on_conflict_do_update(index_elements=index_elements, set_=updates), values)
+
+
+def record_alerts(connection, alerts: List[Alert]):
+    """Add alerts to the per-detection counters and hourly buckets"""
+    totals: Dict[str, list] = {}
+    buckets = defaultdict(int)
+    for alert in alerts:
+        if not alert.detection_id:
+            continue
+        ts = alert.timestamp or datetime.utcnow()
+        total = totals.setdefault(alert.detection_id, [0, ts])
+        total[0] += 1
+        total[1] = max(total[1], ts)
+        buckets[(alert.detection_id, _hour(ts))] += 1
+    if not totals:
+        return
+
+    now = datetime.utcnow()
+    _upsert(
+        connection, DetectionStats.__table__, ["detection_id"],
+        [
+            {"detection_id": d, "alert_count": n, "last_fired_at": last, "example_event_ids": "[]", "updated_at": now}
+            for d, (n, last) in totals.items()
+        ],
+        increments=("alert_count",), latest=("last_fired_at", "updated_at"),
+    )
+    _upsert(
+        connection, DetectionAlertBucket.__table__, ["detection_id", "hour"],
+        [{"detection_id": d, "hour": h, "alert_count": n} for (d, h), n in buckets.items()],
+        increments=("alert_count",),
+    )
+    _prune(connection, now)
+
+
+def record_examples(connection, events: List[SecurityEvent]):
+    """Keep the most recent triggering event ids per detection"""
+    by_detection = defaultdict(list)
+    for e in events:
+        by_detection[e.detection_id].append(e.id)
+
+    table = DetectionStats.__table__
+    current = dict(connection.execute(
+        table.select().with_only_columns(table.c.detection_id, table.c.example_event_ids).where(
+            table.c.detection_id.in_(list(by_detection))
+        )
+    ).all())
+    now = datetime.utcnow()
+    for detection_id, ids in by_detection.items():
+        if detection_id in current:
+            examples = (json.loads(current[detection_id] or "[]") + ids)[-EXAMPLE_EVENT_LIMIT:]
+            connection.execute(
+                table.update().where(table.c.detection_id == detection_id).values(
+                    example_event_ids=json.dumps(examples), updated_at=now
+                )
+            )
+        else:
+            connection.execute(table.insert().values(
+                detection_id=detection_id, alert_count=0,
+                example_event_ids=json.dumps(ids[-EXAMPLE_EVENT_LIMIT:]), updated_at=now
+            ))
+
+
+def _prune(connection, now: datetime):
+    global _last_prune_hour
+    hour = _hour(now)
+    if _last_prune_hour == hour:
+        return
+    _last_prune_hour = hour
+    table = DetectionAlertBucket.__table__
+    connection.execute(table.delete().where(table.c.hour < hour - BUCKET_RETENTION))
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_counters(session, flush_context):
+    alerts = []
+    events = []
+    for obj in session.new:
+        if isinstance(obj, Alert):
+            alerts.append(obj)
+        elif isinstance(obj, SecurityEvent) and obj.detection_triggered and obj.detection_id:
+            events.append(obj)
+    if not alerts and not events:
+        return
+    connection = session.connection()
+    if events:
+        events.sort(key=lambda e: e.id)
+        record_examples(connection, events)
+    if alerts:
+        record_alerts(connection, alerts)
+
+
+def rebuild_detection_stats(db: Session) -> int:
+    """Recompute all counters from the alerts and events tables (backfill after bulk loads)"""
+    db.query(DetectionStats).delete()
+    db.query(DetectionAlertBucket).delete()
+    now = datetime.utcnow()
+
+    totals = db.query(
+        Alert.detection_id, func.count(Alert.id), func.max(Alert.timestamp)
+    ).filter(Alert.detection_id.isnot(None)).group_by(Alert.detection_id).all()
+    stats = {
+        d: DetectionStats(detection_id=d, alert_count=n, last_fired_at=last, example_event_ids="[]", updated_at=now)
+        for d, n, last in totals
+    }
+    # Truncated in SQL; postgres returns timestamps, SQLite strings
+    hour = func.date_trunc("hour", Alert.timestamp) if db.get_bind().dialect.name == "postgresql" \
+        else func.strftime("%Y-%m-%d %H:00:00", Alert.timestamp)
+    buckets = db.query(Alert.detection_id, hour, func.count(Alert.id)).filter(
+        Alert.detection_id.isnot(None),
+        Alert.timestamp >= _hour(now) - BUCKET_RETENTION
+    ).group_by(Alert.detection_id, hour).all()
+
+    # Only the newest few per detection leave the database
+    rank = func.row_number().over(partition_by=SecurityEvent.detection_id, order_by=SecurityEvent.id.desc())
+    ranked = db.query(SecurityEvent.detection_id, SecurityEvent.id, rank.label("rank")).filter(
+        SecurityEvent.detection_triggered == True,
+        SecurityEvent.detection_id.isnot(None)
+    ).subquery()
+    examples = db.query(ranked.c.detection_id, ranked.c.id).filter(ranked.c.rank <= EXAMPLE_EVENT_LIMIT).all()
+    recent = defaultdict(list)
+    for detection_id, event_id in examples:
+        recent[detection_id].append(event_id)
+    for detection_id, ids in recent.items():
+        stats.setdefault(detection_id, DetectionStats(detection_id=detection_id, alert_count=0, updated_at=now))
+        stats[detection_id].example_event_ids = json.dumps(sorted(ids))
+
+    db.add_all(stats.values())
+    if buckets:
+        db.execute(DetectionAlertBucket.__table__.insert(), [
+            {"detection_id": d, "hour": h if isinstance(h, datetime) else datetime.fromisoformat(h), "alert_count": n}
+            for d, h, n in buckets
+        ])
+    db.commit()
+    return len(stats)
+
+
+def get_all_detection_stats(db: Session) -> List[dict]:
+    """Stats for every detection rule from the materialized counters"""
+    now = datetime.utcnow()
+    day_ago = now - timedelta(hours=24)
+    week_ago = now - timedelta(days=7)
+    stats = {s.detection_id: s for s in db.query(DetectionStats).all()}
+    rates = {
+        d: (int(n_24h or 0), int(n_7d or 0))
+        for d, n_24h, n_7d in db.query(
+            DetectionAlertBucket.detection_id,
+            func.sum(DetectionAlertBucket.alert_count).filter(DetectionAlertBucket.hour >= _hour(day_ago)),
+            func.sum(DetectionAlertBucket.alert_count),
+        ).filter(DetectionAlertBucket.hour >= _hour(week_ago)).group_by(DetectionAlertBucket.detection_id).all()
+    }
+
+    detection_ids = [d for (d,) in db.query(Detection.detection_id).order_by(Detection.detection_id).all()]
+    detection_ids += sorted(set(stats) - set(detection_ids))
+    result = []
+    for detection_id in detection_ids:
+        s = stats.get(detection_id)
+        alerts_24h, alerts_7d = rates.get(detection_id, (0, 0))
+        result.append({
+            "detection_id": detection_id,
+            "alert_count": s.alert_count if s else 0,
+            "last_fired_at": s.last_fired_at.isoformat() if s and s.last_fired_at else None,
+            "alerts_24h": alerts_24h,
+            "alerts_7d": alerts_7d,
+            "rate_24h_per_hour": round(alerts_24h / 24, 3),
+            "rate_7d_per_day": round(alerts_7d / 7, 3),
+            "example_event_ids": json.loads(s.example_event_ids or "[]") if s else [],
+        })
+    return result
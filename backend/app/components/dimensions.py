@@ -0,0 +1,283 @@
+"""
+Dictionary-encoded event dimensions
+
+With ``DIMENSION_ENCODING`` enabled, the low-cardinality text columns of
+``security_events`` (countries, cities, apps, roles, MITRE labels, scenario
+types) store small integer ids into one ``dim_<column>`` table per column
+instead of repeating the string on every row. SQLite stores ids below 128 in
+a single byte, so rows, their indexes and ``GROUP BY`` keys shrink to a
+fraction of their text size.
+
+Encoding is transparent to the code above the models: the columns keep their
+names and the ``Dimension`` column type translates strings to ids when
+binding parameters and ids back to strings when reading results, so ORM
+objects, filters, groupings and API output see the original values. The
+translation runs against a bidirectional in-memory cache of every dimension
+table, loaded on first use.
+
+New values are interned on the write path inside the writing transaction:
+a session hook interns the values of new and modified objects of encoded
+models (``__dimension_columns__``) before each flush, and Core bulk writers
+call ``intern_rows``. Ids interned by an open transaction stay private to it
+until commit and are forgotten on rollback (including rollback to a
+savepoint), so the cache never hands out an id whose row was rolled back.
+Values interned by other processes are picked up on a cache miss (for
+unknown strings at most once per ``DIMENSION_RELOAD_SECONDS``, so filters on
+values that do not exist cannot turn every request into a reload). A filter
+on a value that was never interned binds an id no row has, which matches
+nothing, as the string would.
+"""
+from threading import Lock, local
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+
+from sqlalchemy import Column, Integer, String, Table, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+
+logger = logging.getLogger(__name__)
+
+DIMENSION_RELOAD_SECONDS = float(os.getenv("DIMENSION_RELOAD_SECONDS", "1"))
+
+# Encoded columns of security_events and the length of their text values
+DIMENSIONS = {
+    "geo_country": 100,
+    "geo_city": 100,
+    "device_compliance": 50,
+    "app_name": 200,
+    "oauth_app_name": 200,
+    "role_name": 100,
+    "mitre_tactic": 100,
+    "mitre_technique": 100,
+    "scenario_type": 100,
+}
+
+# Bound for values that were never interned: no row references it
+NO_MATCH = -1
+
+
+def dimension_table(metadata, name: str) -> Table:
+    return Table(
+        f"dim_{name}", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("value", String(DIMENSIONS[name]), nullable=False, unique=True),
+    )
+
+
+class PendingInterns:
+    """Values interned by the open transaction of one connection, in interning order"""
+    __slots__ = ("entries", "ids", "values", "savepoints")
+
+    def __init__(self):
+        self.entries: List[tuple] = []
+        self.ids: Dict[tuple, int] = {}
+        self.values: Dict[tuple, str] = {}
+        self.savepoints: List[int] = []
+
+    def add(self, dimension: str, value: str, dimension_id: int):
+        self.entries.append((dimension, value, dimension_id))
+        self.ids[(dimension, value)] = dimension_id
+        self.values[(dimension, dimension_id)] = value
+
+    def truncate(self, length: int):
+        for dimension, value, dimension_id in self.entries[length:]:
+            self.ids.pop((dimension, value), None)
+            self.values.pop((dimension, dimension_id), None)
+        del self.entries[length:]
+
+    def clear(self):
+        self.truncate(0)
+        self.savepoints.clear()
+
+
+class DimensionCache:
+    """Committed value <-> id maps of every dimension table"""
+
+    def __init__(self):
+        self.tables: Dict[str, Table] = {}
+        self.engine: Optional[Engine] = None
+        self.ids: Dict[str, Dict[str, int]] = {name: {} for name in DIMENSIONS}
+        self.values: Dict[str, Dict[int, str]] = {name: {} for name in DIMENSIONS}
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.counters = {"interned": 0, "reloads": 0, "unknown_ids": 0}
+        self._lock = Lock()
+        self._local = local()
+
+    def configure(self, tables: Dict[str, Table], engine: Engine):
+        self.tables = tables
+        self.engine = engine
+
+    def load(self, connection=None):
+        """(Re)read every dimension table"""
+        if connection is None:
+            with self.engine.connect() as connection:
+                return self.load(connection)
+        ids = {}
+        for name, table in self.tables.items():
+            ids[name] = dict(connection.execute(select(table.c.value, table.c.id)).all())
+        with self._lock:
+            self.ids = ids
+            self.values = {name: {i: v for v, i in mapping.items()} for name, mapping in ids.items()}
+            self.loaded = True
+            self.loaded_at = monotonic()
+
+    def _pending(self) -> Optional[PendingInterns]:
+        pending = getattr(self._local, "pending", None)
+        return pending if pending is not None and pending.entries else None
+
+    def lookup_id(self, dimension: str, value: str) -> Optional[int]:
+        if not self.loaded:
+            self.load()
+        dimension_id = self.ids[dimension].get(value)
+        if dimension_id is not None:
+            return dimension_id
+        pending = self._pending()
+        if pending is not None and (dimension, value) in pending.ids:
+            return pending.ids[(dimension, value)]
+        if monotonic() - self.loaded_at >= DIMENSION_RELOAD_SECONDS:
+            self.counters["reloads"] += 1
+            self.load()
+            dimension_id = self.ids[dimension].get(value)
+        return dimension_id
+
+    def lookup_value(self, dimension: str, dimension_id: int) -> Optional[str]:
+        if not self.loaded:
+            self.load()
+        value = self.values[dimension].get(dimension_id)
+        if value is not None:
+            return value
+        pending = self._pending()
+        if pending is not None and (dimension, dimension_id) in pending.values:
+            return pending.values[(dimension, dimension_id)]
+        # Interned by another process since the last load
+        self.counters["reloads"] += 1
+        self.load()
+        value = self.values[dimension].get(dimension_id)
+        if value is None:
+            self.counters["unknown_ids"] += 1
+            logger.warning("Unknown %s id %s", dimension, dimension_id)
+        return value
+
+    def intern(self, connection, dimension: str, value: str) -> int:
+        """Id of ``value``, inserting it into the dimension table within ``connection``'s transaction"""
+        dimension_id = self.lookup_id(dimension, value)
+        if dimension_id is not None:
+            return dimension_id
+        table = self.tables[dimension]
+        insert = table.insert().values(value=value)
+        if connection.dialect.name == "sqlite":
+            insert = insert.prefix_with("OR IGNORE")
+        elif connection.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as pg_insert
+            insert = pg_insert(table).values(value=value).on_conflict_do_nothing()
+        connection.execute(insert)
+        dimension_id = connection.execute(select(table.c.id).where(table.c.value == value)).scalar_one()
+        pending = connection.info.get("dimension_pending")
+        if pending is None:
+            pending = connection.info["dimension_pending"] = PendingInterns()
+        pending.add(dimension, value, dimension_id)
+        self._local.pending = pending
+        self.counters["interned"] += 1
+        return dimension_id
+
+    def intern_rows(self, connection, rows: Iterable[dict]):
+        """Replace dimension strings in Core insert rows by their ids, in place"""
+        for row in rows:
+            for name in DIMENSIONS:
+                value = row.get(name)
+                if isinstance(value, str):
+                    row[name] = self.intern(connection, name, value)
+
+    def commit(self, pending: PendingInterns):
+        with self._lock:
+            for dimension, value, dimension_id in pending.entries:
+                self.ids[dimension][value] = dimension_id
+                self.values[dimension][dimension_id] = value
+        pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self.tables),
+            "loaded": self.loaded,
+            "dimensions": {name: len(mapping) for name, mapping in self.ids.items()},
+            **self.counters,
+        }
+
+
+dimension_cache = DimensionCache()
+
+
+class Dimension(TypeDecorator):
+    """Integer id column that reads and binds as the interned string"""
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        dimension_id = dimension_cache.lookup_id(self.name, value)
+        return NO_MATCH if dimension_id is None else dimension_id
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        text = dimension_cache.values[self.name].get(value)
+        return text if text is not None else dimension_cache.lookup_value(self.name, value)
+
+
+@event.listens_for(Session, "before_flush")
+def _intern_pending_objects(session, flush_context, instances):
+    """Intern the dimension values of new and modified objects of encoded models"""
+    connection = None
+    for obj in list(session.new) + list(session.dirty):
+        for name in getattr(type(obj), "__dimension_columns__", ()):
+            value = getattr(obj, name)
+            if isinstance(value, str) and dimension_cache.lookup_id(name, value) is None:
+                connection = connection or session.connection()
+                dimension_cache.intern(connection, name, value)
+
+
+# Private ids follow the transaction that interned them
+
+@event.listens_for(Engine, "commit")
+def _commit(conn):
+    pending = conn.info.get("dimension_pending")
+    if pending is not None and pending.entries:
+        dimension_cache.commit(pending)
+
+
+@event.listens_for(Engine, "rollback")
+def _rollback(conn):
+    pending = conn.info.get("dimension_pending")
+    if pending is not None:
+        pending.clear()
+
+
+@event.listens_for(Engine, "savepoint")
+def _savepoint(conn, name):
+    pending = conn.info.get("dimension_pending")
+    if pending is None:
+        pending = conn.info["dimension_pending"] = PendingInterns()
+    pending.savepoints.append(len(pending.entries))
+
+
+@event.listens_for(Engine, "rollback_savepoint")
+def _rollback_savepoint(conn, name, context):
+    pending = conn.info.get("dimension_pending")
+    if pending is not None and pending.savepoints:
+        pending.truncate(pending.savepoints.pop())
+
+
+@event.listens_for(Engine, "release_savepoint")
+def _release_savepoint(conn, name, context):
+    pending = conn.info.get("dimension_pending")
+    if pending is not None and pending.savepoints:
+        pending.savepoints.pop()
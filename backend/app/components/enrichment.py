@@ -0,0 +1,187 @@
+"""
+Local IP enrichment
+
+Resolves addresses against a local IP-range database (CSV with one
+``start_ip,end_ip,country,city,asn,as_org,hosting,anonymizer`` row per range).
+Ranges are loaded into sorted start/end integer arrays per address family and
+looked up with ``bisect``; a bounded LRU cache in front of the index absorbs hot
+addresses. IPv4 strings are parsed with ``inet_pton`` rather than ``ipaddress``,
+which is several times faster on the hot path.
+"""
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from socket import inet_pton, AF_INET
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import csv
+import ipaddress
+import os
+
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent, IpIntel
+
+IP_RANGES_PATH = os.getenv(
+    "IP_RANGES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "ip_ranges.csv")
+)
+IP_CACHE_SIZE = int(os.getenv("IP_CACHE_SIZE", "65536"))
+
+FIELDS = ("country", "city", "asn", "as_org", "hosting", "anonymizer")
+
+
+def _parse(ip: str) -> Tuple[int, int]:
+    """Address family (4 or 6) and integer value of an address"""
+    try:
+        return 4, int.from_bytes(inet_pton(AF_INET, ip), "big")
+    except OSError:
+        address = ipaddress.ip_address(ip)
+        return address.version, int(address)
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+class RangeIndex:
+    """Sorted, non-overlapping ranges of one address family"""
+
+    def __init__(self, typecode: str):
+        self.typecode = typecode
+        self.starts = array(typecode) if typecode else []
+        self.ends = array(typecode) if typecode else []
+        self.records: List[int] = []
+
+    def find(self, value: int) -> Optional[int]:
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.records[i]
+        return None
+
+
+class IpEnricher:
+    """Range database with an LRU cache in front of it"""
+
+    def __init__(self, path: Optional[str] = IP_RANGES_PATH, cache_size: int = IP_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = Lock()
+        self.load(path)
+
+    def load(self, path: Optional[str] = None):
+        """(Re)load the range file; a missing file leaves an empty index"""
+        path = path or self.path
+        started = perf_counter()
+        ranges = {4: [], 6: []}
+        records: List[dict] = []
+        record_ids: Dict[tuple, int] = {}
+        if path and os.path.exists(path):
+            with open(path, newline="") as handle:
+                rows = csv.reader(line for line in handle if line.strip() and not line.startswith("#"))
+                for row in rows:
+                    row += [""] * (8 - len(row))
+                    start_ip, end_ip, country, city, asn, as_org, hosting, anonymizer = [c.strip() for c in row[:8]]
+                    version, start = _parse(start_ip)
+                    end_version, end = _parse(end_ip)
+                    if version != end_version or end < start:
+                        raise ValueError(f"Invalid IP range {start_ip}-{end_ip}")
+                    record = (country or None, city or None, int(asn) if asn else None, as_org or None,
+                              _flag(hosting), _flag(anonymizer))
+                    if record not in record_ids:
+                        record_ids[record] = len(records)
+                        records.append(dict(zip(FIELDS, record)))
+                    ranges[version].append((start, end, record_ids[record]))
+
+        # Unsigned 64-bit arrays hold IPv4 compactly; IPv6 needs arbitrary-precision ints
+        indexes = {4: RangeIndex("Q"), 6: RangeIndex("")}
+        for version, rows in ranges.items():
+            rows.sort()
+            index = indexes[version]
+            previous_end = -1
+            for start, end, record in rows:
+                if start <= previous_end:
+                    raise ValueError(f"Overlapping IP ranges at {ipaddress.ip_address(start)}")
+                index.starts.append(start)
+                index.ends.append(end)
+                index.records.append(record)
+                previous_end = end
+
+        with self._lock:
+            self.path = path
+            self.indexes = indexes
+            self.records = records
+            self.lookup = lru_cache(maxsize=self.cache_size)(self._resolve)
+            self.loaded_at = datetime.utcnow()
+            self.load_ms = round((perf_counter() - started) * 1000, 2)
+
+    def _resolve(self, ip: str) -> Optional[dict]:
+        try:
+            version, value = _parse(ip)
+        except ValueError:
+            return None
+        record = self.indexes[version].find(value)
+        return self.records[record] if record is not None else None
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """Resolve a batch, each distinct address once"""
+        lookup = self.lookup
+        return {ip: lookup(ip) for ip in set(ips) if ip}
+
+    def stats(self) -> dict:
+        cache = self.lookup.cache_info()
+        requests = cache.hits + cache.misses
+        return {
+            "path": self.path,
+            "ranges_ipv4": len(self.indexes[4].starts),
+            "ranges_ipv6": len(self.indexes[6].starts),
+            "distinct_records": len(self.records),
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_ms": self.load_ms,
+            "cache_size": cache.currsize,
+            "cache_max": cache.maxsize,
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses,
+            "cache_hit_rate": round(cache.hits / requests, 4) if requests else 0,
+        }
+
+
+ip_enricher = IpEnricher()
+
+
+def enrich_events(db: Session, events: List[SecurityEvent]) -> int:
+    """Fill missing geo fields from the range database and record IP intelligence
+
+    Payload-supplied ``geo_country``/``geo_city`` are kept as given. Returns the
+    number of distinct addresses resolved.
+    """
+    resolved = ip_enricher.lookup_many(e.ip_address for e in events)
+    for event in events:
+        intel = resolved.get(event.ip_address)
+        if intel is None:
+            continue
+        if not event.geo_country:
+            event.geo_country = intel["country"]
+            if not event.geo_city:
+                event.geo_city = intel["city"]
+    found = {ip: intel for ip, intel in resolved.items() if intel is not None}
+    if found:
+        _upsert_intel(db, found)
+    return len(found)
+
+
+def _upsert_intel(db: Session, found: Dict[str, dict]):
+    table = IpIntel.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = insert(table)
+    now = datetime.utcnow()
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["ip_address"],
+            set_={name: getattr(statement.excluded, name) for name in FIELDS + ("updated_at",)},
+        ),
+        [{"ip_address": ip, **intel, "updated_at": now} for ip, intel in found.items()],
+    )
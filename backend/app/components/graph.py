@@ -0,0 +1,272 @@
+"""
+Entity relationship graph index
+
+An incrementally maintained adjacency index over users, IP addresses, devices,
+OAuth applications and countries. Entities are interned to integer node ids;
+each node keeps a dict of neighbours mapping to ``[edge_count, last_seen]``
+(epoch seconds), so pivots such as "which users share this device" are a dict
+lookup plus a top-k selection instead of a table scan.
+
+Events ingested by this process are indexed as they commit. Events committed
+by other worker processes are picked up by an indexed ``id >`` probe at most
+every ``GRAPH_SYNC_SECONDS`` when the graph is used (0 disables it for
+single-process deployments). Each sync first checks that the events already
+read are unchanged: the lowest id and the timestamp of the watermark row on
+every sync, and the row count under the watermark every
+``GRAPH_VERIFY_SECONDS``. When they differ (rows deleted, or tables cleared
+and ids reused) the graph is rebuilt instead.
+"""
+from datetime import datetime, timedelta
+from heapq import nlargest
+from threading import RLock
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Set, Tuple
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent
+
+EPOCH = datetime(1970, 1, 1)
+
+GRAPH_SYNC_SECONDS = float(os.getenv("GRAPH_SYNC_SECONDS", "5"))
+GRAPH_SYNC_BATCH = 10000
+GRAPH_VERIFY_SECONDS = float(os.getenv("GRAPH_VERIFY_SECONDS", "60"))
+
+NODE_KINDS = ("user", "ip", "device", "oauth_app", "country")
+
+# Pairs of entity kinds linked by every event carrying both
+EDGE_TYPES = (
+    ("user", "ip"),
+    ("user", "device"),
+    ("user", "oauth_app"),
+    ("user", "country"),
+    ("ip", "country"),
+    ("ip", "device"),
+)
+
+EVENT_COLUMNS = (
+    SecurityEvent.user,
+    SecurityEvent.ip_address,
+    SecurityEvent.device_id,
+    SecurityEvent.oauth_app_name,
+    SecurityEvent.geo_country,
+)
+
+
+class EntityGraph:
+    """Adjacency index with edge counts and last-seen times"""
+
+    def __init__(self, sync_seconds: float = GRAPH_SYNC_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.lock = RLock()
+        self.rebuilds = 0
+        self.clear()
+
+    def clear(self):
+        self.node_ids: Dict[Tuple[str, str], int] = {}
+        self.nodes: List[Tuple[str, str]] = []
+        self.adjacency: List[Dict[int, list]] = []
+        self.edge_count = 0
+        self.events_indexed = 0
+        self.built = False
+        # Highest event id read from SQL, and ids indexed from this process above it
+        self.watermark = 0
+        self.fed_ids: Set[int] = set()
+        # What the events read from SQL looked like: lowest id, watermark row timestamp, row count
+        self.first_id: Optional[int] = None
+        self.anchor: Optional[datetime] = None
+        self.rows_read = 0
+        self._last_sync = self._last_verify = monotonic()
+
+    def _node(self, kind: str, value: str) -> int:
+        key = (kind, value)
+        node = self.node_ids.get(key)
+        if node is None:
+            node = len(self.nodes)
+            self.node_ids[key] = node
+            self.nodes.append(key)
+            self.adjacency.append({})
+        return node
+
+    def _link(self, a: int, b: int, ts: int):
+        edge = self.adjacency[a].get(b)
+        if edge is None:
+            self.adjacency[a][b] = [1, ts]
+            self.adjacency[b][a] = [1, ts]
+            self.edge_count += 1
+            return
+        other = self.adjacency[b][a]
+        edge[0] += 1
+        other[0] += 1
+        if ts > edge[1]:
+            edge[1] = other[1] = ts
+
+    def add(self, timestamp: Optional[datetime], user=None, ip_address=None, device_id=None,
+            oauth_app_name=None, geo_country=None):
+        """Index the entities of one event; O(number of edge types)"""
+        values = dict(zip(NODE_KINDS, (user, ip_address, device_id, oauth_app_name, geo_country)))
+        ts = int((timestamp - EPOCH).total_seconds()) if timestamp else 0
+        nodes = {kind: self._node(kind, value) for kind, value in values.items() if value}
+        for a, b in EDGE_TYPES:
+            if a in nodes and b in nodes:
+                self._link(nodes[a], nodes[b], ts)
+        self.events_indexed += 1
+
+    def add_event(self, event: SecurityEvent):
+        """Index an event committed by this process, unless a build or sync already read it"""
+        if event.id is not None:
+            if event.id <= self.watermark:
+                return
+            if self.sync_seconds > 0:
+                self.fed_ids.add(event.id)
+        self.add(event.timestamp, event.user, event.ip_address, event.device_id,
+                 event.oauth_app_name, event.geo_country)
+
+    def _stale(self, db: Session) -> bool:
+        """Whether events under the watermark were deleted or replaced since they were read"""
+        if not self.watermark:
+            return False
+        first = db.query(func.min(SecurityEvent.id)).scalar()
+        anchor = db.query(SecurityEvent.timestamp).filter(SecurityEvent.id == self.watermark).first()
+        if first != self.first_id or anchor is None or anchor[0] != self.anchor:
+            return True
+        if monotonic() - self._last_verify < GRAPH_VERIFY_SECONDS:
+            return False
+        self._last_verify = monotonic()
+        count = db.query(func.count(SecurityEvent.id)).filter(SecurityEvent.id <= self.watermark).scalar()
+        return count != self.rows_read
+
+    def sync(self, db: Session, batch_size: int = GRAPH_SYNC_BATCH) -> int:
+        """Index events committed by other processes since the watermark; returns how many
+
+        Rebuilds the graph instead when the events already read have changed.
+        """
+        synced = 0
+        with self.lock:
+            if self._stale(db):
+                build_graph(db, self)
+                self.rebuilds += 1
+                return self.events_indexed
+            while True:
+                rows = db.query(SecurityEvent.id, SecurityEvent.timestamp, *EVENT_COLUMNS).filter(
+                    SecurityEvent.id > self.watermark
+                ).order_by(SecurityEvent.id).limit(batch_size).all()
+                for row_id, ts, user, ip, device, oauth_app, country in rows:
+                    if row_id not in self.fed_ids:
+                        self.add(ts, user, ip, device, oauth_app, country)
+                        synced += 1
+                if rows:
+                    if self.first_id is None:
+                        self.first_id = rows[0][0]
+                    self.watermark, self.anchor = rows[-1][0], rows[-1][1]
+                    self.rows_read += len(rows)
+                    self.fed_ids = {i for i in self.fed_ids if i > self.watermark}
+                if len(rows) < batch_size:
+                    break
+            self._last_sync = monotonic()
+        return synced
+
+    def _top(self, node: int, limit: int, kinds: Optional[set], exclude: set, order: str):
+        key = (lambda item: item[1][1]) if order == "last_seen" else (lambda item: (item[1][0], item[1][1]))
+        candidates = (
+            item for item in self.adjacency[node].items()
+            if item[0] not in exclude and (kinds is None or self.nodes[item[0]][0] in kinds)
+        )
+        return nlargest(limit, candidates, key=key)
+
+    def _describe(self, node: int, edge: list, via: Optional[int] = None) -> dict:
+        kind, value = self.nodes[node]
+        item = {
+            "kind": kind,
+            "value": value,
+            "edge_count": edge[0],
+            "last_seen": (EPOCH + timedelta(seconds=edge[1])).isoformat() if edge[1] else None,
+            "degree": len(self.adjacency[node]),
+        }
+        if via is not None:
+            item["via"] = {"kind": self.nodes[via][0], "value": self.nodes[via][1]}
+        return item
+
+    def neighbors(self, kind: str, value: str, hops: int = 1, limit: int = 25,
+                  kinds: Optional[List[str]] = None, order: str = "count") -> Optional[dict]:
+        """1- or 2-hop expansion with at most ``limit`` neighbours taken per expanded node"""
+        origin = self.node_ids.get((kind, value))
+        if origin is None:
+            return None
+        wanted = set(kinds) if kinds else None
+        # The first hop is not filtered by kind when expanding two hops, so user -> ip -> user works
+        first = self._top(origin, limit, wanted if hops == 1 else None, {origin}, order)
+        result = {
+            "node": {"kind": kind, "value": value, "degree": len(self.adjacency[origin])},
+            "hop1": [self._describe(n, edge) for n, edge in first if wanted is None or self.nodes[n][0] in wanted],
+        }
+        if hops >= 2:
+            seen = {origin} | {n for n, _ in first}
+            second = []
+            for via, _ in first:
+                for n, edge in self._top(via, limit, wanted, seen, order):
+                    seen.add(n)
+                    second.append(self._describe(n, edge, via))
+            result["hop2"] = second
+        return result
+
+    def stats(self) -> dict:
+        by_kind = {}
+        for kind, _ in self.nodes:
+            by_kind[kind] = by_kind.get(kind, 0) + 1
+        return {
+            "built": self.built,
+            "nodes": len(self.nodes),
+            "nodes_by_kind": by_kind,
+            "edges": self.edge_count,
+            "events_indexed": self.events_indexed,
+            "watermark": self.watermark,
+            "sync_seconds": self.sync_seconds,
+            "rebuilds": self.rebuilds,
+        }
+
+
+entity_graph = EntityGraph()
+
+
+def build_graph(db: Session, graph: Optional[EntityGraph] = None, batch_size: int = 10000) -> dict:
+    """Populate the graph from stored events"""
+    graph = graph or entity_graph
+    started = perf_counter()
+    with graph.lock:
+        graph.clear()
+        # Take the watermark first: events committed meanwhile arrive through ingest or the next sync
+        graph.watermark = db.query(func.max(SecurityEvent.id)).scalar() or 0
+        if graph.watermark:
+            graph.first_id = db.query(func.min(SecurityEvent.id)).scalar()
+            graph.anchor = db.query(SecurityEvent.timestamp).filter(SecurityEvent.id == graph.watermark).scalar()
+        rows = db.query(SecurityEvent.timestamp, *EVENT_COLUMNS).filter(
+            SecurityEvent.id <= graph.watermark
+        ).yield_per(batch_size)
+        for ts, user, ip, device, oauth_app, country in rows:
+            graph.add(ts, user, ip, device, oauth_app, country)
+            graph.rows_read += 1
+        graph.built = True
+    return {**graph.stats(), "build_ms": round((perf_counter() - started) * 1000, 2)}
+
+
+def ensure_graph(db: Session) -> EntityGraph:
+    """Build the shared graph on first use, then keep up with other processes' writes"""
+    if not entity_graph.built:
+        with entity_graph.lock:
+            if not entity_graph.built:
+                build_graph(db)
+    elif entity_graph.sync_seconds > 0 and monotonic() - entity_graph._last_sync >= entity_graph.sync_seconds:
+        entity_graph.sync(db)
+    return entity_graph
+
+
+def index_events(events: List[SecurityEvent]):
+    """Add freshly ingested events; skipped until the graph has been built from the database"""
+    if not entity_graph.built:
+        return
+    with entity_graph.lock:
+        for event in events:
+            entity_graph.add_event(event)
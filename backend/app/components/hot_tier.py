@@ -0,0 +1,348 @@
+"""
+Hot tier of recent events and alerts
+
+Most dashboard traffic asks about the last day to week. The hot tier keeps
+the events and alerts of the last ``HOT_TIER_HOURS`` in memory, ordered by
+time, as parallel arrays: timestamps as 64-bit microseconds in an
+``array('q')`` and the sign-in and MFA outcomes as one byte each in
+``bytearray`` columns, about ten bytes per event. Counting outcomes in a
+window is two binary searches plus ``bytearray.count`` over the slice;
+daily alert counts are one binary search per day.
+
+The tier holds every row with a timestamp at or after ``covered_from``.
+Windows starting at or after it are answered from memory; anything older
+(or without a lower bound) falls back to SQL. Rows are loaded on first use,
+then fed by session hooks when ingest (or any other writer in this process)
+commits, and evicted by age. Other processes' writes are picked up by an
+indexed ``id >`` probe at most every ``HOT_TIER_SYNC_SECONDS`` (0 disables
+it for single-process deployments), read in batches of ``HOT_TIER_SYNC_BATCH``.
+A sync reloads the tier instead when more than ``HOT_TIER_SYNC_MAX_ROWS`` rows
+arrived (a bulk load) or when the row at a watermark is gone or has changed
+(the tables were cleared and ids reused).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from threading import RLock
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Set
+import os
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent, Alert, SignInResult, MFAResult
+
+EPOCH = datetime(1970, 1, 1)
+DAY_MICROS = 86400 * 1000000
+MAX_MICROS = 2 ** 63 - 1
+
+HOT_TIER_ENABLED = os.getenv("HOT_TIER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Covers the dashboard's 7-day default window with a day to spare
+HOT_TIER_HOURS = float(os.getenv("HOT_TIER_HOURS", "192"))
+HOT_TIER_MAX_EVENTS = int(os.getenv("HOT_TIER_MAX_EVENTS", "5000000"))
+HOT_TIER_SYNC_SECONDS = float(os.getenv("HOT_TIER_SYNC_SECONDS", "5"))
+HOT_TIER_SYNC_BATCH = int(os.getenv("HOT_TIER_SYNC_BATCH", "10000"))
+HOT_TIER_SYNC_MAX_ROWS = int(os.getenv("HOT_TIER_SYNC_MAX_ROWS", "200000"))
+EVICT_INTERVAL_SECONDS = 60
+# Without queries nothing syncs and prunes fed ids; an idle tier is released and reloaded on next use
+IDLE_RELEASE_SECONDS = 600
+
+SIGN_IN_CODES = {None: 0, SignInResult.SUCCESS: 1, SignInResult.FAIL: 2}
+MFA_CODES = {None: 0, MFAResult.PASS: 1, MFAResult.FAIL: 2, MFAResult.TIMEOUT: 3}
+
+
+def to_micros(ts: datetime) -> int:
+    return (ts - EPOCH) // timedelta(microseconds=1)
+
+
+class TimeSeries:
+    """Time-ordered rows as a timestamp array plus one byte column per attribute"""
+
+    def __init__(self, columns: int = 0):
+        self.times = array("q")
+        self.columns = [bytearray() for _ in range(columns)]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, micros: int, codes=()):
+        times = self.times
+        if not times or micros >= times[-1]:
+            times.append(micros)
+            for column, code in zip(self.columns, codes):
+                column.append(code)
+        else:
+            # Late arrival: keep the arrays sorted
+            i = bisect_right(times, micros)
+            times.insert(i, micros)
+            for column, code in zip(self.columns, codes):
+                column.insert(i, code)
+
+    def evict_before(self, micros: int) -> int:
+        count = bisect_left(self.times, micros)
+        if count:
+            del self.times[:count]
+            for column in self.columns:
+                del column[:count]
+        return count
+
+    def span(self, start: int, end: int):
+        """Index range of rows with ``start <= time <= end``"""
+        return bisect_left(self.times, start), bisect_right(self.times, end)
+
+    def nbytes(self) -> int:
+        return len(self.times) * self.times.itemsize + sum(len(c) for c in self.columns)
+
+
+class HotTier:
+    def __init__(self, hours: float = HOT_TIER_HOURS, max_events: int = HOT_TIER_MAX_EVENTS,
+                 sync_seconds: float = HOT_TIER_SYNC_SECONDS):
+        self.retention = timedelta(hours=hours)
+        self.max_events = max_events
+        self.sync_seconds = sync_seconds
+        self.lock = RLock()
+        self.counters = {"hits": 0, "misses": 0, "fed": 0, "synced": 0, "evicted": 0, "reloads": 0}
+        self.clear()
+
+    def clear(self):
+        self.events = TimeSeries(2)  # sign-in result, MFA result
+        self.alerts = TimeSeries()
+        self.covered_from: Optional[int] = None
+        # Highest ids loaded from SQL; rows at or below are already in the tier
+        self.watermarks = {"events": 0, "alerts": 0}
+        # Timestamps of the rows at the watermarks, to notice a cleared and refilled table
+        self.anchors: Dict[str, Optional[datetime]] = {"events": None, "alerts": None}
+        # Ids fed by this process above the watermark, so a sync does not add them twice
+        self.fed_ids: Dict[str, Set[int]] = {"events": set(), "alerts": set()}
+        self.loaded = False
+        self.load_ms = None
+        self._last_sync = monotonic()
+        self._last_evict = monotonic()
+
+    def load(self, db: Session) -> dict:
+        """Load the rows of the retention window from the database"""
+        started = perf_counter()
+        with self.lock:
+            self.clear()
+            start = datetime.utcnow() - self.retention
+            self.covered_from = to_micros(start)
+            # Take the watermarks first: rows committed meanwhile arrive through the hooks or the next sync
+            for table, model in (("events", SecurityEvent), ("alerts", Alert)):
+                newest = db.execute(
+                    select(model.id, model.timestamp).order_by(model.id.desc()).limit(1)
+                ).first()
+                self.watermarks[table], self.anchors[table] = newest if newest else (0, None)
+            rows = db.query(SecurityEvent.timestamp, SecurityEvent.sign_in_result, SecurityEvent.mfa_result).filter(
+                SecurityEvent.timestamp >= start, SecurityEvent.id <= self.watermarks["events"]
+            ).order_by(SecurityEvent.timestamp).yield_per(10000)
+            for ts, sign_in, mfa in rows:
+                self.events.append(to_micros(ts), (SIGN_IN_CODES.get(sign_in, 0), MFA_CODES.get(mfa, 0)))
+            for (ts,) in db.query(Alert.timestamp).filter(
+                Alert.timestamp >= start, Alert.id <= self.watermarks["alerts"]
+            ).order_by(Alert.timestamp):
+                self.alerts.append(to_micros(ts))
+            self._enforce_capacity()
+            self.loaded = True
+            self.load_ms = round((perf_counter() - started) * 1000, 2)
+        return self.stats()
+
+    def add(self, events: List[tuple], alerts: List[tuple]):
+        """Feed committed rows: ``(id, timestamp, sign_in_result, mfa_result)`` and ``(id, timestamp)``"""
+        with self.lock:
+            if not self.loaded:
+                return
+            if self.sync_seconds > 0 and monotonic() - self._last_sync > IDLE_RELEASE_SECONDS:
+                self.clear()
+                return
+            for row_id, ts, sign_in, mfa in events:
+                self._add_event(row_id, ts, sign_in, mfa, fed=True)
+            for row_id, ts in alerts:
+                self._add_alert(row_id, ts, fed=True)
+            self._enforce_capacity()
+
+    def _accept(self, table: str, row_id: int, ts: Optional[datetime], fed: bool) -> Optional[int]:
+        if row_id is None or ts is None or row_id <= self.watermarks[table]:
+            return None
+        if fed:
+            if self.sync_seconds > 0:
+                self.fed_ids[table].add(row_id)
+        elif row_id in self.fed_ids[table]:
+            return None
+        micros = to_micros(ts)
+        # Older than the covered range: such windows are answered by SQL anyway
+        return micros if micros >= self.covered_from else None
+
+    def _add_event(self, row_id, ts, sign_in, mfa, fed: bool):
+        micros = self._accept("events", row_id, ts, fed)
+        if micros is not None:
+            self.events.append(micros, (SIGN_IN_CODES.get(sign_in, 0), MFA_CODES.get(mfa, 0)))
+            self.counters["fed" if fed else "synced"] += 1
+
+    def _add_alert(self, row_id, ts, fed: bool):
+        micros = self._accept("alerts", row_id, ts, fed)
+        if micros is not None:
+            self.alerts.append(micros)
+            self.counters["fed" if fed else "synced"] += 1
+
+    def _stale(self, db: Session, table: str, model) -> bool:
+        """Whether the tier must be reloaded instead of catching up on ``table``"""
+        watermark = self.watermarks[table]
+        if watermark:
+            anchor = db.execute(select(model.timestamp).where(model.id == watermark)).first()
+            if anchor is None or anchor[0] != self.anchors[table]:
+                return True
+        newest = db.execute(select(func.max(model.id))).scalar() or 0
+        return newest - watermark > HOT_TIER_SYNC_MAX_ROWS
+
+    def sync(self, db: Session, batch_size: int = HOT_TIER_SYNC_BATCH):
+        """Pick up rows committed by other processes since the watermarks"""
+        with self.lock:
+            if self._stale(db, "events", SecurityEvent) or self._stale(db, "alerts", Alert):
+                self.load(db)
+                self.counters["reloads"] += 1
+                return
+            queries = (
+                ("events", SecurityEvent, self._add_event,
+                 (SecurityEvent.id, SecurityEvent.timestamp, SecurityEvent.sign_in_result, SecurityEvent.mfa_result)),
+                ("alerts", Alert, self._add_alert, (Alert.id, Alert.timestamp)),
+            )
+            for table, model, add, columns in queries:
+                while True:
+                    rows = db.execute(
+                        select(*columns).where(model.id > self.watermarks[table]).order_by(model.id).limit(batch_size)
+                    ).all()
+                    for row in rows:
+                        add(*row, fed=False)
+                    if rows:
+                        self.watermarks[table], self.anchors[table] = rows[-1][0], rows[-1][1]
+                        self.fed_ids[table] = {i for i in self.fed_ids[table] if i > self.watermarks[table]}
+                    if len(rows) < batch_size:
+                        break
+            self._enforce_capacity()
+            self._last_sync = monotonic()
+
+    def evict(self):
+        """Drop rows older than the retention window"""
+        with self.lock:
+            self.covered_from = max(self.covered_from, to_micros(datetime.utcnow() - self.retention))
+            self.counters["evicted"] += self.events.evict_before(self.covered_from)
+            self.counters["evicted"] += self.alerts.evict_before(self.covered_from)
+            self._last_evict = monotonic()
+
+    def _enforce_capacity(self):
+        excess = len(self.events) - self.max_events
+        if excess > 0:
+            # Everything from the first kept timestamp on is still complete
+            self.covered_from = max(self.covered_from, self.events.times[excess])
+            self.counters["evicted"] += self.events.evict_before(self.covered_from)
+            self.counters["evicted"] += self.alerts.evict_before(self.covered_from)
+
+    def _window(self, db: Session, start: Optional[datetime], end: Optional[datetime]):
+        """Microsecond bounds when the window lies inside the tier, else None"""
+        if not HOT_TIER_ENABLED or start is None:
+            return None
+        ensure_hot_tier(db)
+        now = monotonic()
+        if self.sync_seconds > 0 and now - self._last_sync >= self.sync_seconds:
+            self.sync(db)
+        if now - self._last_evict >= EVICT_INTERVAL_SECONDS:
+            self.evict()
+        lo = to_micros(start)
+        if lo < self.covered_from:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return lo, to_micros(end) if end else MAX_MICROS
+
+    def sign_in_stats(self, db: Session, start: Optional[datetime], end: Optional[datetime]) -> Optional[dict]:
+        window = self._window(db, start, end)
+        if window is None:
+            return None
+        with self.lock:
+            lo, hi = self.events.span(*window)
+            column = self.events.columns[0]
+            return {"success": column.count(1, lo, hi), "fail": column.count(2, lo, hi)}
+
+    def mfa_stats(self, db: Session, start: Optional[datetime], end: Optional[datetime]) -> Optional[dict]:
+        window = self._window(db, start, end)
+        if window is None:
+            return None
+        with self.lock:
+            lo, hi = self.events.span(*window)
+            column = self.events.columns[1]
+            return {"pass": column.count(1, lo, hi), "fail": column.count(2, lo, hi), "timeout": column.count(3, lo, hi)}
+
+    def alert_trends(self, db: Session, start: Optional[datetime], end: Optional[datetime]) -> Optional[list]:
+        """Alerts per calendar day (UTC), days without alerts omitted"""
+        window = self._window(db, start, end)
+        if window is None:
+            return None
+        with self.lock:
+            times = self.alerts.times
+            lo, hi = self.alerts.span(*window)
+            trends = []
+            while lo < hi:
+                day = times[lo] // DAY_MICROS
+                next_lo = bisect_left(times, (day + 1) * DAY_MICROS, lo, hi)
+                trends.append({"date": (EPOCH + timedelta(days=day)).date().isoformat(), "count": next_lo - lo})
+                lo = next_lo
+            return trends
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "enabled": HOT_TIER_ENABLED,
+                "loaded": self.loaded,
+                "load_ms": self.load_ms,
+                "retention_hours": self.retention.total_seconds() / 3600,
+                "covered_from": (EPOCH + timedelta(microseconds=self.covered_from)).isoformat()
+                if self.covered_from is not None else None,
+                "events": len(self.events),
+                "alerts": len(self.alerts),
+                "bytes": self.events.nbytes() + self.alerts.nbytes(),
+                "watermarks": dict(self.watermarks),
+                "sync_seconds": self.sync_seconds,
+                **self.counters,
+            }
+
+
+hot_tier = HotTier()
+
+
+def ensure_hot_tier(db: Session) -> HotTier:
+    """Load the tier on first use"""
+    if HOT_TIER_ENABLED and not hot_tier.loaded:
+        with hot_tier.lock:
+            if not hot_tier.loaded:
+                hot_tier.load(db)
+    return hot_tier
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_rows(session, flush_context):
+    # Collected even before the first load, which may be running concurrently on another thread
+    if not HOT_TIER_ENABLED:
+        return
+    events, alerts = [], []
+    for obj in session.new:
+        if isinstance(obj, SecurityEvent):
+            events.append((obj.id, obj.timestamp, obj.sign_in_result, obj.mfa_result))
+        elif isinstance(obj, Alert):
+            alerts.append((obj.id, obj.timestamp))
+    if events or alerts:
+        pending = session.info.setdefault("hot_tier_rows", ([], []))
+        pending[0].extend(events)
+        pending[1].extend(alerts)
+
+
+@event.listens_for(Session, "after_commit")
+def _feed_rows(session):
+    pending = session.info.pop("hot_tier_rows", None)
+    if pending is not None:
+        hot_tier.add(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rows(session):
+    session.info.pop("hot_tier_rows", None)
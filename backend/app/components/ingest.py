@@ -0,0 +1,95 @@
+"""
+Event ingest pipeline
+
+Enriches submitted security events from the local IP range database, stores
+them and runs them through the in-process detection path: sequence patterns
+raise alerts, new alerts are correlated into incidents, and the entity graph
+and per-user baselines pick up the new events before the request returns.
+With several server workers, sequence detection, correlation and baseline
+updates are left to the worker owning the stream (``app.components.stream``),
+so the response lists no alerts.
+"""
+from datetime import datetime
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent, Alert
+from app.schemas import SecurityEventIn
+from app.components.correlation import correlate_pending
+from app.components.enrichment import enrich_events
+from app.components.graph import index_events
+from app.components.baselines import ensure_baselines, observe_events
+from app.components.sequences import sequence_engine, sequence_lock, match_to_alert
+from app.components.stream import STREAM_OWNER_REQUIRED
+from app.components.writer import write_coalescer
+
+
+def prepare_events(payloads: List[SecurityEventIn]) -> List[SecurityEvent]:
+    """Build event rows in timestamp order, defaulting missing timestamps to now"""
+    events = [SecurityEvent(**p.model_dump()) for p in payloads]
+    now = datetime.utcnow()
+    for event in events:
+        if event.timestamp is None:
+            event.timestamp = now
+    events.sort(key=lambda e: e.timestamp)
+    return events
+
+
+def store_events(db: Session, events: List[SecurityEvent]) -> List[Alert]:
+    """Enrich and insert events and their sequence alerts without committing"""
+    enrich_events(db, events)
+    db.add_all(events)
+    db.flush()
+
+    alerts = []
+    if STREAM_OWNER_REQUIRED:
+        return alerts
+    with sequence_lock:
+        for event in events:
+            for match in sequence_engine.process(event):
+                alerts.append(match_to_alert(match))
+    db.add_all(alerts)
+    db.flush()
+    return alerts
+
+
+def finish_ingest(db: Session, events: List[SecurityEvent], alerts: List[Alert]) -> dict:
+    """Post-commit steps: index the graph, update baselines and correlate new alerts"""
+    index_events(events)
+    if not STREAM_OWNER_REQUIRED:
+        observe_events(db, events)
+
+    correlation = correlate_pending(db) if alerts else None
+    return {
+        "ingested": len(events),
+        "event_ids": [e.id for e in events],
+        "alerts": [
+            {
+                "id": a.id,
+                "detection_id": a.detection_id,
+                "user": a.user,
+                "timestamp": a.timestamp.isoformat(),
+            }
+            for a in alerts
+        ],
+        "incidents_created": correlation["incidents_created"] if correlation else 0,
+    }
+
+
+def ingest_events(db: Session, payloads: List[SecurityEventIn]) -> dict:
+    """Persist events in timestamp order and evaluate stream detections"""
+    # Load baselines before the new rows exist so a first-time build does not count them twice
+    ensure_baselines(db)
+    events = prepare_events(payloads)
+    alerts = store_events(db, events)
+    db.commit()
+    return finish_ingest(db, events, alerts)
+
+
+async def ingest_events_coalesced(db: Session, payloads: List[SecurityEventIn]) -> dict:
+    """Like ``ingest_events``, but the inserts are committed by the group-commit writer"""
+    ensure_baselines(db)
+    events = prepare_events(payloads)
+    alerts = await write_coalescer.run(lambda session: store_events(session, events))
+    return finish_ingest(db, events, alerts)
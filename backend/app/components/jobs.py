@@ -0,0 +1,361 @@
+"""
+Asynchronous response-action jobs
+
+Response actions can be queued instead of executed inside the request. A pool
+of worker threads takes due jobs from a delay queue (a heap ordered by the time
+each job may next run), calls the configured executor and, on success, records
+the action and the job outcome in one transaction. Transient executor failures
+are retried with capped exponential backoff and full jitter. Jobs are persisted
+in ``response_jobs``, so status survives restarts. Each job records the
+process that holds it, and every pool keeps a lease named after its process
+alive; unfinished jobs whose owner's lease has lapsed (the process exited or
+died) are taken over and re-queued by the next pool to check, at start and then
+periodically, never while their owner is still running them. An optional
+idempotency key makes re-submitted requests return the original job.
+
+The executor is pluggable: any object with ``execute(incident_id, action_type)``
+returning a dict. ``RESPONSE_EXECUTOR`` names it as ``module:Class``; the
+default ``SimulatedExecutor`` stands in for EDR/IdP calls with configurable
+latency and failure rate.
+"""
+from datetime import datetime, timedelta
+from heapq import heappush, heappop
+from importlib import import_module
+from itertools import count
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import List, Optional
+import json
+import logging
+import os
+import random
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import SessionLocal, Incident, ResponseAction, ResponseJob
+from app.components import leases
+from app.components.response import apply_actions
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_JOBS_ENABLED = os.getenv("RESPONSE_JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_WORKERS = int(os.getenv("RESPONSE_WORKERS", "4"))
+RESPONSE_MAX_ATTEMPTS = int(os.getenv("RESPONSE_MAX_ATTEMPTS", "5"))
+RESPONSE_RETRY_BASE_SECONDS = float(os.getenv("RESPONSE_RETRY_BASE_SECONDS", "0.5"))
+RESPONSE_RETRY_MAX_SECONDS = float(os.getenv("RESPONSE_RETRY_MAX_SECONDS", "30"))
+# Owner heartbeat; jobs of a process silent for this long are recovered by another
+RESPONSE_JOB_LEASE_SECONDS = float(os.getenv("RESPONSE_JOB_LEASE_SECONDS", "30"))
+RESPONSE_EXECUTOR = os.getenv("RESPONSE_EXECUTOR", "app.components.jobs:SimulatedExecutor")
+
+UNFINISHED = ("queued", "running", "retrying")
+CLAIMABLE = ("queued", "retrying")
+OWNER_LEASE_PREFIX = "response_jobs:"
+
+
+class ExecutorError(Exception):
+    """Executor failure; ``retryable`` failures are attempted again after a backoff"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SimulatedExecutor:
+    """Local stand-in for EDR/IdP calls with random latency and transient failures"""
+
+    def __init__(self, latency_ms: Optional[float] = None, jitter_ms: Optional[float] = None,
+                 failure_rate: Optional[float] = None, seed: Optional[int] = None):
+        self.latency_ms = float(os.getenv("SIMULATED_EXECUTOR_LATENCY_MS", "1500")) if latency_ms is None else latency_ms
+        self.jitter_ms = float(os.getenv("SIMULATED_EXECUTOR_JITTER_MS", "1000")) if jitter_ms is None else jitter_ms
+        self.failure_rate = (float(os.getenv("SIMULATED_EXECUTOR_FAILURE_RATE", "0.1"))
+                             if failure_rate is None else failure_rate)
+        self._random = random.Random(seed)
+
+    def execute(self, incident_id: str, action_type: str) -> dict:
+        latency = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+        sleep(latency / 1000)
+        if self._random.random() < self.failure_rate:
+            raise ExecutorError(f"Simulated {action_type} call timed out after {latency:.0f} ms")
+        return {"simulated": True, "latency_ms": round(latency, 1)}
+
+
+def load_executor(spec: str = RESPONSE_EXECUTOR):
+    module_name, _, class_name = spec.partition(":")
+    return getattr(import_module(module_name), class_name)()
+
+
+def backoff_seconds(attempt: int, base: float = RESPONSE_RETRY_BASE_SECONDS,
+                    cap: float = RESPONSE_RETRY_MAX_SECONDS) -> float:
+    """Full-jitter exponential backoff after the ``attempt``-th failure"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def serialize_job(job: ResponseJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "idempotency_key": job.idempotency_key,
+        "incident_id": job.incident_id,
+        "action_type": job.action_type,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "next_attempt_at": job.next_attempt_at.isoformat() if job.next_attempt_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class ResponseJobQueue:
+    """Delay queue of job ids served by a pool of worker threads"""
+
+    def __init__(self, workers: int = RESPONSE_WORKERS, executor=None, max_attempts: int = RESPONSE_MAX_ATTEMPTS,
+                 session_factory=SessionLocal):
+        self.workers = workers
+        self.executor = executor
+        self.max_attempts = max_attempts
+        self.session_factory = session_factory
+        # Owner leases live in the same database as the jobs
+        self._bind = getattr(session_factory, "kw", {}).get("bind")
+        self._heap = []
+        self._sequence = count()
+        self._condition = Condition()
+        self._threads: List[Thread] = []
+        self._heartbeat: Optional[Thread] = None
+        self._stopping = False
+        self.busy = 0
+        self.completed = {"succeeded": 0, "failed": 0, "retried": 0}
+        self._started_at = None
+
+    def submit(self, db: Session, incident_id: str, action_type: str,
+               idempotency_key: Optional[str] = None) -> dict:
+        """Persist and enqueue a job; an existing job with the same idempotency key is returned instead"""
+        if idempotency_key:
+            existing = db.query(ResponseJob).filter(ResponseJob.idempotency_key == idempotency_key).first()
+            if existing:
+                return {**serialize_job(existing), "deduplicated": True}
+        job = ResponseJob(
+            job_id=uuid.uuid4().hex,
+            idempotency_key=idempotency_key,
+            incident_id=incident_id,
+            action_type=action_type,
+            status="queued",
+            max_attempts=self.max_attempts,
+            created_at=datetime.utcnow(),
+            owner=leases.process_id(),
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent request with the same key won the insert
+            db.rollback()
+            existing = db.query(ResponseJob).filter(ResponseJob.idempotency_key == idempotency_key).first()
+            return {**serialize_job(existing), "deduplicated": True}
+        self._push(job.job_id, 0)
+        return {**serialize_job(job), "deduplicated": False}
+
+    def _push(self, job_id: str, delay: float):
+        with self._condition:
+            heappush(self._heap, (monotonic() + delay, next(self._sequence), job_id))
+            self._condition.notify()
+
+    def _next_job(self) -> Optional[str]:
+        with self._condition:
+            while not self._stopping:
+                now = monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    self.busy += 1
+                    return heappop(self._heap)[2]
+                self._condition.wait(self._heap[0][0] - now if self._heap else None)
+            return None
+
+    def _worker(self):
+        while True:
+            job_id = self._next_job()
+            if job_id is None:
+                return
+            try:
+                self.run_job(job_id)
+            except Exception:
+                logger.exception("Response job %s crashed", job_id)
+            finally:
+                with self._condition:
+                    self.busy -= 1
+
+    def run_job(self, job_id: str):
+        """Execute one attempt of a job"""
+        db = self.session_factory()
+        try:
+            # Claim atomically: a job pushed twice (recovery, a retry timer racing a re-queue) runs once
+            now = datetime.utcnow()
+            claimed = db.query(ResponseJob).filter(
+                ResponseJob.job_id == job_id, ResponseJob.status.in_(CLAIMABLE)
+            ).update({
+                "status": "running",
+                "owner": leases.process_id(),
+                "attempts": func.coalesce(ResponseJob.attempts, 0) + 1,
+                "started_at": func.coalesce(ResponseJob.started_at, now),
+                "next_attempt_at": None,
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+            job = db.query(ResponseJob).filter(ResponseJob.job_id == job_id).one()
+
+            try:
+                if not db.query(Incident.id).filter(Incident.incident_id == job.incident_id).first():
+                    raise ExecutorError("Incident not found", retryable=False)
+                result = self.executor.execute(job.incident_id, job.action_type)
+                # Jobs on the same incident finish concurrently: take the write lock, then read the incident as
+                # it is now, so each job advances the status and extends the history left by the previous one
+                self._lock_for_write(db)
+                incident = db.query(Incident).filter(Incident.incident_id == job.incident_id).with_for_update().one()
+                if incident.merged_into:
+                    # Absorbed by correlation after the job was queued
+                    raise ExecutorError(f"Incident was merged into {incident.merged_into}", retryable=False)
+                rows = apply_actions(incident, [job.action_type], datetime.utcnow())
+                db.add_all(ResponseAction(**row) for row in rows)
+                job.status = "succeeded"
+                job.result = json.dumps({**(result or {}), "incident_status": incident.status.value})
+                job.last_error = None
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                self._count("succeeded")
+            except Exception as exc:
+                db.rollback()
+                retryable = getattr(exc, "retryable", True)
+                job.last_error = str(exc)
+                if retryable and job.attempts < job.max_attempts:
+                    delay = backoff_seconds(job.attempts)
+                    job.status = "retrying"
+                    job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    db.commit()
+                    self._count("retried")
+                    self._push(job_id, delay)
+                else:
+                    job.status = "failed"
+                    job.finished_at = datetime.utcnow()
+                    db.commit()
+                    self._count("failed")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _lock_for_write(db: Session):
+        """Start a fresh transaction holding the write lock (SQLite; elsewhere rows are locked FOR UPDATE)"""
+        db.rollback()
+        if db.get_bind().dialect.name == "sqlite":
+            db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+    def _count(self, outcome: str):
+        with self._condition:
+            self.completed[outcome] += 1
+
+    def recover(self) -> int:
+        """Take over and re-queue unfinished jobs whose owning process is gone"""
+        me = leases.process_id()
+        live = leases.live_owners(OWNER_LEASE_PREFIX, bind=self._bind) | {me}
+        db = self.session_factory()
+        recovered = []
+        try:
+            candidates = db.query(ResponseJob.job_id, ResponseJob.owner, ResponseJob.next_attempt_at).filter(
+                ResponseJob.status.in_(UNFINISHED)
+            ).order_by(ResponseJob.id.asc()).all()
+            now = datetime.utcnow()
+            for job_id, owner, next_attempt_at in candidates:
+                if owner in live:
+                    continue
+                # Conditional on the previous owner, so two pools never take over the same job
+                taken = db.query(ResponseJob).filter(
+                    ResponseJob.job_id == job_id,
+                    ResponseJob.owner.is_(None) if owner is None else ResponseJob.owner == owner,
+                    ResponseJob.status.in_(UNFINISHED),
+                ).update({"owner": me, "status": "retrying" if next_attempt_at else "queued"},
+                         synchronize_session=False)
+                db.commit()
+                if taken:
+                    delay = max(0.0, (next_attempt_at - now).total_seconds()) if next_attempt_at else 0.0
+                    recovered.append((job_id, delay))
+        finally:
+            db.close()
+        for job_id, delay in recovered:
+            self._push(job_id, delay)
+        return len(recovered)
+
+    def _keep_alive(self, recover: bool):
+        """Renew this process's owner lease and periodically recover orphaned jobs"""
+        name = OWNER_LEASE_PREFIX + leases.process_id()
+        while True:
+            try:
+                leases.acquire(name, RESPONSE_JOB_LEASE_SECONDS, bind=self._bind)
+                if recover:
+                    self.recover()
+            except Exception:
+                logger.exception("Response job heartbeat failed")
+            with self._condition:
+                if self._stopping or self._condition.wait_for(lambda: self._stopping, RESPONSE_JOB_LEASE_SECONDS / 3):
+                    break
+        try:
+            leases.release(name, bind=self._bind)
+        except Exception:
+            logger.exception("Releasing the response job lease failed")
+
+    def start(self, recover: bool = True):
+        if self.running:
+            return
+        if self.executor is None:
+            self.executor = load_executor()
+        self._stopping = False
+        self._started_at = monotonic()
+        leases.acquire(OWNER_LEASE_PREFIX + leases.process_id(), RESPONSE_JOB_LEASE_SECONDS, bind=self._bind)
+        if recover:
+            self.recover()
+        self._threads = [
+            Thread(target=self._worker, name=f"response-worker-{i}", daemon=True) for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._heartbeat = Thread(target=self._keep_alive, args=(recover,), name="response-jobs-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=timeout)
+            self._heartbeat = None
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def stats(self) -> dict:
+        with self._condition:
+            now = monotonic()
+            due = sum(1 for ready_at, _, _ in self._heap if ready_at <= now)
+            waiting = len(self._heap) - due
+        elapsed = now - self._started_at if self._started_at else 0
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "queued": due,
+            "waiting_retry": waiting,
+            "executor": type(self.executor).__name__ if self.executor else None,
+            **self.completed,
+            "throughput_per_s": round(self.completed["succeeded"] / elapsed, 3) if elapsed else 0,
+        }
+
+
+response_jobs = ResponseJobQueue()
+
@@ -0,0 +1,92 @@
+"""
+Leases for singleton background work
+
+Worker processes elect the one that runs singleton work (the detection
+scheduler, a scheduled rule evaluation) through rows in ``leases``: a lease is
+taken by an atomic update that only succeeds when the row is free, expired or
+already held by the caller, and the holder renews it before it expires. A
+worker that dies stops renewing, so another worker takes over after at most
+one lease period. Processes also hold a lease named after themselves while
+they run, which lets other processes tell whether work a process claimed
+still has a live owner.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Optional, Set
+import os
+import socket
+import uuid
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.models import engine, Lease
+
+# Worker processes serving the app (set by start_server.py); per-process stream state then needs one owner
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+
+_process = {"pid": None, "id": None}
+_process_lock = Lock()
+
+
+def process_id() -> str:
+    """Identity of this process; forked workers get their own"""
+    with _process_lock:
+        if _process["pid"] != os.getpid():
+            _process.update(pid=os.getpid(), id=f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+        return _process["id"]
+
+
+def acquire(name: str, ttl_seconds: float, owner: Optional[str] = None, bind=None) -> bool:
+    """Take or renew ``name`` for ``ttl_seconds``; False while another owner holds it"""
+    owner = owner or process_id()
+    bind = bind if bind is not None else engine
+    table = Lease.__table__
+    now = datetime.utcnow()
+    values = {"owner": owner, "expires_at": now + timedelta(seconds=ttl_seconds)}
+    with bind.begin() as connection:
+        taken = connection.execute(
+            table.update().where(and_(
+                table.c.name == name, or_(table.c.owner == owner, table.c.expires_at < now)
+            )).values(**values)
+        ).rowcount
+    if taken:
+        return True
+    try:
+        with bind.begin() as connection:
+            connection.execute(table.insert().values(name=name, acquired_at=now, **values))
+    except IntegrityError:
+        return False  # held by someone else
+    return True
+
+
+def release(name: str, owner: Optional[str] = None, bind=None):
+    owner = owner or process_id()
+    bind = bind if bind is not None else engine
+    table = Lease.__table__
+    with bind.begin() as connection:
+        connection.execute(table.delete().where(and_(table.c.name == name, table.c.owner == owner)))
+
+
+@contextmanager
+def held(name: str, ttl_seconds: float):
+    """Hold ``name`` for the duration of the block; yields whether it was acquired"""
+    acquired = acquire(name, ttl_seconds)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release(name)
+
+
+def live_owners(prefix: str, bind=None) -> Set[str]:
+    """Owners of unexpired leases named ``<prefix><owner>``"""
+    bind = bind if bind is not None else engine
+    table = Lease.__table__
+    with bind.connect() as connection:
+        names = connection.execute(
+            table.select().with_only_columns(table.c.name)
+            .where(table.c.name.startswith(prefix, autoescape=True), table.c.expires_at >= datetime.utcnow())
+        ).scalars()
+        return {name[len(prefix):] for name in names}
@@ -0,0 +1,299 @@
+"""
+Live feed of new alerts, incident status changes and KPI deltas
+
+Session hooks collect the alerts and incidents a flush inserts or whose
+status it changes, and publish them once the transaction commits (nothing is
+sent for rolled-back work). Publishing is thread safe: the group-commit
+writer, response workers and the scheduler commit on their own threads and
+hand messages to the event loop, where one broadcaster fans them out.
+
+Each subscriber has a bounded queue. A subscriber whose queue is full is a
+slow consumer: its queue is replaced by a single ``overflow`` message and it
+is dropped, so one stalled client never delays the others or grows memory;
+it reconnects with ``Last-Event-ID`` and resumes from the replay buffer or
+re-fetches. Idle subscribers cost one waiting coroutine and an empty queue;
+keep-alives come from a single broadcaster task, not a timer per connection.
+
+KPI deltas are derived from the same change sets without querying: alert
+counts, high-severity counts, MITRE tactic counts and incident counts per
+status. The feed is per process; with several workers a client only sees
+changes committed by the worker it is connected to.
+"""
+from collections import deque
+from datetime import datetime
+from itertools import count
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+import json
+import logging
+import os
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Alert, Incident, SeverityLevel
+
+logger = logging.getLogger(__name__)
+
+LIVE_FEED_ENABLED = os.getenv("LIVE_FEED_ENABLED", "true").lower() in ("1", "true", "yes")
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", "256"))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "10000"))
+LIVE_FEED_REPLAY_SIZE = int(os.getenv("LIVE_FEED_REPLAY_SIZE", "512"))
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", "15"))
+# Items per message; a bulk response run touching more incidents sends a count with the first items
+LIVE_FEED_BATCH_LIMIT = int(os.getenv("LIVE_FEED_BATCH_LIMIT", "200"))
+
+TOPICS = ("alerts", "incidents", "kpis")
+HIGH_SEVERITIES = {SeverityLevel.HIGH.value, SeverityLevel.CRITICAL.value}
+
+HEARTBEAT = object()
+OVERFLOW = object()
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _value(enum_value) -> Optional[str]:
+    return getattr(enum_value, "value", enum_value)
+
+
+def serialize_alert(alert: Alert) -> dict:
+    return {
+        "id": alert.id,
+        "alert_name": alert.alert_name,
+        "severity": _value(alert.severity),
+        "detection_id": alert.detection_id,
+        "user": alert.user,
+        "timestamp": _iso(alert.timestamp),
+        "scenario_type": alert.scenario_type,
+        "mitre_tactic": alert.mitre_tactic,
+    }
+
+
+def serialize_incident(incident: Incident, previous_status: Optional[str]) -> dict:
+    return {
+        "id": incident.id,
+        "incident_id": incident.incident_id,
+        "title": incident.title,
+        "severity": _value(incident.severity),
+        "user": incident.user,
+        "status": _value(incident.status),
+        "previous_status": previous_status,
+        "detected_at": _iso(incident.detected_at),
+        "acknowledged_at": _iso(incident.acknowledged_at),
+        "contained_at": _iso(incident.contained_at),
+        "resolved_at": _iso(incident.resolved_at),
+        "mttr_minutes": incident.mttr_minutes,
+        "merged_into": incident.merged_into,
+    }
+
+
+class ChangeSet:
+    """Alerts and incident changes of one transaction"""
+    __slots__ = ("alerts", "incidents")
+
+    def __init__(self):
+        self.alerts: List[dict] = []
+        self.incidents: List[dict] = []
+
+    def kpi_delta(self) -> dict:
+        delta = {}
+        tactics: Dict[str, int] = {}
+        statuses: Dict[str, int] = {}
+        for alert in self.alerts:
+            delta["total_alerts"] = delta.get("total_alerts", 0) + 1
+            if alert["severity"] in HIGH_SEVERITIES:
+                delta["high_severity_alerts"] = delta.get("high_severity_alerts", 0) + 1
+            if alert["mitre_tactic"]:
+                tactics[alert["mitre_tactic"]] = tactics.get(alert["mitre_tactic"], 0) + 1
+        for incident in self.incidents:
+            if incident["previous_status"]:
+                statuses[incident["previous_status"]] = statuses.get(incident["previous_status"], 0) - 1
+            if not incident["merged_into"]:
+                statuses[incident["status"]] = statuses.get(incident["status"], 0) + 1
+        if tactics:
+            delta["tactics"] = tactics
+        statuses = {status: n for status, n in statuses.items() if n}
+        if statuses:
+            delta["incidents_by_status"] = statuses
+        return delta
+
+
+class Subscriber:
+    __slots__ = ("queue", "topics", "connected_at", "dropped")
+
+    def __init__(self, topics: Iterable[str], queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.topics: Set[str] = set(topics)
+        self.connected_at = datetime.utcnow()
+        self.dropped = False
+
+
+class Broadcaster:
+    """Single in-process fan-out to bounded per-subscriber queues"""
+
+    def __init__(self, queue_size: int = LIVE_FEED_QUEUE_SIZE, max_subscribers: int = LIVE_FEED_MAX_SUBSCRIBERS,
+                 replay_size: int = LIVE_FEED_REPLAY_SIZE, heartbeat_seconds: float = LIVE_FEED_HEARTBEAT_SECONDS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.subscribers: Set[Subscriber] = set()
+        self.replay: deque = deque(maxlen=replay_size)
+        self._ids = count(1)
+        self._lock = Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.counters = {"published": 0, "delivered": 0, "slow_consumers_dropped": 0, "rejected": 0}
+
+    def start(self):
+        """Bind to the running event loop; call from the app's startup hook"""
+        self._loop = asyncio.get_running_loop()
+        if self._heartbeat is None and self.heartbeat_seconds > 0:
+            self._heartbeat = self._loop.create_task(self._send_heartbeats())
+
+    def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        for subscriber in list(self.subscribers):
+            self._drop(subscriber)
+        self._loop = None
+
+    @property
+    def active(self) -> bool:
+        """Bound to a running app; changes are buffered for replay even while nobody is subscribed"""
+        return self._loop is not None
+
+    def subscribe(self, topics: Iterable[str] = TOPICS, last_event_id: Optional[int] = None) -> Optional[Subscriber]:
+        """New subscriber, primed with buffered messages after ``last_event_id``; None when at capacity"""
+        if len(self.subscribers) >= self.max_subscribers:
+            self.counters["rejected"] += 1
+            return None
+        subscriber = Subscriber(topics, self.queue_size)
+        if last_event_id is not None:
+            with self._lock:
+                missed = [m for m in self.replay if m["id"] > last_event_id and m["type"] in subscriber.topics]
+            for message in missed[-self.queue_size:]:
+                subscriber.queue.put_nowait(message)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, topic: str, data: dict):
+        """Queue a message for every subscriber of ``topic``; callable from any thread"""
+        with self._lock:
+            message = {"id": next(self._ids), "type": topic, "at": datetime.utcnow().isoformat(), "data": data}
+            self.replay.append(message)
+            self.counters["published"] += 1
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, message)
+
+    def publish_changes(self, changes: ChangeSet):
+        if changes.alerts:
+            self.publish("alerts", _batch(changes.alerts))
+        if changes.incidents:
+            self.publish("incidents", _batch(changes.incidents))
+        delta = changes.kpi_delta()
+        if delta:
+            self.publish("kpis", delta)
+
+    def _fan_out(self, message):
+        """Runs on the event loop thread"""
+        for subscriber in list(self.subscribers):
+            if message is not HEARTBEAT and message["type"] not in subscriber.topics:
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                if message is not HEARTBEAT:
+                    self._drop(subscriber)
+                    self.counters["slow_consumers_dropped"] += 1
+                continue
+            if message is not HEARTBEAT:
+                self.counters["delivered"] += 1
+
+    def _drop(self, subscriber: Subscriber):
+        """Discard a subscriber's backlog and leave it a single overflow marker"""
+        self.subscribers.discard(subscriber)
+        subscriber.dropped = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(OVERFLOW)
+
+    async def _send_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            self._fan_out(HEARTBEAT)
+
+    def stats(self) -> dict:
+        queued = [s.queue.qsize() for s in self.subscribers]
+        return {
+            "enabled": LIVE_FEED_ENABLED,
+            "subscribers": len(queued),
+            "max_subscribers": self.max_subscribers,
+            "queue_size": self.queue_size,
+            "queued_messages": sum(queued),
+            "max_queued": max(queued, default=0),
+            "replay_buffered": len(self.replay),
+            "last_event_id": self.replay[-1]["id"] if self.replay else None,
+            **self.counters,
+        }
+
+
+def _batch(items: List[dict]) -> dict:
+    return {"count": len(items), "items": items[:LIVE_FEED_BATCH_LIMIT], "truncated": len(items) > LIVE_FEED_BATCH_LIMIT}
+
+
+live_feed = Broadcaster()
+
+
+def format_sse(message) -> str:
+    """Server-Sent Events framing; heartbeats are comments browsers ignore"""
+    if message is HEARTBEAT:
+        return ": keep-alive\n\n"
+    if message is OVERFLOW:
+        return "event: overflow\ndata: {}\n\n"
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    if not (LIVE_FEED_ENABLED and live_feed.active):
+        return
+    changes = session.info.get("live_feed_changes")
+    if changes is None:
+        changes = session.info["live_feed_changes"] = ChangeSet()
+    try:
+        for obj in session.new:
+            if isinstance(obj, Alert):
+                changes.alerts.append(serialize_alert(obj))
+            elif isinstance(obj, Incident):
+                changes.incidents.append(serialize_incident(obj, None))
+        for obj in session.dirty:
+            if isinstance(obj, Incident):
+                attrs = inspect(obj).attrs
+                history = attrs.status.history
+                if history.added and history.deleted and history.added[0] != history.deleted[0]:
+                    changes.incidents.append(serialize_incident(obj, _value(history.deleted[0])))
+                elif any(attrs.merged_into.history.added) and not any(attrs.merged_into.history.deleted):
+                    # Absorbed by correlation: leaves its status count
+                    changes.incidents.append(serialize_incident(obj, _value(obj.status)))
+    except Exception:
+        logger.exception("Collecting live feed changes failed")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop("live_feed_changes", None)
+    if changes is not None:
+        live_feed.publish_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("live_feed_changes", None)
@@ -0,0 +1,280 @@
+"""
+Per-route request and SQL metrics
+
+An ASGI middleware times every request and labels it with the matched route
+template (not the raw path, so ``/incidents/{incident_id}`` is one series).
+SQLAlchemy cursor hooks attribute each statement to the request running it
+through a context variable: statement count, cumulative execution time and
+rows returned (counted as the result rows are fetched). Statements issued
+outside a request, such as the group-commit writer and background jobs, are
+reported under the ``background`` route.
+
+Per-request counters are accumulated without locking and merged into the
+registry once when the response completes. ``render()`` produces the
+Prometheus text exposition format served at ``/api/v1/metrics``.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+LATENCY_BUCKETS = tuple(
+    float(b) for b in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+)
+
+BACKGROUND_ROUTE = "background"
+UNMATCHED_ROUTE = "unmatched"
+
+
+class SqlCounters:
+    """SQL work done by one request (or by background code)"""
+    __slots__ = ("statements", "seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+    def merge(self, other: "SqlCounters"):
+        self.statements += other.statements
+        self.seconds += other.seconds
+        self.rows += other.rows
+
+    def add_rows(self, count: int):
+        self.rows += count
+
+
+class _BackgroundRows:
+    """Row counter for statements outside a request; fetches may happen on several threads"""
+    __slots__ = ()
+
+    def add_rows(self, count: int):
+        registry.add_background_rows(count)
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "count", "total_seconds", "statuses", "sql")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+        self.sql = SqlCounters()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.background = SqlCounters()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, sql: SqlCounters):
+        with self._lock:
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = RouteMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.total_seconds += seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.sql.merge(sql)
+
+    def observe_background(self, statements: int, seconds: float):
+        with self._lock:
+            self.background.statements += statements
+            self.background.seconds += seconds
+
+    def add_background_rows(self, count: int):
+        with self._lock:
+            self.background.rows += count
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.background = SqlCounters()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            routes = sorted(self.routes.items())
+            sql_series = [((method, route), m.sql) for (method, route), m in routes]
+            sql_series.append((("", BACKGROUND_ROUTE), self.background))
+            lines = [
+                "# HELP http_requests_total Requests by route template and status code",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+            lines += [
+                "# HELP http_request_duration_seconds Request latency by route template",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), metrics in routes:
+                labels = _labels(method, route)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.total_seconds:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {metrics.count}")
+
+            for name, kind, help_text, value in (
+                ("db_statements_total", "counter", "SQL statements executed", lambda s: s.statements),
+                ("db_statement_seconds_total", "counter", "Time spent executing SQL statements",
+                 lambda s: f"{s.seconds:.6f}"),
+                ("db_rows_returned_total", "counter", "Result rows fetched from SQL statements", lambda s: s.rows),
+            ):
+                lines += [f"# HELP {name} {help_text} by route template", f"# TYPE {name} {kind}"]
+                for (method, route), sql in sql_series:
+                    lines.append(f"{name}{{{_labels(method, route)}}} {value(sql)}")
+        return "\n".join(lines) + "\n"
+
+
+POOL_GAUGES = (
+    ("db_pool_size", "gauge", "Connections kept open by the pool", "size"),
+    ("db_pool_checked_out", "gauge", "Connections currently in use", "checked_out"),
+    ("db_pool_overflow", "gauge", "Connections open beyond the pool size", "overflow"),
+    ("db_pool_checkouts_total", "counter", "Connection checkouts", "checkouts"),
+    ("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection", "timeouts"),
+)
+
+
+def render_pools(pools: Dict[str, dict]) -> str:
+    """Pool occupancy and wait-time series for ``models.pool_stats()``"""
+    pools = {name: stats for name, stats in pools.items() if "shared_with" not in stats}
+    lines = []
+    for name, kind, help_text, key in POOL_GAUGES:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{pool="{pool}"}} {stats[key]}' for pool, stats in pools.items() if key in stats]
+    lines += [
+        "# HELP db_pool_wait_seconds_total Time spent waiting for a connection",
+        "# TYPE db_pool_wait_seconds_total counter",
+    ]
+    lines += [
+        f'db_pool_wait_seconds_total{{pool="{pool}"}} {stats["wait_seconds"]:.6f}'
+        for pool, stats in pools.items() if "wait_seconds" in stats
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str) -> str:
+    return f'method="{_escape(method)}",route="{_escape(route)}"'
+
+
+registry = MetricsRegistry()
+_background_rows = _BackgroundRows()
+_request_sql: ContextVar[Optional[SqlCounters]] = ContextVar("request_sql", default=None)
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def current_route() -> Optional[str]:
+    """``METHOD /route/{template}`` of the request running the caller, if any"""
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no body buffering, so streaming responses are unaffected)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        sql = SqlCounters()
+        token = _request_sql.set(sql)
+        scope_token = _request_scope.set(scope)
+        status = 500
+        started = perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_sql.reset(token)
+            _request_scope.reset(scope_token)
+            # FastAPI records the matched route in the scope during routing
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status, perf_counter() - started, sql
+            )
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy counting the rows SQLAlchemy fetches through it"""
+    __slots__ = ("_cursor", "_counters")
+
+    def __init__(self, cursor, counters):
+        self._cursor = cursor
+        self._counters = counters
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._counters.add_rows(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._counters.add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._counters.add_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._counters.add_rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if METRICS_ENABLED:
+        conn.info.setdefault("metrics_started", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not METRICS_ENABLED:
+        return
+    elapsed = perf_counter() - conn.info["metrics_started"].pop()
+    sql = _request_sql.get()
+    if sql is None:
+        registry.observe_background(1, elapsed)
+    else:
+        sql.statements += 1
+        sql.seconds += elapsed
+    if context is not None and cursor.description is not None:
+        # Rows are fetched after this hook returns; the result reads them through the proxy
+        context.cursor = _CountingCursor(cursor, sql if sql is not None else _background_rows)
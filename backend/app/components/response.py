@@ -0,0 +1,183 @@
+"""
+Simulated response actions
+
+Shared by the single-incident endpoint and bulk execution. Bulk runs load the
+targeted incidents in chunks, apply every requested action in memory, write all
+``response_actions`` rows with one batched insert per chunk and commit once, so
+a campaign-wide containment either lands completely or not at all. Each
+request moves an incident one status step, however many actions it applies.
+Incidents absorbed into another by correlation are never acted on: bulk runs
+skip them, and single actions and jobs are rejected with the survivor's id.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+
+from sqlalchemy.orm import Session
+
+from app.models import Incident, ResponseAction, IncidentStatus
+
+MAX_BULK_INCIDENTS = int(os.getenv("MAX_BULK_INCIDENTS", "10000"))
+BULK_CHUNK_SIZE = 500
+
+ACTION_DESCRIPTIONS = {
+    "disable_user": {
+        "name": "Disable User Account",
+        "description": "In production, this would disable the user account in Azure AD, preventing all future sign-ins. The user would need admin intervention to re-enable the account."
+    },
+    "revoke_sessions": {
+        "name": "Revoke All Active Sessions",
+        "description": "In production, this would invalidate all active tokens and sessions for the user, forcing them to re-authenticate. This would immediately log them out of all devices and applications."
+    },
+    "password_reset": {
+        "name": "Require Password Reset",
+        "description": "In production, this would force the user to reset their password on next sign-in. This helps ensure the account hasn't been compromised and the password is changed."
+    },
+    "isolate_endpoint": {
+        "name": "Isolate Endpoint",
+        "description": "In production, this would isolate the device from the network, preventing it from accessing corporate resources while allowing investigation. This is typically done via Microsoft Defender for Endpoint or similar EDR solution."
+    },
+    "block_oauth": {
+        "name": "Block OAuth Application",
+        "description": "In production, this would revoke consent and block the OAuth application, preventing it from accessing user data. This would also revoke all existing tokens issued to the application."
+    }
+}
+
+
+def advance_status(incident: Incident, now: datetime):
+    """Move an incident one step along open -> investigating -> contained -> resolved"""
+    if incident.status == IncidentStatus.OPEN:
+        incident.status = IncidentStatus.INVESTIGATING
+        incident.acknowledged_at = now
+    elif incident.status == IncidentStatus.INVESTIGATING:
+        incident.status = IncidentStatus.CONTAINED
+        incident.contained_at = now
+    elif incident.status == IncidentStatus.CONTAINED:
+        incident.status = IncidentStatus.RESOLVED
+        incident.resolved_at = now
+        # Calculate MTTR
+        if incident.detected_at:
+            incident.mttr_minutes = (now - incident.detected_at).total_seconds() / 60
+
+
+def _load_actions(incident: Incident) -> list:
+    try:
+        return json.loads(incident.response_actions or "[]")
+    except ValueError:
+        return []
+
+
+def apply_actions(incident: Incident, action_types: List[str], now: datetime) -> List[dict]:
+    """Apply actions to a loaded incident and advance its status once; returns ``response_actions`` rows"""
+    history = _load_actions(incident)
+    rows = []
+    for action_type in action_types:
+        info = ACTION_DESCRIPTIONS[action_type]
+        rows.append({
+            "incident_id": incident.incident_id,
+            "action_type": action_type,
+            "action_name": info["name"],
+            "description": info["description"],
+            "simulated": True,
+            "executed_at": now,
+            "created_at": now,
+        })
+        history.append({"action_type": action_type, "action_name": info["name"], "executed_at": now.isoformat()})
+    if rows:
+        advance_status(incident, now)
+    incident.response_actions = json.dumps(history)
+    return rows
+
+
+def execute_action(db: Session, incident: Incident, action_type: str) -> Incident:
+    """Apply one action to one incident and commit"""
+    rows = apply_actions(incident, [action_type], datetime.utcnow())
+    db.add_all(ResponseAction(**row) for row in rows)
+    db.commit()
+    return incident
+
+
+def merged_error(incident_id: str, merged_into: str) -> dict:
+    """Response for an action on an incident absorbed into another"""
+    return {"error": f"Incident {incident_id} was merged into {merged_into}", "merged_into": merged_into}
+
+
+def stage_action(db: Session, incident_id: str, action_type: str) -> Tuple[Optional[str], Optional[str]]:
+    """Apply one action without committing (for the group-commit writer)
+
+    Returns ``(new status, None)``, ``(None, survivor id)`` for a merged
+    incident, which is left unchanged, and ``(None, None)`` when not found.
+    """
+    incident = db.query(Incident).filter(Incident.incident_id == incident_id).first()
+    if incident is None:
+        return None, None
+    if incident.merged_into:
+        return None, incident.merged_into
+    db.add_all(ResponseAction(**row) for row in apply_actions(incident, [action_type], datetime.utcnow()))
+    return incident.status.value, None
+
+
+def select_incident_ids(db: Session, filters: list, limit: int = MAX_BULK_INCIDENTS) -> List[str]:
+    """Unmerged incident ids matching ``filters``; at most ``limit + 1`` so callers can detect overflow"""
+    return [i for (i,) in db.query(Incident.incident_id).filter(Incident.merged_into.is_(None), *filters).order_by(
+        Incident.detected_at.asc(), Incident.id.asc()
+    ).limit(limit + 1).all()]
+
+
+def execute_bulk_actions(db: Session, incident_ids: List[str], action_types: List[str]) -> dict:
+    """Apply ``action_types`` to every incident in one transaction"""
+    now = datetime.utcnow()
+    unique_ids = list(dict.fromkeys(incident_ids))
+    results: Dict[str, dict] = {}
+    inserted = 0
+    try:
+        for lo in range(0, len(unique_ids), BULK_CHUNK_SIZE):
+            chunk = unique_ids[lo:lo + BULK_CHUNK_SIZE]
+            incidents = db.query(Incident).filter(Incident.incident_id.in_(chunk)).all()
+            rows = []
+            for incident in incidents:
+                if incident.merged_into:
+                    results[incident.incident_id] = {
+                        "incident_id": incident.incident_id,
+                        "result": "merged",
+                        "merged_into": incident.merged_into,
+                    }
+                    continue
+                before = incident.status
+                rows.extend(apply_actions(incident, action_types, now))
+                results[incident.incident_id] = {
+                    "incident_id": incident.incident_id,
+                    "result": "applied",
+                    "status_before": before.value if before else None,
+                    "status_after": incident.status.value if incident.status else None,
+                    "actions": list(action_types),
+                }
+            if rows:
+                db.execute(ResponseAction.__table__.insert(), rows)
+                inserted += len(rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    summary: Dict[str, int] = {}
+    merged = 0
+    for item in results.values():
+        if item["result"] == "merged":
+            merged += 1
+            continue
+        summary[item["status_after"]] = summary.get(item["status_after"], 0) + 1
+    return {
+        "success": True,
+        "requested": len(unique_ids),
+        "applied": len(results) - merged,
+        "merged": merged,
+        "not_found": len(unique_ids) - len(results),
+        "actions_recorded": inserted,
+        "status_counts": summary,
+        "results": [
+            results.get(i, {"incident_id": i, "result": "not_found"}) for i in unique_ids
+        ],
+    }
+
@@ -0,0 +1,378 @@
+"""
+Scheduled SQL detections
+
+Detections that are easier to express as periodic queries than as stream rules
+run on an in-process scheduler. Each rule only evaluates events above its
+persisted watermark (``security_events.id``), in bounded batches. Alerts and the
+advanced watermark commit in the same transaction, so a run interrupted by a
+crash or restart resumes exactly where it stopped, and a scheduler that was down
+for several intervals catches up in a single run instead of replaying each one.
+The watermark also remembers the timestamp of the event it points at; when that
+event is gone or has changed (the table was cleared and ids reused), the rule
+starts over from the beginning.
+
+Every worker process starts the scheduler thread, but only the holder of the
+``detection_scheduler`` lease evaluates due rules, and each evaluation, manual
+runs included, holds a per-rule lease, so rules never run concurrently in two
+processes. With several workers, new alerts are left to the stream processor
+to correlate.
+"""
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+import logging
+import os
+
+from sqlalchemy import text, func, bindparam
+from sqlalchemy.orm import Session
+
+from app.models import SessionLocal, SecurityEvent, Alert, DetectionWatermark, ScheduledDetectionRun, SeverityLevel
+from app.components.baselines import ensure_baselines
+from app.components.correlation import correlate_pending
+from app.components.dimensions import DIMENSIONS
+from app.components import leases
+from app.components.profiling import rule_profiler
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULED_DETECTIONS_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULED_DETECTIONS_TICK_SECONDS", "5"))
+ALLOWED_RESOURCE_COUNTRIES = [
+    c.strip() for c in os.getenv("ALLOWED_RESOURCE_COUNTRIES", "United States,United Kingdom").split(",") if c.strip()
+]
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULED_DETECTIONS_LEASE_SECONDS", "30"))
+# Longest a single rule evaluation may take before another process may start the same rule
+RULE_LEASE_SECONDS = float(os.getenv("SCHEDULED_DETECTIONS_RULE_LEASE_SECONDS", "600"))
+AUTHORIZED_POLICY_USERS = [
+    u.strip() for u in os.getenv("AUTHORIZED_POLICY_USERS", "").split(",") if u.strip()
+]
+# Without a configured list, any user may change policies during business hours
+_UNAUTHORIZED_POLICY_USER = 'OR "user" NOT IN :authorized_users' if AUTHORIZED_POLICY_USERS else ""
+
+# Hour and weekday (0 = Sunday) of an event in each dialect, for ``{hour}`` and ``{weekday}`` in rule SQL
+DATE_PARTS = {
+    "sqlite": {
+        "hour": "CAST(strftime('%H', timestamp) AS INTEGER)",
+        "weekday": "CAST(strftime('%w', timestamp) AS INTEGER)",
+    },
+    "postgresql": {
+        "hour": "EXTRACT(HOUR FROM timestamp)",
+        "weekday": "EXTRACT(DOW FROM timestamp)",
+    },
+}
+
+
+class ScheduledDetection:
+    """A SQL detection evaluated over ``security_events`` rows with ``:lo < id <= :hi``
+
+    ``baseline_filter(row, verdict)`` keeps only the candidate rows that are
+    unusual for their user, given ``BaselineStore.assess`` for the row; such
+    rules select the columns the assessment reads (``user``, ``timestamp``,
+    ``geo_country``, ``geo_city``, ``device_id``, ``app_name``). ``{hour}`` and
+    ``{weekday}`` in ``sql`` are replaced with the dialect's ``DATE_PARTS``.
+    """
+
+    def __init__(self, detection_id: str, alert_name: str, sql: str, interval: timedelta,
+                 severity: SeverityLevel, mitre_tactic: str, mitre_technique: str,
+                 params: Optional[dict] = None, baseline_filter: Optional[Callable] = None,
+                 batch_size: int = 50000):
+        self.detection_id = detection_id
+        self.alert_name = alert_name
+        self.sql = sql
+        self.interval = interval
+        self.severity = severity
+        self.mitre_tactic = mitre_tactic
+        self.mitre_technique = mitre_technique
+        self.params = params or {}
+        self.baseline_filter = baseline_filter
+        self.batch_size = batch_size
+
+
+def _outside_business_hours(ts: datetime) -> bool:
+    return not 8 <= ts.hour <= 17 or ts.weekday() >= 5
+
+
+def _unusual_hour(row, verdict: dict) -> bool:
+    """Unusual for the user once their baseline is established, outside business hours before that"""
+    return verdict["unusual_hour"] if verdict["established"] else _outside_business_hours(row.timestamp)
+
+
+def _unusual_country(row, verdict: dict) -> bool:
+    """New country for the user once their baseline is established, outside the allowed list before that"""
+    if verdict["established"]:
+        return verdict["new_country"]
+    return row.geo_country is None or row.geo_country not in ALLOWED_RESOURCE_COUNTRIES
+
+
+SCHEDULED_DETECTIONS = [
+    ScheduledDetection(
+        detection_id="DET-006",
+        alert_name="Privileged Role Assigned Outside Business Hours",
+        sql="""
+            SELECT id, timestamp, "user", ip_address, scenario_type, geo_country, geo_city, device_id, app_name
+            FROM security_events
+            WHERE id > :lo AND id <= :hi
+              AND role_assigned = :assigned
+              AND (detection_id IS NULL OR detection_id != 'DET-006')
+        """,
+        interval=timedelta(minutes=5),
+        severity=SeverityLevel.HIGH,
+        mitre_tactic="Privilege Escalation",
+        mitre_technique="Cloud Account",
+        params={"assigned": True},
+        baseline_filter=_unusual_hour,
+    ),
+    ScheduledDetection(
+        detection_id="DET-007",
+        alert_name="Azure Resource Created from Unusual Location",
+        sql="""
+            SELECT id, timestamp, "user", ip_address, scenario_type, geo_country, geo_city, device_id, app_name
+            FROM security_events
+            WHERE id > :lo AND id <= :hi
+              AND azure_activity = 'RESOURCE_CREATE'
+        """,
+        interval=timedelta(minutes=5),
+        severity=SeverityLevel.MEDIUM,
+        mitre_tactic="Impact",
+        mitre_technique="Resource Hijacking",
+        baseline_filter=_unusual_country,
+    ),
+    ScheduledDetection(
+        detection_id="DET-008",
+        alert_name="Suspicious Policy Change",
+        sql=f"""
+            SELECT id, timestamp, "user", ip_address, scenario_type
+            FROM security_events
+            WHERE id > :lo AND id <= :hi
+              AND azure_activity = 'POLICY_CHANGE'
+              AND (
+                {{hour}} NOT BETWEEN 8 AND 17
+                OR {{weekday}} IN (0, 6)
+                {_UNAUTHORIZED_POLICY_USER}
+              )
+        """,
+        interval=timedelta(minutes=5),
+        severity=SeverityLevel.HIGH,
+        mitre_tactic="Defense Evasion",
+        mitre_technique="Disable or Modify Security Tools",
+        params={"authorized_users": AUTHORIZED_POLICY_USERS} if AUTHORIZED_POLICY_USERS else None,
+    ),
+]
+
+
+def run_detection(db: Session, rule: ScheduledDetection) -> dict:
+    """Evaluate one rule from its watermark to the newest event, batch by batch"""
+    started_at = datetime.utcnow()
+    started = perf_counter()
+    watermark = db.query(DetectionWatermark).filter(
+        DetectionWatermark.detection_id == rule.detection_id
+    ).first()
+    if watermark is None:
+        watermark = DetectionWatermark(detection_id=rule.detection_id, last_event_id=0)
+        db.add(watermark)
+        db.flush()
+    elif watermark.last_event_id and not watermark_valid(db, watermark):
+        logger.warning("Watermark of %s points at a deleted or replaced event %s; re-evaluating from the start",
+                       rule.detection_id, watermark.last_event_id)
+        watermark.last_event_id = 0
+        watermark.last_event_timestamp = None
+
+    watermark_from = watermark.last_event_id or 0
+    rows_scanned = alerts_created = batches = 0
+    error = None
+    statement = _compile(rule, db.get_bind().dialect.name)
+    try:
+        while True:
+            lo = watermark.last_event_id or 0
+            window = db.query(SecurityEvent.id).filter(
+                SecurityEvent.id > lo
+            ).order_by(SecurityEvent.id.asc()).limit(rule.batch_size).subquery()
+            hi, scanned = db.query(func.max(window.c.id), func.count(window.c.id)).one()
+            if not scanned:
+                break
+
+            rows = db.execute(statement, {"lo": lo, "hi": hi, **rule.params}).all()
+            if rule.baseline_filter is not None:
+                rows = _unusual_for_user(db, rule, rows)
+            for row in rows:
+                db.add(Alert(
+                    alert_name=rule.alert_name,
+                    severity=rule.severity,
+                    detection_id=rule.detection_id,
+                    user=row.user,
+                    ip_address=row.ip_address,
+                    timestamp=_as_datetime(row.timestamp),
+                    scenario_type=row.scenario_type,
+                    mitre_tactic=rule.mitre_tactic,
+                    mitre_technique=rule.mitre_technique,
+                ))
+            watermark.last_event_id = hi
+            watermark.last_event_timestamp = db.query(SecurityEvent.timestamp).filter(SecurityEvent.id == hi).scalar()
+            watermark.updated_at = datetime.utcnow()
+            db.commit()
+            rows_scanned += scanned
+            alerts_created += len(rows)
+            batches += 1
+            if scanned < rule.batch_size:
+                break
+    except Exception as exc:
+        db.rollback()
+        error = str(exc)
+        logger.exception("Scheduled detection %s failed", rule.detection_id)
+
+    watermark.last_run_at = started_at
+    db.add(watermark)
+    run = ScheduledDetectionRun(
+        detection_id=rule.detection_id,
+        started_at=started_at,
+        duration_ms=round((perf_counter() - started) * 1000, 2),
+        rows_scanned=rows_scanned,
+        alerts_created=alerts_created,
+        watermark_from=watermark_from,
+        watermark_to=watermark.last_event_id,
+        batches=batches,
+        error=error,
+    )
+    db.add(run)
+    db.commit()
+    if rule_profiler.enabled:
+        profile = rule_profiler.profile(rule.detection_id, "scheduled")
+        profile.evaluations += 1
+        profile.events += rows_scanned
+        profile.hits += alerts_created
+        profile.record_latency(int((perf_counter() - started) * 1e9))
+    # With several workers the stream processor correlates them
+    if alerts_created and leases.SERVER_WORKERS == 1:
+        correlate_pending(db)
+    return serialize_run(run)
+
+
+def watermark_valid(db: Session, watermark: DetectionWatermark) -> bool:
+    """Whether the event the watermark points at still exists and is the one evaluated"""
+    row = db.query(SecurityEvent.timestamp).filter(SecurityEvent.id == watermark.last_event_id).first()
+    if row is None:
+        return False
+    return watermark.last_event_timestamp is None or row.timestamp == watermark.last_event_timestamp
+
+
+def _compile(rule: ScheduledDetection, dialect: str = "sqlite"):
+    """Render the rule's SQL for ``dialect`` and bind list parameters as expanding ``IN`` lists
+
+    Selected event columns are read with their model types.
+    """
+    statement = text(rule.sql.format(**DATE_PARTS.get(dialect, DATE_PARTS["sqlite"])))
+    expanding = [name for name, value in rule.params.items() if isinstance(value, (list, tuple))]
+    if expanding:
+        statement = statement.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    # Dimension columns hold interned ids in encoding mode
+    return statement.columns(**{name: SecurityEvent.__table__.c[name].type for name in DIMENSIONS})
+
+
+def _unusual_for_user(db: Session, rule: ScheduledDetection, rows) -> list:
+    """Candidate rows the rule's baseline filter keeps"""
+    store = ensure_baselines(db)
+    kept = []
+    with store.lock:
+        for row in rows:
+            candidate = SimpleNamespace(**{**row._mapping, "timestamp": _as_datetime(row.timestamp)})
+            if rule.baseline_filter(candidate, store.assess_stored(candidate)):
+                kept.append(row)
+    return kept
+
+
+def _as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def serialize_run(run: ScheduledDetectionRun) -> dict:
+    return {
+        "detection_id": run.detection_id,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "duration_ms": run.duration_ms,
+        "rows_scanned": run.rows_scanned,
+        "alerts_created": run.alerts_created,
+        "watermark_from": run.watermark_from,
+        "watermark_to": run.watermark_to,
+        "batches": run.batches,
+        "error": run.error,
+    }
+
+
+class DetectionScheduler:
+    """Background thread that runs due scheduled detections"""
+
+    def __init__(self, rules: List[ScheduledDetection], tick_seconds: float = SCHEDULER_TICK_SECONDS):
+        self.rules = {r.detection_id: r for r in rules}
+        self.tick_seconds = tick_seconds
+        self._stop = Event()
+        self._thread = None
+        self._run_lock = Lock()
+
+    def is_due(self, db: Session, rule: ScheduledDetection, now: datetime) -> bool:
+        last_run = db.query(DetectionWatermark.last_run_at).filter(
+            DetectionWatermark.detection_id == rule.detection_id
+        ).scalar()
+        return last_run is None or now - last_run >= rule.interval
+
+    def run(self, detection_id: str) -> Optional[dict]:
+        rule = self.rules.get(detection_id)
+        if rule is None:
+            return None
+        with self._run_lock, leases.held(f"scheduled_detection:{detection_id}", RULE_LEASE_SECONDS) as acquired:
+            if not acquired:
+                return {"detection_id": detection_id, "error": "Already running in another worker"}
+            db = SessionLocal()
+            try:
+                return run_detection(db, rule)
+            finally:
+                db.close()
+
+    def run_due(self) -> List[dict]:
+        results = []
+        with self._run_lock:
+            db = SessionLocal()
+            try:
+                now = datetime.utcnow()
+                for rule in self.rules.values():
+                    if not self.is_due(db, rule, now):
+                        continue
+                    with leases.held(f"scheduled_detection:{rule.detection_id}", RULE_LEASE_SECONDS) as acquired:
+                        if acquired:
+                            results.append(run_detection(db, rule))
+            finally:
+                db.close()
+        return results
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if leases.acquire("detection_scheduler", max(SCHEDULER_LEASE_SECONDS, 3 * self.tick_seconds)):
+                    self.run_due()
+            except Exception:
+                logger.exception("Detection scheduler tick failed")
+            self._stop.wait(self.tick_seconds)
+        try:
+            leases.release("detection_scheduler")
+        except Exception:
+            logger.exception("Releasing the detection scheduler lease failed")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="detection-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick_seconds + 1)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+
+detection_scheduler = DetectionScheduler(SCHEDULED_DETECTIONS)
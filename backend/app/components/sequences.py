@@ -0,0 +1,322 @@
+"""
+Multi-stage attack-chain (sequence) detection
+
+Ordered multi-step patterns are compiled into per-user state machines. Each
+active user holds at most one compact partial match per pattern, stored as a
+``(step, started, last_seen, event_ids)`` tuple with epoch-second timestamps.
+Partials that cannot satisfy the next step's maximum gap are evicted through a
+deadline heap, so memory is bounded by the users with a chain in flight. An
+event starting the pattern afresh replaces a pending partial it does not
+advance, so a stale start cannot hide a later chain until it times out.
+"""
+from datetime import datetime, timedelta
+from heapq import heappush, heappop
+from threading import Lock
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Optional
+import sys
+
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent, Alert, SeverityLevel
+from app.components.profiling import RuleProfiler, rule_profiler
+
+EPOCH = datetime(1970, 1, 1)
+NEVER_SAMPLE = (1 << 62) - 1
+
+HIGH_RISK_SCOPES = {"Mail.Read", "Files.Read.All", "offline_access", "User.ReadWrite.All", "Directory.ReadWrite.All"}
+PRIVILEGED_ROLES = {"Global Administrator", "Security Administrator", "User Administrator",
+                    "Billing Administrator", "Exchange Administrator"}
+
+
+class SequenceStep:
+    """One step of a pattern: a predicate and the maximum gap since the previous step"""
+
+    def __init__(self, name: str, predicate: Callable[[SecurityEvent], bool], max_gap: Optional[timedelta] = None):
+        self.name = name
+        self.predicate = predicate
+        self.max_gap = int(max_gap.total_seconds()) if max_gap else None
+
+
+class SequencePattern:
+    """Ordered multi-step pattern raised as a single detection"""
+
+    def __init__(self, detection_id: str, name: str, steps: List[SequenceStep], severity: SeverityLevel,
+                 mitre_tactic: Optional[str] = None, mitre_technique: Optional[str] = None,
+                 scenario_type: Optional[str] = None):
+        if len(steps) < 2:
+            raise ValueError("A sequence pattern needs at least two steps")
+        self.detection_id = detection_id
+        self.name = name
+        self.steps = steps
+        self.severity = severity
+        self.mitre_tactic = mitre_tactic
+        self.mitre_technique = mitre_technique
+        self.scenario_type = scenario_type
+
+
+def _triggered(detection_id: str) -> Callable[[SecurityEvent], bool]:
+    return lambda e: bool(e.detection_triggered) and e.detection_id == detection_id
+
+
+def _high_risk_consent(event: SecurityEvent) -> bool:
+    if not event.oauth_app_name or not event.oauth_scopes:
+        return False
+    return any(s.strip() in HIGH_RISK_SCOPES for s in event.oauth_scopes.split(","))
+
+
+def _privileged_role(event: SecurityEvent) -> bool:
+    return bool(event.role_assigned) and event.role_name in PRIVILEGED_ROLES
+
+
+IDENTITY_TAKEOVER_CHAIN = SequencePattern(
+    detection_id="DET-009",
+    name="Identity Takeover Attack Chain",
+    steps=[
+        SequenceStep("impossible_travel", _triggered("DET-002")),
+        SequenceStep("oauth_high_risk_consent", _high_risk_consent, max_gap=timedelta(hours=24)),
+        SequenceStep("privileged_role_assignment", _privileged_role, max_gap=timedelta(hours=12)),
+    ],
+    severity=SeverityLevel.CRITICAL,
+    mitre_tactic="Privilege Escalation",
+    mitre_technique="Valid Accounts: Cloud Accounts",
+    scenario_type="attack_chain",
+)
+
+DEFAULT_PATTERNS = [IDENTITY_TAKEOVER_CHAIN]
+
+
+class SequenceMatch:
+    """A completed pattern for one user"""
+    __slots__ = ("pattern", "user", "started_at", "completed_at", "event_ids")
+
+    def __init__(self, pattern: SequencePattern, user: str, started: int, completed: int, event_ids: tuple):
+        self.pattern = pattern
+        self.user = user
+        self.started_at = EPOCH + timedelta(seconds=started)
+        self.completed_at = EPOCH + timedelta(seconds=completed)
+        self.event_ids = event_ids
+
+
+class SequenceEngine:
+    """Runs compiled sequence patterns over a time-ordered event stream"""
+
+    def __init__(self, patterns: Optional[List[SequencePattern]] = None, profiler: Optional[RuleProfiler] = None):
+        self.patterns = list(patterns or DEFAULT_PATTERNS)
+        self.clear()
+        self.hit_counts = [0] * len(self.patterns)
+        self._synced_hits = [0] * len(self.patterns)
+        self._synced_events = 0
+        self.events_seen = 0
+        self.matches_emitted = 0
+        self.evicted = 0
+        self.profiler = profiler
+        self.profiles = [profiler.profile(p.detection_id, "sequence") for p in self.patterns] if profiler else None
+        # Events whose ordinal has these low bits clear are timed; a disabled profiler never matches
+        self._sample_mask = profiler.sample_mask if profiler and profiler.enabled else NEVER_SAMPLE
+
+    def clear(self):
+        """Drop every partial match"""
+        # user -> {pattern index: (step, started, last_seen, event_ids)}
+        self.states: Dict[str, Dict[int, tuple]] = {}
+        self.partial_counts = [0] * len(self.patterns)
+        self.deadlines = []
+        self.clock = 0
+
+    def process(self, event: SecurityEvent) -> List[SequenceMatch]:
+        """Advance every pattern for the event's user and return completed chains"""
+        user = event.user
+        if not user or event.timestamp is None:
+            return []
+        ts = int((event.timestamp - EPOCH).total_seconds())
+        self.events_seen += 1
+        if ts > self.clock:
+            self.clock = ts
+            self.evict_expired()
+
+        matches = []
+        user_states = self.states.get(user)
+        # Latency is sampled per event; counters are folded into the profiles on the same beat
+        if not self.events_seen & self._sample_mask:
+            for index, pattern in enumerate(self.patterns):
+                started = perf_counter_ns()
+                user_states = self._advance(index, pattern, user_states, user, event, ts, matches)
+                self.profiles[index].record_latency(perf_counter_ns() - started)
+            self.sync_profiles()
+        else:
+            for index, pattern in enumerate(self.patterns):
+                user_states = self._advance(index, pattern, user_states, user, event, ts, matches)
+
+        if user_states is not None and not user_states:
+            self.states.pop(user, None)
+        self.matches_emitted += len(matches)
+        return matches
+
+    def sync_profiles(self):
+        """Add counters accumulated since the last sync to the rule profiles"""
+        if self.profiles is None:
+            return
+        events = self.events_seen - self._synced_events
+        self._synced_events = self.events_seen
+        for index, profile in enumerate(self.profiles):
+            profile.evaluations += events
+            profile.events += events
+            profile.hits += self.hit_counts[index] - self._synced_hits[index]
+            self._synced_hits[index] = self.hit_counts[index]
+            profile.set_state_size(self.partial_counts[index])
+
+    def _advance(self, index: int, pattern: SequencePattern, user_states: Optional[dict], user: str,
+                 event: SecurityEvent, ts: int, matches: List[SequenceMatch]) -> Optional[dict]:
+        """Run one pattern's state machine for one event"""
+        partial = user_states.get(index) if user_states else None
+        if partial is not None:
+            step, started, last_seen, event_ids = partial
+            gap = pattern.steps[step].max_gap
+            if gap is not None and ts - last_seen > gap:
+                partial = None
+                del user_states[index]
+                self.partial_counts[index] -= 1
+            elif pattern.steps[step].predicate(event):
+                self.hit_counts[index] += 1
+                event_ids = event_ids + (event.id,)
+                if step + 1 == len(pattern.steps):
+                    del user_states[index]
+                    self.partial_counts[index] -= 1
+                    matches.append(SequenceMatch(pattern, user, started, ts, event_ids))
+                else:
+                    user_states[index] = (step + 1, started, ts, event_ids)
+                    self._schedule(pattern, step + 1, ts, user, index)
+                return user_states
+        if pattern.steps[0].predicate(event):
+            # Keep the newest start; a pending partial this event did not advance is replaced
+            self.hit_counts[index] += 1
+            if user_states is None:
+                user_states = self.states.setdefault(user, {})
+            if partial is None:
+                self.partial_counts[index] += 1
+            user_states[index] = (1, ts, ts, (event.id,))
+            self._schedule(pattern, 1, ts, user, index)
+        return user_states
+
+    def _schedule(self, pattern: SequencePattern, step: int, ts: int, user: str, index: int):
+        gap = pattern.steps[step].max_gap
+        if gap is not None:
+            heappush(self.deadlines, (ts + gap, user, index, ts))
+
+    def evict_expired(self, now: Optional[int] = None):
+        """Drop partial matches whose next step can no longer arrive in time"""
+        now = self.clock if now is None else now
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] < now:
+            deadline, user, index, scheduled_at = heappop(deadlines)
+            user_states = self.states.get(user)
+            if not user_states:
+                continue
+            partial = user_states.get(index)
+            gap = self.patterns[index].steps[partial[0]].max_gap if partial is not None else None
+            # Stale heap entries belong to partials that advanced or restarted since scheduling
+            if gap is not None and partial[2] == scheduled_at and deadline == scheduled_at + gap:
+                del user_states[index]
+                self.partial_counts[index] -= 1
+                self.evicted += 1
+                if not user_states:
+                    del self.states[user]
+
+    def user_memory(self, user: str) -> int:
+        """Approximate bytes held for one user's partial matches"""
+        user_states = self.states.get(user)
+        if not user_states:
+            return 0
+        size = sys.getsizeof(user_states)
+        for partial in user_states.values():
+            size += sys.getsizeof(partial) + sys.getsizeof(partial[3])
+        return size
+
+    def stats(self, top: int = 10) -> dict:
+        per_user = sorted(((self.user_memory(u), u) for u in self.states), reverse=True)
+        total = sum(size for size, _ in per_user)
+        return {
+            "patterns": [p.detection_id for p in self.patterns],
+            "active_users": len(per_user),
+            "partial_matches": sum(self.partial_counts),
+            "pending_deadlines": len(self.deadlines),
+            "state_bytes": total,
+            "avg_bytes_per_user": round(total / len(per_user), 1) if per_user else 0,
+            "top_users": [{"user": u, "bytes": size} for size, u in per_user[:top]],
+            "events_seen": self.events_seen,
+            "matches_emitted": self.matches_emitted,
+            "evicted": self.evicted,
+            "clock": (EPOCH + timedelta(seconds=self.clock)).isoformat() if self.clock else None,
+        }
+
+
+def match_to_alert(match: SequenceMatch) -> Alert:
+    pattern = match.pattern
+    return Alert(
+        alert_name=f"{pattern.name} Detected",
+        severity=pattern.severity,
+        detection_id=pattern.detection_id,
+        user=match.user,
+        timestamp=match.completed_at,
+        first_event_at=match.started_at,
+        scenario_type=pattern.scenario_type,
+        mitre_tactic=pattern.mitre_tactic,
+        mitre_technique=pattern.mitre_technique,
+    )
+
+
+sequence_engine = SequenceEngine(profiler=rule_profiler)
+sequence_lock = Lock()
+
+
+def scan_history(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 persist: bool = False, batch_size: int = 5000, profiler: Optional[RuleProfiler] = None) -> dict:
+    """Replay stored events in timestamp order through a fresh engine"""
+    engine = SequenceEngine(sequence_engine.patterns, profiler=profiler)
+    filters = []
+    if start:
+        filters.append(SecurityEvent.timestamp >= start)
+    if end:
+        filters.append(SecurityEvent.timestamp <= end)
+
+    matches = []
+    peak_bytes = 0
+    query = db.query(SecurityEvent).filter(*filters).order_by(
+        SecurityEvent.timestamp.asc(), SecurityEvent.id.asc()
+    ).yield_per(batch_size)
+    for event in query:
+        matches.extend(engine.process(event))
+        if engine.events_seen % batch_size == 0:
+            peak_bytes = max(peak_bytes, engine.stats(top=0)["state_bytes"])
+
+    engine.sync_profiles()
+    created = 0
+    if persist and matches:
+        existing = {
+            (user, detection_id, ts)
+            for user, detection_id, ts in db.query(Alert.user, Alert.detection_id, Alert.timestamp).filter(
+                Alert.detection_id.in_({m.pattern.detection_id for m in matches})
+            ).all()
+        }
+        for match in matches:
+            if (match.user, match.pattern.detection_id, match.completed_at) not in existing:
+                db.add(match_to_alert(match))
+                created += 1
+        db.commit()
+
+    stats = engine.stats(top=0)
+    return {
+        "events_scanned": stats["events_seen"],
+        "alerts_created": created,
+        "peak_state_bytes": max(peak_bytes, stats["state_bytes"]),
+        "matches": [
+            {
+                "detection_id": m.pattern.detection_id,
+                "user": m.user,
+                "started_at": m.started_at.isoformat(),
+                "completed_at": m.completed_at.isoformat(),
+                "event_ids": list(m.event_ids),
+            }
+            for m in matches
+        ],
+    }
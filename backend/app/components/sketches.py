@@ -0,0 +1,321 @@
+"""
+MTTD/MTTR quantile sketches
+
+Detection and response times are summarised in log-bucketed quantile sketches
+(the DDSketch scheme): a value lands in bucket ``ceil(log(v) / log(gamma))``,
+so every quantile estimate is within ``SKETCH_RELATIVE_ACCURACY`` of a real
+value and two sketches merge exactly by adding bucket counts. One sketch is
+kept per metric, day, severity and scenario type in ``latency_sketches``.
+
+Sketches are maintained from a session ``after_flush`` hook, in the same
+transaction as the change: inserting an incident with ``mttd_minutes`` adds to
+the MTTD sketch of its detection day, and resolving an incident (which sets
+``mttr_minutes``) adds to the MTTR sketch of its resolution day. An incident
+absorbed by correlation (``merged_into`` set) takes its values back out of the
+sketches and contributes nothing afterwards; a changed MTTD or severity moves
+the incident's MTTD to its new value and sketch. Percentiles for
+any filter range are computed by merging the matching sketch rows, without
+reading ``incidents``.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import enum
+import json
+import math
+import os
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Incident, LatencySketch
+
+SKETCH_RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+# Values at or below this (in minutes) are counted in the zero bucket
+SKETCH_MIN_VALUE = 1e-3
+
+METRICS = ("mttd", "mttr")
+PERCENTILES = (0.5, 0.9, 0.99)
+
+SketchKey = Tuple[str, datetime, str, str]
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over positive values"""
+
+    __slots__ = ("gamma", "_log_gamma", "zero", "bins", "count", "total", "min", "max")
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.zero = 0
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float, count: int = 1):
+        if value <= SKETCH_MIN_VALUE:
+            self.zero += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def remove(self, value: float, count: int = 1):
+        """Take back values added earlier; min and max remain bounds of what was seen"""
+        if value <= SKETCH_MIN_VALUE:
+            self.zero = max(0, self.zero - count)
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            remaining = self.bins.get(index, 0) - count
+            if remaining > 0:
+                self.bins[index] = remaining
+            else:
+                self.bins.pop(index, None)
+        self.count = max(0, self.count - count)
+        self.total -= value * count
+        if not self.count:
+            self.zero, self.bins, self.total, self.min, self.max = 0, {}, 0.0, None, None
+
+    def merge(self, other: "QuantileSketch"):
+        """Add another sketch built with the same accuracy"""
+        if not other.count:
+            return
+        self.zero += other.zero
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return max(0.0, self.min)
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def dump_bins(self) -> str:
+        return json.dumps({"zero": self.zero, "bins": self.bins})
+
+    def load_row(self, row) -> "QuantileSketch":
+        """Merge a ``latency_sketches`` row (anything with count/total/min_value/max_value/bins)"""
+        state = json.loads(row.bins or "{}")
+        other = QuantileSketch.__new__(QuantileSketch)
+        other.gamma, other._log_gamma = self.gamma, self._log_gamma
+        other.zero = state.get("zero", 0)
+        other.bins = {int(i): n for i, n in state.get("bins", {}).items()}
+        other.count, other.total = row.count or 0, row.total or 0.0
+        other.min, other.max = row.min_value, row.max_value
+        self.merge(other)
+        return self
+
+    def summary(self) -> dict:
+        result = {"count": self.count, "mean": _round(self.mean)}
+        for q in PERCENTILES:
+            result[f"p{round(q * 100)}"] = _round(self.quantile(q))
+        result["max"] = _round(self.max)
+        return result
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def _day(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _key(metric: str, ts: datetime, severity, scenario_type: Optional[str]) -> SketchKey:
+    if isinstance(severity, enum.Enum):
+        severity = severity.name
+    return metric, _day(ts), severity or "", scenario_type or ""
+
+
+def _before_flush(attr, current):
+    """Value an attribute had before the pending change"""
+    deleted = attr.history.deleted
+    return deleted[0] if deleted else current
+
+
+def _observations(incident: Incident, is_new: bool) -> Iterable[Tuple[SketchKey, float]]:
+    """Measurements an incident contributes in this flush"""
+    if incident.merged_into:
+        return
+    if is_new:
+        if incident.mttd_minutes is not None and incident.detected_at:
+            yield _key("mttd", incident.detected_at, incident.severity, incident.scenario_type), incident.mttd_minutes
+        if incident.mttr_minutes is not None:
+            yield _key("mttr", incident.resolved_at or incident.detected_at or datetime.utcnow(),
+                       incident.severity, incident.scenario_type), incident.mttr_minutes
+        return
+    attrs = inspect(incident).attrs
+    if attrs.mttr_minutes.history.added and incident.mttr_minutes is not None:
+        yield _key("mttr", incident.resolved_at or datetime.utcnow(),
+                   incident.severity, incident.scenario_type), incident.mttr_minutes
+    previous = (_before_flush(attrs.mttd_minutes, incident.mttd_minutes),
+                _before_flush(attrs.severity, incident.severity))
+    if previous != (incident.mttd_minutes, incident.severity) and incident.mttd_minutes is not None \
+            and incident.detected_at:
+        yield _key("mttd", incident.detected_at, incident.severity, incident.scenario_type), incident.mttd_minutes
+
+
+def _retractions(incident: Incident) -> Iterable[Tuple[SketchKey, float]]:
+    """Measurements recorded earlier for an incident absorbed in this flush, or whose MTTD or severity changed"""
+    attrs = inspect(incident).attrs
+    history = attrs.merged_into.history
+    absorbed = any(history.added) and not any(history.deleted)
+    if incident.merged_into and not absorbed:
+        return
+    mttd = _before_flush(attrs.mttd_minutes, incident.mttd_minutes)
+    severity = _before_flush(attrs.severity, incident.severity)
+    moved = (mttd, severity) != (incident.mttd_minutes, incident.severity)
+    if mttd is not None and incident.detected_at and (absorbed or moved):
+        yield _key("mttd", incident.detected_at, severity, incident.scenario_type), mttd
+    if absorbed and incident.mttr_minutes is not None and not attrs.mttr_minutes.history.added:
+        yield _key("mttr", incident.resolved_at or incident.detected_at or datetime.utcnow(),
+                   severity, incident.scenario_type), incident.mttr_minutes
+
+
+def record_sketches(connection, observations: Dict[SketchKey, List[float]],
+                    retractions: Optional[Dict[SketchKey, List[float]]] = None):
+    """Add observed values to (and take retracted values out of) their sketch rows, creating rows as needed"""
+    table = LatencySketch.__table__
+    now = datetime.utcnow()
+    retractions = retractions or {}
+    for key in list(observations) + [k for k in retractions if k not in observations]:
+        metric, day, severity, scenario_type = key
+        match = (
+            (table.c.metric == metric) & (table.c.day == day) &
+            (table.c.severity == severity) & (table.c.scenario_type == scenario_type)
+        )
+        row = connection.execute(table.select().where(match).with_for_update()).first()
+        if row is None and key not in observations:
+            continue
+        sketch = QuantileSketch()
+        if row is not None:
+            sketch.load_row(row)
+        for value in observations.get(key, ()):
+            sketch.add(value)
+        for value in retractions.get(key, ()):
+            sketch.remove(value)
+        state = {
+            "count": sketch.count, "total": sketch.total, "min_value": sketch.min, "max_value": sketch.max,
+            "bins": sketch.dump_bins(), "updated_at": now,
+        }
+        if row is None:
+            connection.execute(table.insert().values(
+                metric=metric, day=day, severity=severity, scenario_type=scenario_type, **state
+            ))
+        else:
+            connection.execute(table.update().where(table.c.id == row.id).values(**state))
+
+
+@event.listens_for(Session, "after_flush")
+def _maintain_sketches(session, flush_context):
+    observations = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, Incident):
+            for key, value in _observations(obj, True):
+                observations[key].append(value)
+    retractions = defaultdict(list)
+    for obj in session.dirty:
+        if isinstance(obj, Incident):
+            for key, value in _observations(obj, False):
+                observations[key].append(value)
+            for key, value in _retractions(obj):
+                retractions[key].append(value)
+    if observations or retractions:
+        record_sketches(session.connection(), observations, retractions)
+
+
+def rebuild_latency_sketches(db: Session) -> int:
+    """Recompute every sketch from the unmerged incidents (backfill after bulk loads)"""
+    db.query(LatencySketch).delete()
+    sketches: Dict[SketchKey, QuantileSketch] = defaultdict(QuantileSketch)
+    rows = db.query(
+        Incident.severity, Incident.scenario_type, Incident.detected_at, Incident.resolved_at,
+        Incident.mttd_minutes, Incident.mttr_minutes
+    ).filter(
+        Incident.merged_into.is_(None),
+        (Incident.mttd_minutes.isnot(None)) | (Incident.mttr_minutes.isnot(None))
+    ).execution_options(yield_per=5000)
+    for severity, scenario_type, detected_at, resolved_at, mttd, mttr in rows:
+        if mttd is not None and detected_at:
+            sketches[_key("mttd", detected_at, severity, scenario_type)].add(mttd)
+        if mttr is not None and (resolved_at or detected_at):
+            sketches[_key("mttr", resolved_at or detected_at, severity, scenario_type)].add(mttr)
+
+    now = datetime.utcnow()
+    if sketches:
+        db.execute(LatencySketch.__table__.insert(), [
+            {
+                "metric": metric, "day": day, "severity": severity, "scenario_type": scenario_type,
+                "count": s.count, "total": s.total, "min_value": s.min, "max_value": s.max,
+                "bins": s.dump_bins(), "updated_at": now,
+            }
+            for (metric, day, severity, scenario_type), s in sketches.items()
+        ])
+    db.commit()
+    return len(sketches)
+
+
+def latency_percentiles(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        severity: Optional[str] = None, scenario_type: Optional[str] = None,
+                        group_by: Optional[str] = None) -> dict:
+    """Merged MTTD/MTTR summaries for the matching days, severities and scenarios
+
+    ``start``/``end`` select whole days. ``group_by`` (``severity``,
+    ``scenario_type`` or ``day``) adds a per-group breakdown next to the totals.
+    """
+    filters = []
+    if start:
+        filters.append(LatencySketch.day >= _day(start))
+    if end:
+        filters.append(LatencySketch.day < _day(end) + timedelta(days=1))
+    if severity:
+        filters.append(LatencySketch.severity == severity.upper())
+    if scenario_type:
+        filters.append(LatencySketch.scenario_type == scenario_type)
+
+    totals = {metric: QuantileSketch() for metric in METRICS}
+    groups: Dict[str, Dict[str, QuantileSketch]] = defaultdict(lambda: {m: QuantileSketch() for m in METRICS})
+    rows = db.query(
+        LatencySketch.metric, LatencySketch.day, LatencySketch.severity, LatencySketch.scenario_type,
+        LatencySketch.count, LatencySketch.total, LatencySketch.min_value, LatencySketch.max_value,
+        LatencySketch.bins
+    ).filter(*filters).all()
+    for row in rows:
+        if row.metric not in totals:
+            continue
+        totals[row.metric].load_row(row)
+        if group_by == "day":
+            groups[row.day.date().isoformat()][row.metric].load_row(row)
+        elif group_by in ("severity", "scenario_type"):
+            groups[getattr(row, group_by) or "unknown"][row.metric].load_row(row)
+
+    result = {metric: sketch.summary() for metric, sketch in totals.items()}
+    result["sketches_merged"] = len(rows)
+    if group_by:
+        result["groups"] = [
+            {group_by: name, **{metric: sketch.summary() for metric, sketch in metrics.items()}}
+            for name, metrics in sorted(groups.items())
+        ]
+    return result
@@ -0,0 +1,197 @@
+"""
+Slow-query log
+
+SQLAlchemy cursor hooks time every statement on every engine; statements
+slower than ``SLOW_QUERY_THRESHOLD_MS`` are kept in a bounded ring buffer with
+their normalized text (literals and expanded ``IN`` lists collapsed), the
+shape of their parameters (types, never values), the duration and the route
+of the request that ran them. The first time a normalized statement is slow
+its plan is captured with ``EXPLAIN QUERY PLAN`` (``EXPLAIN`` elsewhere) on
+the same connection, so the plan reflects the indexes and statistics the
+query actually ran against. Per-statement totals are kept alongside the ring
+so repeated offenders remain visible after their entries have rotated out.
+
+The timed span is the DBAPI ``execute`` call. SQLite runs a query up to its
+first result row there, which covers sorting, grouping and index lookups but
+not the time spent fetching the remaining rows.
+"""
+from collections import OrderedDict, deque
+from datetime import datetime
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+import hashlib
+import logging
+import os
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.components.metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "500"))
+SLOW_QUERY_MAX_STATEMENTS = int(os.getenv("SLOW_QUERY_MAX_STATEMENTS", "1000"))
+STATEMENT_TEXT_LIMIT = 4000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_REPEATED_GROUP = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+def normalize(statement: str) -> str:
+    """Statement text with literals replaced by ``?`` and variable-length lists collapsed"""
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("(?, ...)", text)
+    text = _REPEATED_GROUP.sub(r"\1, ...", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _types(parameters) -> list:
+    """Run-length encoded parameter types: ``["str", "int*120", "datetime"]``"""
+    if isinstance(parameters, dict):
+        return [f"{name}:{type(value).__name__}" for name, value in parameters.items()]
+    runs = []
+    for value in parameters or ():
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return [name if count == 1 else f"{name}*{count}" for name, count in runs]
+
+
+def parameter_shape(parameters, executemany: bool) -> dict:
+    if executemany:
+        return {"rows": len(parameters), "types": _types(parameters[0]) if parameters else []}
+    return {"count": len(parameters or ()), "types": _types(parameters)}
+
+
+def explain(dbapi_connection, dialect: str, statement: str, parameters) -> list:
+    """Plan lines for ``statement``, indented by nesting on SQLite"""
+    cursor = dbapi_connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            depth, lines = {0: -1}, []
+            for node_id, parent, _, detail in cursor.fetchall():
+                depth[node_id] = depth.get(parent, -1) + 1
+                lines.append("  " * depth[node_id] + detail)
+            return lines
+        cursor.execute(f"EXPLAIN {statement}", parameters)
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements plus per-statement totals and first plans"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, size: int = SLOW_QUERY_LOG_SIZE,
+                 max_statements: int = SLOW_QUERY_MAX_STATEMENTS):
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self.entries: deque = deque(maxlen=size)
+        self.statements: "OrderedDict[str, dict]" = OrderedDict()
+        self.recorded = 0
+        self._lock = Lock()
+
+    def record(self, conn, statement: str, parameters, executemany: bool, duration_ms: float):
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        now = datetime.utcnow()
+        with self._lock:
+            summary = self.statements.get(key)
+            needs_plan = summary is None
+            if needs_plan:
+                summary = self.statements[key] = {
+                    "fingerprint": key,
+                    "statement": normalized[:STATEMENT_TEXT_LIMIT],
+                    "plan": None,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "first_seen": now.isoformat(),
+                }
+                if len(self.statements) > self.max_statements:
+                    self.statements.popitem(last=False)
+            else:
+                self.statements.move_to_end(key)
+            summary["count"] += 1
+            summary["total_ms"] += duration_ms
+            summary["max_ms"] = max(summary["max_ms"], duration_ms)
+            summary["last_seen"] = now.isoformat()
+            self.entries.append({
+                "at": now.isoformat(),
+                "fingerprint": key,
+                "duration_ms": round(duration_ms, 3),
+                "route": current_route(),
+                "parameters": parameter_shape(parameters, executemany),
+            })
+            self.recorded += 1
+
+        if needs_plan and not executemany and normalized.lstrip("( ").upper().startswith(_EXPLAINABLE):
+            try:
+                plan = explain(conn.connection.dbapi_connection, conn.dialect.name, statement, parameters)
+            except Exception as exc:
+                plan = [f"EXPLAIN failed: {exc}"]
+            summary["plan"] = plan
+
+    def report(self, limit: int = 100, fingerprint: Optional[str] = None) -> dict:
+        with self._lock:
+            entries = [e for e in reversed(self.entries) if fingerprint is None or e["fingerprint"] == fingerprint]
+            statements = sorted(self.statements.values(), key=lambda s: s["total_ms"], reverse=True)
+            if fingerprint is not None:
+                statements = [s for s in statements if s["fingerprint"] == fingerprint]
+            return {
+                "enabled": SLOW_QUERY_LOG_ENABLED,
+                "threshold_ms": self.threshold_ms,
+                "capacity": self.entries.maxlen,
+                "recorded": self.recorded,
+                "entries": entries[:limit],
+                "statements": [
+                    {**s, "total_ms": round(s["total_ms"], 3), "max_ms": round(s["max_ms"], 3)}
+                    for s in statements[:limit]
+                ],
+            }
+
+    def reset(self, threshold_ms: Optional[float] = None):
+        with self._lock:
+            self.entries.clear()
+            self.statements.clear()
+            self.recorded = 0
+            if threshold_ms is not None:
+                self.threshold_ms = threshold_ms
+
+
+slow_query_log = SlowQueryLog()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if SLOW_QUERY_LOG_ENABLED:
+        conn.info.setdefault("slow_query_started", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not SLOW_QUERY_LOG_ENABLED:
+        return
+    duration_ms = (perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+    if duration_ms >= slow_query_log.threshold_ms:
+        try:
+            slow_query_log.record(conn, statement, parameters, executemany, duration_ms)
+        except Exception:
+            logger.exception("Recording slow query failed")
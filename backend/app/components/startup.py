@@ -0,0 +1,105 @@
+"""
+Server startup: worker identity and warm-up
+
+``start_server.py --production`` imports the app once, warms it and then forks
+worker processes that inherit the warmed state copy-on-write. Warm-up loads
+behavioural baselines and the hot tier of recent events, builds the entity
+graph and drives a few hot read routes through the app in process, which
+fills SQLAlchemy's compiled-statement cache, pydantic serializers and the OS
+page cache before the first request.
+When workers import the app themselves (no preload), ``SERVER_WARMUP`` runs
+the same warm-up in each worker's startup hook, before it accepts connections.
+
+``SERVER_WORKER_ID`` is set by the launcher for each forked worker and only
+identifies it in ``/system/startup``; singleton background work (the detection
+scheduler, recovering orphaned response jobs) is coordinated through leases,
+which also covers workers started by uvicorn itself.
+"""
+from datetime import datetime
+from time import perf_counter
+from typing import List, Optional
+import asyncio
+import os
+
+import httpx
+
+from app.models import SessionLocal
+from app.components.baselines import ensure_baselines
+from app.components.graph import ensure_graph
+from app.components.hot_tier import ensure_hot_tier
+from app.components.metrics import registry
+
+SERVER_WARMUP = os.getenv("SERVER_WARMUP", "false").lower() in ("1", "true", "yes")
+WARMUP_GRAPH = os.getenv("WARMUP_GRAPH", "true").lower() in ("1", "true", "yes")
+WARMUP_ROUTES = [
+    r.strip() for r in os.getenv(
+        "WARMUP_ROUTES",
+        "/api/v1/dashboard/kpis,/api/v1/dashboard/alert-trends,/api/v1/dashboard/sign-in-stats,"
+        "/api/v1/dashboard/mfa-stats,/api/v1/incidents,/api/v1/detections,/api/v1/events?limit=50",
+    ).split(",") if r.strip()
+]
+
+startup_state = {
+    "started_at": datetime.utcnow().isoformat(),
+    "schema_created": None,
+    "warmup": None,
+}
+
+
+def worker_id() -> int:
+    return int(os.getenv("SERVER_WORKER_ID", "0"))
+
+
+def warm_caches(graph: bool = WARMUP_GRAPH) -> dict:
+    """Load the in-memory stores that are otherwise built by the first request using them"""
+    timings = {}
+    db = SessionLocal()
+    try:
+        started = perf_counter()
+        ensure_baselines(db)
+        timings["baselines_ms"] = round((perf_counter() - started) * 1000, 1)
+        started = perf_counter()
+        ensure_hot_tier(db)
+        timings["hot_tier_ms"] = round((perf_counter() - started) * 1000, 1)
+        if graph:
+            started = perf_counter()
+            ensure_graph(db)
+            timings["graph_ms"] = round((perf_counter() - started) * 1000, 1)
+    finally:
+        db.close()
+    return timings
+
+
+async def warm_routes(app, routes: Optional[List[str]] = None) -> dict:
+    """Call each route once in process; returns the status and latency of each call"""
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warmup") as client:
+        for route in WARMUP_ROUTES if routes is None else routes:
+            started = perf_counter()
+            response = await client.get(route)
+            results[route] = {"status": response.status_code, "ms": round((perf_counter() - started) * 1000, 1)}
+    return results
+
+
+async def warm_up_async(app, routes: Optional[List[str]] = None, graph: bool = WARMUP_GRAPH) -> dict:
+    started = perf_counter()
+    report = {"caches": await asyncio.to_thread(warm_caches, graph), "routes": await warm_routes(app, routes)}
+    report["total_ms"] = round((perf_counter() - started) * 1000, 1)
+    startup_state["warmup"] = report
+    # Warm-up calls are not traffic
+    registry.reset()
+    return report
+
+
+async def warm_worker(app) -> dict:
+    """In a worker forked from a warmed process: open its own connections and fill SQLite's page cache"""
+    routes = await warm_routes(app)
+    startup_state["worker_warmup"] = routes
+    registry.reset()
+    return routes
+
+
+def warm_up(app, routes: Optional[List[str]] = None, graph: bool = WARMUP_GRAPH) -> dict:
+    """Synchronous warm-up for a launcher process that is not running an event loop"""
+    return asyncio.run(warm_up_async(app, routes, graph))
@@ -0,0 +1,179 @@
+"""
+Stream detection owner for multi-worker servers
+
+Sequence detection and alert correlation keep per-process state (partial
+chains per user, the correlation disjoint-set) that is only correct when it
+sees every event and alert. A single process runs them inline on ingest. When
+the server runs several workers (``SERVER_WORKERS`` > 1, set by
+``start_server.py``), ingest only stores events and the worker holding the
+``stream_processor`` lease runs them: it reads ``security_events`` above its
+persisted watermark in id order, raises sequence alerts and advances the
+watermark in one transaction, then correlates every unlinked alert, including
+those of the scheduled detections. The same transaction persists the user
+baselines the batch updated, so ``user_baselines`` always matches the
+watermark. Another worker takes over within one lease period when the owner
+dies; partial chains in flight in the old owner are lost, and the correlation
+state and baselines are reloaded from the database.
+"""
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Optional
+import logging
+import os
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import SessionLocal, SecurityEvent, Alert, DetectionWatermark
+from app.components import leases
+from app.components.baselines import baseline_store
+from app.components.correlation import correlate_pending, reset_engine
+from app.components.scheduler import watermark_valid
+from app.components.sequences import sequence_engine, sequence_lock, match_to_alert
+
+logger = logging.getLogger(__name__)
+
+# Ingest defers stream detection to the lease holder
+STREAM_OWNER_REQUIRED = leases.SERVER_WORKERS > 1
+STREAM_TICK_SECONDS = float(os.getenv("STREAM_TICK_SECONDS", "1"))
+STREAM_LEASE_SECONDS = float(os.getenv("STREAM_LEASE_SECONDS", "30"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "5000"))
+
+LEASE_NAME = "stream_processor"
+WATERMARK_ID = "stream:sequences"
+
+
+def process_pending(db: Session, batch_size: int = STREAM_BATCH_SIZE) -> dict:
+    """Run stored events above the watermark through the sequence engine, then correlate new alerts"""
+    started = perf_counter()
+    watermark = db.query(DetectionWatermark).filter(DetectionWatermark.detection_id == WATERMARK_ID).first()
+    if watermark is None:
+        # Start at the newest event; history is covered by generate_data.py or a sequence scan
+        newest = db.query(SecurityEvent.id, SecurityEvent.timestamp).order_by(SecurityEvent.id.desc()).first()
+        watermark = DetectionWatermark(detection_id=WATERMARK_ID, last_event_id=newest.id if newest else 0,
+                                       last_event_timestamp=newest.timestamp if newest else None)
+        db.add(watermark)
+        db.commit()
+    elif watermark.last_event_id and not watermark_valid(db, watermark):
+        logger.warning("Stream watermark points at a deleted or replaced event %s; restarting from the start",
+                       watermark.last_event_id)
+        watermark.last_event_id = 0
+        watermark.last_event_timestamp = None
+
+    events = alerts = 0
+    while True:
+        rows = db.query(SecurityEvent).filter(
+            SecurityEvent.id > (watermark.last_event_id or 0)
+        ).order_by(SecurityEvent.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        new_alerts = []
+        with sequence_lock:
+            for event in rows:
+                new_alerts.extend(match_to_alert(m) for m in sequence_engine.process(event))
+        db.add_all(new_alerts)
+        with baseline_store.lock:
+            for event in rows:
+                baseline_store.observe(event)
+            baseline_store.persist(db, commit=False)
+        watermark.last_event_id = rows[-1].id
+        watermark.last_event_timestamp = rows[-1].timestamp
+        watermark.last_run_at = watermark.updated_at = datetime.utcnow()
+        db.commit()
+        events += len(rows)
+        alerts += len(new_alerts)
+        if len(rows) < batch_size:
+            break
+
+    correlation = None
+    newest_alert = db.query(func.max(Alert.id)).scalar() or 0
+    if newest_alert > stream_processor.correlated_through:
+        correlation = correlate_pending(db)
+        stream_processor.correlated_through = newest_alert
+    return {
+        "events": events,
+        "alerts_created": alerts,
+        "watermark": watermark.last_event_id,
+        "incidents_created": correlation["incidents_created"] if correlation else 0,
+        "elapsed_ms": round((perf_counter() - started) * 1000, 2),
+    }
+
+
+class StreamProcessor:
+    """Background thread running stream detection while this worker holds the lease"""
+
+    def __init__(self, tick_seconds: float = STREAM_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.owner = False
+        self.correlated_through = 0
+        self.last_result: Optional[dict] = None
+        self._stop = Event()
+        self._thread = None
+        self._run_lock = Lock()
+
+    def _take_over(self, db: Session):
+        """State built while another worker owned the stream is stale"""
+        with sequence_lock:
+            sequence_engine.clear()
+        reset_engine()
+        baseline_store.reload(db)
+        self.correlated_through = 0
+
+    def run_once(self) -> Optional[dict]:
+        """One tick; None when another worker owns the stream"""
+        with self._run_lock:
+            acquired = leases.acquire(LEASE_NAME, max(STREAM_LEASE_SECONDS, 3 * self.tick_seconds))
+            if not acquired:
+                self.owner = False
+                return None
+            db = SessionLocal()
+            try:
+                if not self.owner:
+                    self._take_over(db)
+                    self.owner = True
+                self.last_result = process_pending(db)
+            finally:
+                db.close()
+            return self.last_result
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Stream processor tick failed")
+            self._stop.wait(self.tick_seconds)
+        if self.owner:
+            try:
+                leases.release(LEASE_NAME)
+            except Exception:
+                logger.exception("Releasing the stream processor lease failed")
+            self.owner = False
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="stream-processor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick_seconds + 1)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def stats(self) -> dict:
+        return {
+            "required": STREAM_OWNER_REQUIRED,
+            "running": self.running,
+            "owner": self.owner,
+            "last_result": self.last_result,
+        }
+
+
+stream_processor = StreamProcessor()
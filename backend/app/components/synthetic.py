@@ -0,0 +1,625 @@
+"""
+Synthetic dataset generation
+
+Produces seeded, reproducible event datasets of any size for load testing. The
+time span is cut into shards of at most ``SHARD_EVENTS`` background events that
+worker processes generate independently. Each shard and each attack scenario
+draws from its own RNG derived from the seed, and user profiles (home location,
+devices, apps) are a pure function of the seed and the user index, so the
+output depends only on the parameters, not on the number of workers.
+
+Workers write their shard without indexes, either to a scratch SQLite file with
+``executemany`` or to CSV/JSONL files. The parent merges the SQLite shards into
+the target database in shard order: ``INSERT ... SELECT`` over ``ATTACH`` on
+SQLite, batched Core inserts elsewhere. In dimension encoding mode the merge
+interns each shard's distinct dimension values first and stores their ids.
+Merging overlaps with generation of the remaining shards. Alert ids are
+assigned on merge by offsetting the shard-local ids past the highest existing
+id. Generated incidents are named ``INC-G<alert id>``, so they cannot collide
+with each other, with earlier datasets or with correlation-created
+``INC-<alert id>`` incidents.
+"""
+from datetime import datetime, timedelta
+from math import ceil
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+import csv
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+from sqlalchemy import DateTime, Enum
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.models import (
+    SecurityEvent, Alert, Incident, RiskLevel, SeverityLevel, SignInResult, MFAResult, AzureActivityType,
+    IncidentStatus, configure_sqlite, DIMENSION_TABLES
+)
+from app.components.dimensions import dimension_cache
+
+USERS = ["alice.johnson@company.com", "bob.smith@company.com", "charlie.brown@company.com",
+         "diana.prince@company.com", "eve.wilson@company.com", "frank.miller@company.com",
+         "grace.lee@company.com", "henry.davis@company.com"]
+
+GEO_LOCATIONS = [
+    {"country": "United States", "city": "New York", "ip": "203.0.113.42"},
+    {"country": "United States", "city": "San Francisco", "ip": "198.51.100.15"},
+    {"country": "United Kingdom", "city": "London", "ip": "203.0.113.89"},
+    {"country": "Germany", "city": "Berlin", "ip": "198.51.100.203"},
+    {"country": "Japan", "city": "Tokyo", "ip": "203.0.113.100"},
+    {"country": "Australia", "city": "Sydney", "ip": "198.51.100.250"},
+]
+
+DEVICE_IDS = ["DEV-001", "DEV-002", "DEV-003", "DEV-004", "DEV-005"]
+APPS = ["Microsoft Office 365", "Azure Portal", "SharePoint Online", "Teams", "Outlook"]
+
+OAUTH_APPS = ["ThirdPartyAnalytics", "CloudBackupService", "MarketingAutomation", "LegacyIntegration"]
+HIGH_RISK_SCOPES = ["Mail.Read", "Files.Read.All", "offline_access", "User.ReadWrite.All", "Directory.ReadWrite.All"]
+LOW_RISK_SCOPES = ["User.Read", "openid", "profile"]
+
+ROLES = ["Global Administrator", "Security Administrator", "User Administrator", "Billing Administrator",
+         "Exchange Administrator"]
+
+SCENARIOS = ("mfa_fatigue", "impossible_travel", "oauth_abuse", "privilege_escalation", "attack_chain")
+DEFAULT_SCENARIO_MIX = {
+    "mfa_fatigue": 3, "impossible_travel": 2, "oauth_abuse": 2, "privilege_escalation": 2, "attack_chain": 1,
+}
+SHARD_EVENTS = 250_000
+FILE_FORMATS = ("csv", "jsonl")
+
+EVENT_COLUMNS = [c.name for c in SecurityEvent.__table__.columns if c.name != "id"]
+ALERT_COLUMNS = [c.name for c in Alert.__table__.columns]
+INCIDENT_COLUMNS = [c.name for c in Incident.__table__.columns if c.name != "id"]
+TABLE_COLUMNS = {"security_events": EVENT_COLUMNS, "alerts": ALERT_COLUMNS, "incidents": INCIDENT_COLUMNS}
+TABLES = {"security_events": SecurityEvent.__table__, "alerts": Alert.__table__, "incidents": Incident.__table__}
+
+_E = {name: i for i, name in enumerate(EVENT_COLUMNS)}
+_MASK = (1 << 64) - 1
+
+
+def _mix(*values: int) -> int:
+    """Deterministic 64-bit hash of integers (splitmix64 rounds)"""
+    x = 0x9E3779B97F4A7C15
+    for value in values:
+        x = (x ^ (value & _MASK)) + 0x9E3779B97F4A7C15 & _MASK
+        x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK
+        x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK
+        x ^= x >> 31
+    return x
+
+
+def _ip(geo: dict, n: int) -> str:
+    return f"{geo['ip'].rsplit('.', 1)[0]}.{n % 254 + 1}"
+
+
+class DatasetSpec:
+    """Parameters of a synthetic dataset; identical specs produce identical data"""
+
+    def __init__(self, seed: int = 42, users: int = len(USERS), events: int = 200, days: float = 7,
+                 end: Optional[datetime] = None, scenario_mix: Optional[Dict[str, int]] = None):
+        unknown = set(scenario_mix or {}) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown scenario types: {', '.join(sorted(unknown))}")
+        self.seed = seed
+        self.users = max(1, users)
+        self.events = max(0, events)
+        self.days = days
+        self.end = end or datetime.utcnow().replace(microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.scenario_mix = dict(DEFAULT_SCENARIO_MIX if scenario_mix is None else scenario_mix)
+        self.shards = max(1, ceil(self.events / SHARD_EVENTS))
+
+    def shard_window(self, shard: int) -> Tuple[datetime, float]:
+        """Start and length in seconds of a shard's time slice"""
+        seconds = (self.end - self.start).total_seconds() / self.shards
+        return self.start + timedelta(seconds=seconds * shard), seconds
+
+    def shard_events(self, shard: int) -> int:
+        base, extra = divmod(self.events, self.shards)
+        return base + (1 if shard < extra else 0)
+
+    def scenario_plan(self) -> List[Tuple[int, str]]:
+        """(scenario number, type) pairs; scenario ``k`` belongs to shard ``k % shards``"""
+        plan = []
+        for scenario_type in SCENARIOS:
+            plan.extend([scenario_type] * self.scenario_mix.get(scenario_type, 0))
+        return list(enumerate(plan))
+
+    def user(self, n: int) -> str:
+        return USERS[n] if n < len(USERS) else f"user{n:07d}@company.com"
+
+    def profile(self, n: int) -> tuple:
+        """Stable per-user (user, home geo, home ip, devices, apps)"""
+        h = _mix(self.seed, n)
+        home = GEO_LOCATIONS[h % len(GEO_LOCATIONS)]
+        devices = (DEVICE_IDS[(h >> 8) % len(DEVICE_IDS)], DEVICE_IDS[(h >> 16) % len(DEVICE_IDS)])
+        apps = (APPS[(h >> 24) % len(APPS)], APPS[(h >> 32) % len(APPS)], APPS[(h >> 40) % len(APPS)])
+        return self.user(n), home, _ip(home, h >> 48), devices, apps
+
+
+def _event(**fields) -> list:
+    row = [None] * len(EVENT_COLUMNS)
+    row[_E["mfa_required"]] = False
+    row[_E["role_assigned"]] = False
+    row[_E["detection_triggered"]] = False
+    for name, value in fields.items():
+        row[_E[name]] = value
+    return row
+
+
+def _background_events(spec: DatasetSpec, shard: int) -> List[list]:
+    """Ordinary sign-in activity for one shard, mostly from each user's home location"""
+    rng = random.Random(_mix(spec.seed, 2, shard))
+    start, seconds = spec.shard_window(shard)
+    count = spec.shard_events(shard)
+    profiles = {}
+    template = _event(scenario_type="normal")
+    (i_ts, i_created, i_user, i_ip, i_country, i_city, i_device, i_compliance, i_app, i_result, i_mfa_required,
+     i_mfa_result, i_risk) = (_E[c] for c in (
+        "timestamp", "created_at", "user", "ip_address", "geo_country", "geo_city", "device_id", "device_compliance",
+        "app_name", "sign_in_result", "mfa_required", "mfa_result", "risk_level"))
+    random_ = rng.random
+    users = spec.users
+    rows = []
+    for offset in sorted(random_() * seconds for _ in range(count)):
+        n = int(users * random_() ** 1.5)  # a few heavy users, a long tail of light ones
+        profile = profiles.get(n)
+        if profile is None:
+            profile = profiles[n] = spec.profile(n)
+        user, home, home_ip, devices, apps = profile
+        row = template[:]
+        row[i_ts] = row[i_created] = start + timedelta(seconds=offset)
+        row[i_user] = user
+        if random_() < 0.92:
+            geo, ip = home, home_ip
+        else:
+            geo = GEO_LOCATIONS[int(random_() * len(GEO_LOCATIONS))]
+            ip = _ip(geo, int(random_() * 254))
+        row[i_ip] = ip
+        row[i_country] = geo["country"]
+        row[i_city] = geo["city"]
+        row[i_device] = devices[0] if random_() < 0.8 else devices[1]
+        row[i_compliance] = "Compliant" if random_() < 0.9 else "NonCompliant"
+        row[i_app] = apps[int(random_() * 3)]
+        r = random_()
+        row[i_result] = SignInResult.FAIL if r < 0.06 else SignInResult.SUCCESS
+        if random_() < 0.6:
+            row[i_mfa_required] = True
+            r = random_()
+            row[i_mfa_result] = MFAResult.TIMEOUT if r < 0.02 else MFAResult.FAIL if r < 0.06 else MFAResult.PASS
+        row[i_risk] = RiskLevel.MEDIUM if random_() < 0.15 else RiskLevel.LOW
+        rows.append(row)
+    return rows
+
+
+def _alert(alert_id: int, name: str, severity: SeverityLevel, detection_id: str, user: str, ip: str,
+           ts: datetime, scenario_type: str, tactic: str, technique: str) -> dict:
+    return {
+        "id": alert_id, "alert_name": name, "severity": severity, "detection_id": detection_id, "user": user,
+        "ip_address": ip, "timestamp": ts, "scenario_type": scenario_type, "mitre_tactic": tactic,
+        "mitre_technique": technique, "status": "new", "created_at": ts,
+    }
+
+
+def _incident(alert: dict, title: str, description: str, mttd_minutes: float) -> dict:
+    return {
+        "incident_id": f"INC-G{alert['id']:07d}", "title": title, "description": description,
+        "severity": alert["severity"], "status": IncidentStatus.OPEN, "scenario_type": alert["scenario_type"],
+        "user": alert["user"], "detection_id": alert["detection_id"], "alert_id": alert["id"],
+        "detected_at": alert["timestamp"], "mttd_minutes": mttd_minutes, "created_at": alert["timestamp"],
+    }
+
+
+def _scenario(spec: DatasetSpec, number: int, scenario_type: str):
+    """Events, alert and incident of one attack scenario"""
+    rng = random.Random(_mix(spec.seed, 1, number))
+    start, seconds = spec.shard_window(number % spec.shards)
+    base = start + timedelta(seconds=rng.random() * max(0.0, seconds - 8 * 3600))
+    user, home, home_ip, devices, apps = spec.profile(rng.randrange(spec.users))
+    alert_id = number + 1
+    common = {"user": user, "scenario_type": scenario_type}
+
+    if scenario_type == "mfa_fatigue":
+        geo = rng.choice(GEO_LOCATIONS)
+        ip = _ip(geo, rng.randrange(254))
+        num_prompts = rng.randint(8, 15)
+        events = [
+            _event(**common, timestamp=base + timedelta(minutes=i * 2), ip_address=ip, geo_country=geo["country"],
+                   geo_city=geo["city"], device_id=rng.choice(DEVICE_IDS), device_compliance="Compliant",
+                   app_name=rng.choice(APPS), sign_in_result=SignInResult.FAIL, mfa_required=True,
+                   mfa_result=rng.choice([MFAResult.FAIL, MFAResult.TIMEOUT]), risk_level=RiskLevel.MEDIUM)
+            for i in range(num_prompts)
+        ]
+        ts = base + timedelta(minutes=num_prompts * 2 + 1)
+        events.append(_event(
+            **common, timestamp=ts, ip_address=ip, geo_country=geo["country"], geo_city=geo["city"],
+            device_id=rng.choice(DEVICE_IDS), device_compliance="Compliant", app_name=rng.choice(APPS),
+            sign_in_result=SignInResult.SUCCESS, mfa_required=True, mfa_result=MFAResult.PASS,
+            risk_level=RiskLevel.HIGH, alert_name="MFA Fatigue Attack Detected", alert_severity=SeverityLevel.HIGH,
+            mitre_tactic="Initial Access", mitre_technique="Multi-Factor Authentication Request Generation",
+            detection_id="DET-001", detection_triggered=True
+        ))
+        alert = _alert(alert_id, "MFA Fatigue Attack Detected", SeverityLevel.HIGH, "DET-001", user, ip, ts,
+                       scenario_type, "Initial Access", "Multi-Factor Authentication Request Generation")
+        incident = _incident(
+            alert, f"MFA Fatigue Attack - {user}",
+            f"User {user} received {num_prompts} MFA prompts with failures/timeouts, followed by successful authentication",
+            rng.uniform(5, 15)
+        )
+        return events, alert, incident
+
+    if scenario_type == "impossible_travel":
+        loc1, loc2 = GEO_LOCATIONS[0], GEO_LOCATIONS[4]
+        ip1, ip2 = _ip(loc1, rng.randrange(254)), _ip(loc2, rng.randrange(254))
+        ts = base + timedelta(minutes=rng.randint(15, 30))
+        events = [
+            _event(**common, timestamp=base, ip_address=ip1, geo_country=loc1["country"], geo_city=loc1["city"],
+                   device_id=rng.choice(DEVICE_IDS), device_compliance="Compliant", app_name=rng.choice(APPS),
+                   sign_in_result=SignInResult.SUCCESS, mfa_required=True, mfa_result=MFAResult.PASS,
+                   risk_level=RiskLevel.LOW),
+            _event(**common, timestamp=ts, ip_address=ip2, geo_country=loc2["country"], geo_city=loc2["city"],
+                   device_id=rng.choice(DEVICE_IDS), device_compliance="Compliant", app_name=rng.choice(APPS),
+                   sign_in_result=SignInResult.SUCCESS, mfa_required=True, mfa_result=MFAResult.PASS,
+                   risk_level=RiskLevel.HIGH, alert_name="Impossible Travel Detected",
+                   alert_severity=SeverityLevel.HIGH, mitre_tactic="Initial Access", mitre_technique="Valid Accounts",
+                   detection_id="DET-002", detection_triggered=True),
+        ]
+        alert = _alert(alert_id, "Impossible Travel Detected", SeverityLevel.HIGH, "DET-002", user, ip2, ts,
+                       scenario_type, "Initial Access", "Valid Accounts")
+        incident = _incident(
+            alert, f"Impossible Travel - {user}",
+            f"User {user} authenticated from {loc1['city']}, {loc1['country']} and then "
+            f"{loc2['city']}, {loc2['country']} within 30 minutes",
+            rng.uniform(10, 25)
+        )
+        return events, alert, incident
+
+    if scenario_type == "oauth_abuse":
+        geo = rng.choice(GEO_LOCATIONS)
+        ip = _ip(geo, rng.randrange(254))
+        app_name = rng.choice(OAUTH_APPS)
+        scopes = ", ".join(rng.sample(HIGH_RISK_SCOPES, 3))
+        events = [_event(
+            **common, timestamp=base, ip_address=ip, geo_country=geo["country"], geo_city=geo["city"],
+            device_id=rng.choice(DEVICE_IDS), oauth_app_name=app_name, oauth_scopes=scopes,
+            risk_level=RiskLevel.MEDIUM, alert_name="OAuth App Consent with High-Risk Scopes",
+            alert_severity=SeverityLevel.MEDIUM, mitre_tactic="Persistence", mitre_technique="Cloud Accounts",
+            detection_id="DET-005", detection_triggered=True
+        )]
+        alert = _alert(alert_id, "OAuth App Consent with High-Risk Scopes", SeverityLevel.MEDIUM, "DET-005", user,
+                       ip, base, scenario_type, "Persistence", "Cloud Accounts")
+        incident = _incident(
+            alert, f"OAuth Consent Abuse - {app_name}",
+            f"User {user} consented to OAuth app '{app_name}' with high-risk scopes: {scopes}",
+            rng.uniform(15, 45)
+        )
+        return events, alert, incident
+
+    if scenario_type == "privilege_escalation":
+        # Outside business hours (2 AM)
+        base = base.replace(hour=2, minute=0, second=0, microsecond=0)
+        geo = rng.choice(GEO_LOCATIONS)
+        ip = _ip(geo, rng.randrange(254))
+        role = rng.choice(ROLES)
+        events = [
+            _event(**common, timestamp=base, ip_address=ip, geo_country=geo["country"], geo_city=geo["city"],
+                   role_assigned=True, role_name=role, risk_level=RiskLevel.HIGH,
+                   alert_name="Privileged Role Assigned Outside Business Hours", alert_severity=SeverityLevel.HIGH,
+                   mitre_tactic="Privilege Escalation", mitre_technique="Cloud Account", detection_id="DET-006",
+                   detection_triggered=True),
+            _event(**common, timestamp=base + timedelta(minutes=10), ip_address=ip, geo_country=geo["country"],
+                   geo_city=geo["city"], azure_activity=AzureActivityType.POLICY_CHANGE, risk_level=RiskLevel.HIGH),
+        ]
+        alert = _alert(alert_id, "Privileged Role Assigned Outside Business Hours", SeverityLevel.HIGH, "DET-006",
+                       user, ip, base, scenario_type, "Privilege Escalation", "Cloud Account")
+        incident = _incident(
+            alert, f"Privilege Escalation - {role} assigned to {user}",
+            f"User {user} was assigned privileged role '{role}' outside business hours, followed by suspicious policy changes",
+            rng.uniform(20, 60)
+        )
+        return events, alert, incident
+
+    # attack_chain: impossible travel -> OAuth consent -> privilege escalation; the sequence scan raises its alert
+    away = GEO_LOCATIONS[4]
+    away_ip = _ip(away, rng.randrange(254))
+    events = [
+        _event(**common, timestamp=base, ip_address=home_ip, geo_country=home["country"], geo_city=home["city"],
+               device_id=devices[0], app_name=rng.choice(APPS), sign_in_result=SignInResult.SUCCESS,
+               risk_level=RiskLevel.LOW),
+        _event(**common, timestamp=base + timedelta(minutes=20), ip_address=away_ip, geo_country=away["country"],
+               geo_city=away["city"], device_id=rng.choice(DEVICE_IDS), app_name=rng.choice(APPS),
+               sign_in_result=SignInResult.SUCCESS, risk_level=RiskLevel.HIGH, alert_name="Impossible Travel Detected",
+               alert_severity=SeverityLevel.HIGH, mitre_tactic="Initial Access", mitre_technique="Valid Accounts",
+               detection_id="DET-002", detection_triggered=True),
+        _event(**common, timestamp=base + timedelta(hours=2), ip_address=away_ip, geo_country=away["country"],
+               geo_city=away["city"], oauth_app_name=rng.choice(OAUTH_APPS),
+               oauth_scopes=", ".join(rng.sample(HIGH_RISK_SCOPES, 3)), risk_level=RiskLevel.MEDIUM),
+        _event(**common, timestamp=base + timedelta(hours=5), ip_address=away_ip, geo_country=away["country"],
+               geo_city=away["city"], role_assigned=True, role_name=rng.choice(ROLES), risk_level=RiskLevel.HIGH),
+    ]
+    return events, None, None
+
+
+def generate_shard(spec: DatasetSpec, shard: int) -> Tuple[List[list], List[dict], List[dict]]:
+    """All events (time-ordered), alerts and incidents of one shard"""
+    events = _background_events(spec, shard)
+    alerts, incidents = [], []
+    for number, scenario_type in spec.scenario_plan():
+        if number % spec.shards != shard:
+            continue
+        scenario_events, alert, incident = _scenario(spec, number, scenario_type)
+        events.extend(scenario_events)
+        if alert:
+            alerts.append(alert)
+            incidents.append(incident)
+    i_ts, i_created = _E["timestamp"], _E["created_at"]
+    for row in events:
+        row[i_created] = row[i_created] or row[i_ts]
+    events.sort(key=lambda row: row[i_ts])
+    return events, alerts, incidents
+
+
+# Shard sinks
+
+def _converter(table, storage: bool) -> callable:
+    """Convert a row list in place, either to SQLite storage values (enum names, fixed-format
+    datetimes) or to the ingest API representation (enum values, ISO datetimes)"""
+    columns = TABLE_COLUMNS[table.name]
+    datetimes = [i for i, name in enumerate(columns) if isinstance(table.c[name].type, DateTime)]
+    enums = [i for i, name in enumerate(columns) if isinstance(table.c[name].type, Enum)]
+
+    def convert(row: list) -> list:
+        for i in datetimes:
+            if row[i] is not None:
+                row[i] = row[i].isoformat(" ", "microseconds") if storage else row[i].isoformat()
+        for i in enums:
+            if row[i] is not None:
+                row[i] = row[i].name if storage else row[i].value
+        return row
+    return convert
+
+
+def _as_lists(rows: list, columns: List[str]) -> list:
+    return [[row.get(c) for c in columns] for row in rows] if rows and isinstance(rows[0], dict) else rows
+
+
+def _write_sqlite_shard(path: str, events: List[list], alerts: List[dict], incidents: List[dict]):
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        for table in TABLES.values():
+            # Plain tables without indexes; the target's indexes are maintained on merge
+            connection.execute(str(CreateTable(table).compile(dialect=sqlite.dialect())))
+        for name, rows in (("security_events", events), ("alerts", alerts), ("incidents", incidents)):
+            columns = TABLE_COLUMNS[name]
+            convert = _converter(TABLES[name], storage=True)
+            connection.executemany(
+                f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                (convert(row) for row in _as_lists(rows, columns))
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _write_file_shard(path: str, fmt: str, events: List[list], alerts: List[dict], incidents: List[dict]):
+    """One file per table, ``<path>.<table>.<fmt>``, in the ingest API representation"""
+    for name, rows in (("security_events", events), ("alerts", alerts), ("incidents", incidents)):
+        columns = TABLE_COLUMNS[name]
+        convert = _converter(TABLES[name], storage=False)
+        with open(f"{path}.{name}.{fmt}", "w", newline="") as handle:
+            if fmt == "csv":
+                csv.writer(handle).writerows(convert(row) for row in _as_lists(rows, columns))
+            else:
+                dumps = json.dumps
+                handle.writelines(
+                    dumps({c: v for c, v in zip(columns, convert(row)) if v is not None}) + "\n"
+                    for row in _as_lists(rows, columns)
+                )
+
+
+def _shard_task(task) -> Tuple[int, str, int, int, int, float]:
+    spec, shard, path, fmt = task
+    started = perf_counter()
+    events, alerts, incidents = generate_shard(spec, shard)
+    if fmt == "sqlite":
+        _write_sqlite_shard(path, events, alerts, incidents)
+    else:
+        _write_file_shard(path, fmt, events, alerts, incidents)
+    return shard, path, len(events), len(alerts), len(incidents), perf_counter() - started
+
+
+# Merging
+
+def _event_select() -> str:
+    """Shard event columns, with dimension values replaced by their ids in encoding mode"""
+    return ", ".join(
+        f"(SELECT id FROM {DIMENSION_TABLES[c].name} WHERE value = e.{c})" if c in DIMENSION_TABLES else f"e.{c}"
+        for c in EVENT_COLUMNS
+    )
+
+
+def _merge_sqlite(connection: sqlite3.Connection, path: str, alert_offset: int):
+    events = ", ".join(EVENT_COLUMNS)
+    alerts = ", ".join(c for c in ALERT_COLUMNS if c != "id")
+    incidents = ", ".join(c for c in INCIDENT_COLUMNS if c not in ("incident_id", "alert_id"))
+    connection.execute("ATTACH DATABASE ? AS shard", (path,))
+    try:
+        connection.execute("BEGIN")
+        for name, table in DIMENSION_TABLES.items():
+            connection.execute(
+                f"INSERT OR IGNORE INTO {table.name} (value) "
+                f"SELECT DISTINCT {name} FROM shard.security_events WHERE {name} IS NOT NULL"
+            )
+        connection.execute(
+            f"INSERT INTO security_events ({events}) "
+            f"SELECT {_event_select()} FROM shard.security_events AS e ORDER BY e.rowid"
+        )
+        connection.execute(
+            f"INSERT INTO alerts (id, {alerts}) SELECT id + ?, {alerts} FROM shard.alerts ORDER BY id",
+            (alert_offset,)
+        )
+        connection.execute(
+            f"INSERT INTO incidents (incident_id, alert_id, {incidents}) "
+            f"SELECT 'INC-G' || printf('%07d', alert_id + ?), alert_id + ?, {incidents} FROM shard.incidents",
+            (alert_offset, alert_offset)
+        )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.execute("DETACH DATABASE shard")
+
+
+def _shard_rows(path: str, name: str, batch_size: int = 10_000) -> Iterator[List[dict]]:
+    table = TABLES[name]
+    columns = TABLE_COLUMNS[name]
+    datetimes = [c for c in columns if isinstance(table.c[c].type, DateTime)]
+    connection = sqlite3.connect(path)
+    try:
+        cursor = connection.execute(f"SELECT {', '.join(columns)} FROM {name} ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            batch = [dict(zip(columns, row)) for row in rows]
+            for row in batch:
+                for c in datetimes:
+                    if row[c] is not None:
+                        row[c] = datetime.fromisoformat(row[c])
+            yield batch
+    finally:
+        connection.close()
+
+
+def _merge_core(engine: Engine, path: str, alert_offset: int):
+    """Copy a shard with batched Core inserts (databases other than SQLite)"""
+    with engine.begin() as connection:
+        for name in ("security_events", "alerts", "incidents"):
+            for batch in _shard_rows(path, name):
+                if name == "alerts":
+                    for row in batch:
+                        row["id"] += alert_offset
+                elif name == "incidents":
+                    for row in batch:
+                        row["alert_id"] += alert_offset
+                        row["incident_id"] = f"INC-G{row['alert_id']:07d}"
+                elif DIMENSION_TABLES:
+                    dimension_cache.intern_rows(connection, batch)
+                connection.execute(TABLES[name].insert(), batch)
+
+
+def _concatenate(output_dir: str, fmt: str, parts: List[str]):
+    for name in TABLES:
+        target = os.path.join(output_dir, f"{name}.{fmt}")
+        with open(target, "wb") as out:
+            if fmt == "csv":
+                out.write((",".join(TABLE_COLUMNS[name]) + "\n").encode())
+            for part in parts:
+                with open(f"{part}.{name}.{fmt}", "rb") as handle:
+                    shutil.copyfileobj(handle, out, 1 << 20)
+
+
+def generate_dataset(spec: DatasetSpec, engine: Optional[Engine] = None, output_dir: Optional[str] = None,
+                     fmt: str = "jsonl", workers: Optional[int] = None, defer_indexes: bool = False) -> dict:
+    """Generate ``spec`` into the database behind ``engine`` or as files in ``output_dir``
+
+    ``defer_indexes`` drops the ``security_events`` indexes for the load and
+    rebuilds them afterwards, also when the load fails, which is much faster
+    for multi-million-row loads into SQLite.
+    """
+    if (engine is None) == (output_dir is None):
+        raise ValueError("Give either a database engine or an output directory")
+    if output_dir is not None and fmt not in FILE_FORMATS:
+        raise ValueError(f"Unknown file format: {fmt}")
+    workers = max(1, min(workers or os.cpu_count() or 1, spec.shards))
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    started = perf_counter()
+    totals = {"events": 0, "alerts": 0, "incidents": 0}
+    generate_seconds = merge_seconds = 0.0
+
+    on_sqlite = engine is not None and engine.dialect.name == "sqlite"
+    scratch = tempfile.mkdtemp(
+        prefix="synthetic-", dir=output_dir or (os.path.dirname(os.path.abspath(engine.url.database)) if on_sqlite else None)
+    )
+    connection = None
+    dropped = []
+    try:
+        alert_offset = 0
+        if engine is not None:
+            with engine.connect() as conn:
+                alert_offset = conn.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM alerts").scalar()
+            if on_sqlite:
+                connection = sqlite3.connect(engine.url.database, isolation_level=None)
+                configure_sqlite(connection)
+                if defer_indexes:
+                    for index in SecurityEvent.__table__.indexes:
+                        connection.execute(f"DROP INDEX IF EXISTS {index.name}")
+                        dropped.append(index)
+
+        tasks = [
+            (spec, shard, os.path.join(scratch, f"shard-{shard:05d}" + (".db" if engine is not None else "")),
+             "sqlite" if engine is not None else fmt)
+            for shard in range(spec.shards)
+        ]
+        parts = []
+        with Pool(workers) as pool:
+            for shard, path, n_events, n_alerts, n_incidents, elapsed in pool.imap(_shard_task, tasks):
+                generate_seconds += elapsed
+                merge_started = perf_counter()
+                if connection is not None:
+                    _merge_sqlite(connection, path, alert_offset)
+                    os.remove(path)
+                elif engine is not None:
+                    _merge_core(engine, path, alert_offset)
+                    os.remove(path)
+                else:
+                    parts.append(path)
+                merge_seconds += perf_counter() - merge_started
+                totals["events"] += n_events
+                totals["alerts"] += n_alerts
+                totals["incidents"] += n_incidents
+
+        if parts:
+            _concatenate(output_dir, fmt, parts)
+        if DIMENSION_TABLES and connection is not None:
+            # Values the raw merge interned bypassed the cache
+            dimension_cache.load()
+    finally:
+        # Rebuilt on failure too, so a failed load never leaves security_events unindexed
+        if dropped:
+            index_started = perf_counter()
+            for index in dropped:
+                connection.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=sqlite.dialect())))
+            # Pooled connections may hold the schema from before the indexes were dropped
+            engine.dispose()
+            merge_seconds += perf_counter() - index_started
+        if connection is not None:
+            connection.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    elapsed = perf_counter() - started
+    return {
+        **totals,
+        "seed": spec.seed,
+        "users": spec.users,
+        "days": spec.days,
+        "start": spec.start.isoformat(),
+        "end": spec.end.isoformat(),
+        "shards": spec.shards,
+        "workers": workers,
+        "target": "database" if engine is not None else os.path.abspath(output_dir),
+        "elapsed_s": round(elapsed, 2),
+        "worker_generate_s": round(generate_seconds, 2),
+        "merge_s": round(merge_seconds, 2),
+        "events_per_s": round(totals["events"] / elapsed) if elapsed else 0,
+    }
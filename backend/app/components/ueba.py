@@ -0,0 +1,255 @@
+"""
+Vectorized UEBA anomaly scoring
+
+Hourly activity is aggregated in SQL to one row per (user, hour) and unpacked
+into dense user-by-hour NumPy matrices, a chunk of users at a time. Every user
+is scored at once against their own history for three signals: sign-in failure
+rate, MFA timeout rate and distinct source IPs. Hours with no activity are NaN
+so quiet periods do not drag baselines to zero. Scores are either robust
+z-scores (median and MAD of the history) or EWMA deviations, and the latest run
+replaces the contents of ``ueba_scores``.
+"""
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Optional, Tuple
+import os
+import warnings
+
+import numpy as np
+from sqlalchemy import func, case, cast, distinct, extract, BigInteger
+from sqlalchemy.orm import Session
+
+from app.models import SecurityEvent, SignInResult, MFAResult, UebaScore
+
+UEBA_LOOKBACK_DAYS = int(os.getenv("UEBA_LOOKBACK_DAYS", "30"))
+UEBA_SCORE_HOURS = int(os.getenv("UEBA_SCORE_HOURS", "24"))
+UEBA_CHUNK_USERS = int(os.getenv("UEBA_CHUNK_USERS", "4096"))
+UEBA_EWMA_SPAN_HOURS = int(os.getenv("UEBA_EWMA_SPAN_HOURS", "168"))
+
+METHODS = ("robust_z", "ewma")
+MAD_TO_SIGMA = 1.4826
+# Smallest spread assumed per signal, so a perfectly flat history does not turn noise into huge scores
+MIN_SCALE = {"failure_rate": 0.05, "mfa_timeout_rate": 0.05, "distinct_ips": 0.5}
+SCORE_COLUMNS = {"failure_rate": "failure_rate_score", "mfa_timeout_rate": "mfa_timeout_score",
+                 "distinct_ips": "distinct_ips_score"}
+
+
+def _row_nanmedian(values: np.ndarray) -> np.ndarray:
+    """Median of each row ignoring NaN (sorting beats ``np.nanmedian`` by several times here)"""
+    ordered = np.sort(values, axis=1)  # NaN sorts last
+    valid = np.count_nonzero(~np.isnan(values), axis=1)
+    rows = np.arange(values.shape[0])
+    lo = np.maximum((valid - 1) // 2, 0)
+    hi = np.maximum(valid // 2, 0)
+    median = (ordered[rows, lo] + ordered[rows, hi]) / 2
+    median[valid == 0] = np.nan
+    return median
+
+
+def _robust_z(history: np.ndarray, current: np.ndarray, min_scale: np.ndarray) -> np.ndarray:
+    center = _row_nanmedian(history)
+    mad = _row_nanmedian(np.abs(history - center[:, None]))
+    return (current - center[:, None]) / np.maximum(MAD_TO_SIGMA * mad, min_scale)[:, None]
+
+
+def _ewma(history: np.ndarray, current: np.ndarray, min_scale: np.ndarray, span: int) -> np.ndarray:
+    alpha = np.float32(2.0 / (span + 1))
+    mean = np.full(history.shape[0], np.nan, dtype=np.float32)
+    var = np.zeros(history.shape[0], dtype=np.float32)
+    # Walk time in contiguous columns; inactive hours leave a user's state untouched
+    for column in np.ascontiguousarray(history.T):
+        active = ~np.isnan(column)
+        np.copyto(mean, column, where=active & np.isnan(mean))
+        diff = np.where(active, column - mean, 0)
+        increment = alpha * diff
+        mean += increment
+        np.copyto(var, (1 - alpha) * (var + diff * increment), where=active)
+    return (current - mean[:, None]) / np.maximum(np.sqrt(var), min_scale)[:, None]
+
+
+def score_matrix(values: np.ndarray, history_buckets: int, method: str = "robust_z",
+                 min_scale=0.0, span: int = UEBA_EWMA_SPAN_HOURS) -> Tuple[np.ndarray, np.ndarray]:
+    """Score the buckets after ``history_buckets`` against each row's history
+
+    Returns the highest score per row across the scored buckets and the value in
+    that bucket; rows without history or without scored activity get NaN.
+    ``min_scale`` is a scalar or one floor per row.
+    """
+    if history_buckets <= 0 or history_buckets >= values.shape[1]:
+        empty = np.full(values.shape[0], np.nan, dtype=values.dtype)
+        return empty, empty.copy()
+    min_scale = np.broadcast_to(np.asarray(min_scale, dtype=np.float32), values.shape[:1])
+    history = values[:, :history_buckets]
+    current = values[:, history_buckets:]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if method == "ewma":
+            scores = _ewma(history, current, min_scale, span)
+        else:
+            scores = _robust_z(history, current, min_scale)
+    masked = np.where(np.isnan(scores), -np.inf, scores)
+    best = np.argmax(masked, axis=1)
+    rows = np.arange(values.shape[0])
+    score = scores[rows, best]
+    return score, np.where(np.isnan(score), np.nan, current[rows, best])
+
+
+def _hourly_activity(db: Session, start: datetime, end: datetime):
+    """One row per active (user, hour) with the counters the signals are derived from"""
+    epoch = extract("epoch", SecurityEvent.timestamp) if db.get_bind().dialect.name == "postgresql" \
+        else func.strftime("%s", SecurityEvent.timestamp)
+    hour = (cast(epoch, BigInteger) // 3600).label("hour")
+    return db.query(
+        SecurityEvent.user,
+        hour,
+        func.count(SecurityEvent.id),
+        func.sum(case((SecurityEvent.sign_in_result.isnot(None), 1), else_=0)),
+        func.sum(case((SecurityEvent.sign_in_result == SignInResult.FAIL, 1), else_=0)),
+        func.sum(case((SecurityEvent.mfa_result.isnot(None), 1), else_=0)),
+        func.sum(case((SecurityEvent.mfa_result == MFAResult.TIMEOUT, 1), else_=0)),
+        func.count(distinct(SecurityEvent.ip_address)),
+    ).filter(
+        SecurityEvent.timestamp >= start,
+        SecurityEvent.timestamp < end,
+        SecurityEvent.user.isnot(None),
+    ).group_by(SecurityEvent.user, hour).all()
+
+
+def _rate(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan).astype(np.float32)
+
+
+def build_chunk(codes: np.ndarray, columns: np.ndarray, counts: np.ndarray, lo: int, hi: int,
+                buckets: int) -> np.ndarray:
+    """Scatter the activity of users ``lo`` to ``hi`` into a dense ``(6, users, buckets)`` counter array
+
+    ``codes`` are the sorted user codes of the activity rows, ``columns`` their
+    hour buckets and ``counts`` the ``(6, rows)`` counters.
+    """
+    a, b = np.searchsorted(codes, [lo, hi])
+    counters = np.zeros((counts.shape[0], hi - lo, buckets), dtype=np.float32)
+    counters[:, codes[a:b] - lo, columns[a:b]] = counts[:, a:b]
+    return counters
+
+
+def score_chunk(counters: np.ndarray, history_buckets: int, method: str) -> dict:
+    """Score one chunk of users from a ``(6, users, buckets)`` counter array
+
+    Counter planes are events, sign-ins, failures, MFA prompts, MFA timeouts
+    and distinct IPs.
+    """
+    events, sign_ins, failures, mfa, timeouts, ips = counters
+    signals = {
+        "failure_rate": _rate(failures, sign_ins),
+        "mfa_timeout_rate": _rate(timeouts, mfa),
+        "distinct_ips": np.where(events > 0, ips, np.nan).astype(np.float32),
+    }
+    # Score all signals as one tall matrix so every NumPy call covers them together
+    users = events.shape[0]
+    min_scale = np.repeat([MIN_SCALE[name] for name in signals], users)
+    score, value = score_matrix(np.concatenate(list(signals.values())), history_buckets, method, min_scale)
+    return {
+        name: (score[i * users:(i + 1) * users], value[i * users:(i + 1) * users])
+        for i, name in enumerate(signals)
+    }
+
+
+def result_rows(names, scored: dict) -> list:
+    """``ueba_scores`` rows for the users of a scored chunk that have a risk score"""
+    risk = np.fmax.reduce([score for score, _ in scored.values()])
+    rows = []
+    for i in np.flatnonzero(~np.isnan(risk)):
+        row = {"user": names[i], "risk_score": _float(risk[i])}
+        for name, (score, value) in scored.items():
+            row[name] = _float(value[i])
+            row[SCORE_COLUMNS[name]] = _float(score[i])
+        rows.append(row)
+    return rows
+
+
+def compute_ueba_scores(db: Session, end: Optional[datetime] = None, lookback_days: int = UEBA_LOOKBACK_DAYS,
+                        score_hours: int = UEBA_SCORE_HOURS, method: str = "robust_z",
+                        chunk_users: int = UEBA_CHUNK_USERS, persist: bool = True) -> dict:
+    """Score every user's latest ``score_hours`` against the preceding history"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown UEBA method: {method}")
+    if score_hours >= lookback_days * 24:
+        raise ValueError("score_hours must be shorter than the lookback window")
+    timings = {}
+    started = perf_counter()
+    end = (end or datetime.utcnow()).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    start = end - timedelta(days=lookback_days)
+    buckets = lookback_days * 24
+    history_buckets = buckets - score_hours
+    first_hour = int((start - datetime(1970, 1, 1)).total_seconds()) // 3600
+
+    rows = _hourly_activity(db, start, end)
+    timings["aggregate_ms"] = round((perf_counter() - started) * 1000, 1)
+
+    results = []
+    build = score = 0.0
+    if rows:
+        step = perf_counter()
+        users, hours, *counts = zip(*rows)
+        names, codes = np.unique(np.array(users, dtype=object), return_inverse=True)
+        columns = np.asarray(hours, dtype=np.int64) - first_hour
+        counts = np.asarray(counts, dtype=np.float32)
+        order = np.argsort(codes, kind="stable")
+        codes, columns, counts = codes[order], columns[order], counts[:, order]
+        build += perf_counter() - step
+        for lo in range(0, len(names), chunk_users):
+            hi = min(lo + chunk_users, len(names))
+            step = perf_counter()
+            counters = build_chunk(codes, columns, counts, lo, hi, buckets)
+            build += perf_counter() - step
+            step = perf_counter()
+            results.extend(result_rows(names[lo:hi], score_chunk(counters, history_buckets, method)))
+            score += perf_counter() - step
+    timings["build_ms"] = round(build * 1000, 1)
+    timings["score_ms"] = round(score * 1000, 1)
+
+    if persist:
+        step = perf_counter()
+        now = datetime.utcnow()
+        window_start = end - timedelta(hours=score_hours)
+        db.query(UebaScore).delete()
+        if results:
+            db.execute(UebaScore.__table__.insert(), [
+                {**r, "window_start": window_start, "window_end": end, "method": method, "computed_at": now}
+                for r in results
+            ])
+        db.commit()
+        timings["write_ms"] = round((perf_counter() - step) * 1000, 1)
+
+    return {
+        "method": method,
+        "window_start": (end - timedelta(hours=score_hours)).isoformat(),
+        "window_end": end.isoformat(),
+        "lookback_days": lookback_days,
+        "activity_rows": len(rows),
+        "users_scored": len(results),
+        "elapsed_ms": round((perf_counter() - started) * 1000, 1),
+        "timings": timings,
+    }
+
+
+def _float(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def serialize_score(score: UebaScore) -> dict:
+    return {
+        "user": score.user,
+        "risk_score": score.risk_score,
+        "failure_rate": score.failure_rate,
+        "failure_rate_score": score.failure_rate_score,
+        "mfa_timeout_rate": score.mfa_timeout_rate,
+        "mfa_timeout_score": score.mfa_timeout_score,
+        "distinct_ips": score.distinct_ips,
+        "distinct_ips_score": score.distinct_ips_score,
+        "method": score.method,
+        "window_start": score.window_start.isoformat() if score.window_start else None,
+        "window_end": score.window_end.isoformat() if score.window_end else None,
+        "computed_at": score.computed_at.isoformat() if score.computed_at else None,
+    }
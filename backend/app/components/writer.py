@@ -0,0 +1,167 @@
+"""
+Group-commit writer
+
+Small writes from many requests are handed to one dedicated writer thread
+instead of each request committing its own transaction. The writer takes the
+first queued write, waits up to ``WRITE_BATCH_DELAY_MS`` for more (at most
+``WRITE_BATCH_MAX``), runs each write in its own SAVEPOINT and commits the whole
+batch once. A failing write rolls back only its savepoint and fails only its
+caller. On SQLite the batch opens with ``BEGIN IMMEDIATE`` so the write lock
+is taken up front rather than contended for by every request, and one fsync
+covers the batch.
+
+A write is a callable taking the writer's session. It must not commit and
+should return plain values: the session is closed before callers resume, so
+returned ORM objects are detached (attributes loaded before the commit remain
+readable).
+"""
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+from typing import Callable, Optional
+import asyncio
+import logging
+import os
+
+from sqlalchemy.orm import Session
+
+from app.models import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+WRITE_COALESCING_ENABLED = os.getenv("WRITE_COALESCING_ENABLED", "true").lower() in ("1", "true", "yes")
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "256"))
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "2"))
+
+_STOP = object()
+
+
+class WriteCoalescer:
+    """Single writer thread committing queued writes in batches"""
+
+    def __init__(self, session_factory=SessionLocal, max_batch: int = WRITE_BATCH_MAX,
+                 max_delay_ms: float = WRITE_BATCH_DELAY_MS):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue: Queue = Queue()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self.commit_seconds = 0.0
+
+    def submit(self, write: Callable[[Session], object]) -> Future:
+        """Queue a write; the future resolves once its batch has committed"""
+        if not self.running:
+            self.start()
+        future: Future = Future()
+        self._queue.put((write, future))
+        return future
+
+    async def run(self, write: Callable[[Session], object]):
+        """Queue a write and wait for its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(write))
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = self._collect(item)
+            try:
+                self._commit_batch(batch)
+            except Exception:
+                logger.exception("Write batch of %d failed", len(batch))
+
+    def _commit_batch(self, batch: list):
+        started = perf_counter()
+        done = []
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            if db.get_bind().dialect.name == "sqlite":
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for write, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with db.begin_nested():
+                        result = write(db)
+                except Exception as exc:
+                    future.set_exception(exc)
+                    self.failed += 1
+                else:
+                    done.append((future, result))
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            for future, _ in done:
+                future.set_exception(exc)
+            self.failed += len(done)
+            raise
+        finally:
+            db.close()
+
+        elapsed = perf_counter() - started
+        with self._lock:
+            self.batches += 1
+            self.writes += len(done)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_seconds += elapsed
+        for future, result in done:
+            future.set_result(result)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = Thread(target=self._loop, name="group-commit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": WRITE_COALESCING_ENABLED,
+                "running": self.running,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "writes": self.writes,
+                "failed": self.failed,
+                "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0,
+                "largest_batch": self.largest_batch,
+                "avg_batch_ms": round(self.commit_seconds * 1000 / self.batches, 3) if self.batches else 0,
+                "max_batch": self.max_batch,
+                "max_delay_ms": self.max_delay * 1000,
+            }
+
+
+write_coalescer = WriteCoalescer()
@@ -3,8 +3,16 @@ Detection Engineering Simulation Dashboard - Main Application
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.models import init_db
-from app.routers import dashboard, detections, events, incidents, response_actions
+from app.models import init_db, SessionLocal
+from app.routers import dashboard, detections, enrichment, events, graph, incidents, live, response_actions, system
+from app.components.scheduler import detection_scheduler, SCHEDULER_ENABLED
+from app.components.baselines import baseline_store
+from app.components.jobs import response_jobs, RESPONSE_JOBS_ENABLED
+from app.components.writer import write_coalescer, WRITE_COALESCING_ENABLED
+from app.components.metrics import MetricsMiddleware, METRICS_ENABLED
+from app.components.live_feed import live_feed, LIVE_FEED_ENABLED
+from app.components.stream import stream_processor, STREAM_OWNER_REQUIRED
+from app.components.startup import startup_state, warm_up_async, warm_worker, SERVER_WARMUP
 
 app = FastAPI(
     title="Detection Engineering Simulation Dashboard API",
@@ -22,15 +30,57 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Initialize database
-init_db()
+# Per-route latency and SQL metrics, served at /api/v1/metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Initialize database; skipped when the stored schema fingerprint matches the models
+startup_state["schema_created"] = init_db()
 
 # Include routers
 app.include_router(dashboard.router, prefix="/api/v1", tags=["Dashboard"])
 app.include_router(detections.router, prefix="/api/v1", tags=["Detections"])
+app.include_router(enrichment.router, prefix="/api/v1", tags=["Enrichment"])
 app.include_router(events.router, prefix="/api/v1", tags=["Events"])
+app.include_router(graph.router, prefix="/api/v1", tags=["Graph"])
 app.include_router(incidents.router, prefix="/api/v1", tags=["Incidents"])
+app.include_router(live.router, prefix="/api/v1", tags=["Live Feed"])
 app.include_router(response_actions.router, prefix="/api/v1", tags=["Response Actions"])
+app.include_router(system.router, prefix="/api/v1", tags=["System"])
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if LIVE_FEED_ENABLED:
+        live_feed.start()
+    if WRITE_COALESCING_ENABLED:
+        write_coalescer.start()
+    # Every worker starts these; leases elect the one scheduler and guard job recovery across workers
+    if SCHEDULER_ENABLED:
+        detection_scheduler.start()
+    if RESPONSE_JOBS_ENABLED:
+        response_jobs.start()
+    if STREAM_OWNER_REQUIRED:
+        stream_processor.start()
+    if startup_state["warmup"] is not None:
+        # Forked from a warmed launcher: in-memory caches are inherited, connections are not
+        await warm_worker(app)
+    elif SERVER_WARMUP:
+        await warm_up_async(app)
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    detection_scheduler.stop()
+    stream_processor.stop()
+    response_jobs.stop()
+    write_coalescer.stop()
+    live_feed.stop()
+    db = SessionLocal()
+    try:
+        baseline_store.persist(db)
+    finally:
+        db.close()
 
 
 @app.get("/")
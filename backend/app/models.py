@@ -1,21 +1,164 @@
 """
 Database models for Detection Engineering Simulation Dashboard
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Boolean, Text, Enum, ForeignKey, JSON
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, DateTime, Float, Boolean, Text, Enum, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+from time import perf_counter
+from starlette.requests import Request
+from app.components.dimensions import DIMENSIONS, Dimension, dimension_cache, dimension_table
 import enum
+import hashlib
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./detection_engineering.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Connection pragmas for SQLite; WAL lets readers proceed while a writer commits
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # negative values are KiB
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+}
+
+# Writes (requests other than GET, the group-commit writer, jobs, scheduler) use a small dedicated pool;
+# GET requests read through a separate, larger pool of read-only connections
+WRITE_POOL_SIZE = int(os.getenv("WRITE_POOL_SIZE", "4"))
+WRITE_MAX_OVERFLOW = int(os.getenv("WRITE_MAX_OVERFLOW", "4"))
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")  # replica for non-SQLite backends
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "16"))
+READ_MAX_OVERFLOW = int(os.getenv("READ_MAX_OVERFLOW", "16"))
+POOL_TIMEOUT_SECONDS = float(os.getenv("POOL_TIMEOUT_SECONDS", "30"))
+READ_ROUTING_ENABLED = os.getenv("READ_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Store the low-cardinality text columns of security_events as ids into dim_<column> tables;
+# switching an existing database between modes requires encode_dimensions.py
+DIMENSION_ENCODING = os.getenv("DIMENSION_ENCODING", "false").lower() in ("1", "true", "yes")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long checkouts wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = {"checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0}
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.wait_stats["timeouts"] += 1
+            raise
+        finally:
+            waited = perf_counter() - started
+            stats = self.wait_stats
+            stats["checkouts"] += 1
+            stats["wait_seconds"] += waited
+            if waited > stats["max_wait_seconds"]:
+                stats["max_wait_seconds"] = waited
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+def _is_file_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") \
+        and not url.database.startswith("file:")
+
+
+def _create_engines(url: str):
+    """(write engine, read engine); the read engine is the write engine when routing is not possible"""
+    url = make_url(url)
+    sqlite_args = {"connect_args": {"check_same_thread": False}} if url.get_backend_name() == "sqlite" else {}
+    if url.get_backend_name() == "sqlite" and not _is_file_sqlite(url):
+        # In-memory databases exist per connection and cannot be shared between pools
+        write = create_engine(url, **sqlite_args)
+        return write, write
+    pool_args = {"poolclass": TimedQueuePool, "pool_timeout": POOL_TIMEOUT_SECONDS}
+    write = create_engine(url, pool_size=WRITE_POOL_SIZE, max_overflow=WRITE_MAX_OVERFLOW, **pool_args,
+                          **sqlite_args)
+    if not READ_ROUTING_ENABLED:
+        return write, write
+    if READ_DATABASE_URL:
+        read_url, read_args = make_url(READ_DATABASE_URL), {}
+    elif _is_file_sqlite(url):
+        # The same file opened read-only through a URI filename
+        path = os.path.abspath(url.database)
+        read_url = url.set(database=f"file:{path}?mode=ro", query={"uri": "true"})
+        read_args = sqlite_args
+    else:
+        read_url = url
+        read_args = {"connect_args": {"options": "-c default_transaction_read_only=on"}} \
+            if url.get_backend_name() == "postgresql" else {}
+    read = create_engine(read_url, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW, **pool_args,
+                         **read_args)
+    return write, read
+
+
+engine, read_engine = _create_engines(DATABASE_URL)
+
+
+def configure_sqlite(dbapi_connection, pragmas: dict = SQLITE_PRAGMAS):
+    """Apply ``pragmas`` to a new SQLite connection; empty values are left at the SQLite default"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value not in (None, ""):
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+# Read-only connections cannot change the journal mode; query_only rejects writes outright
+SQLITE_READ_PRAGMAS = {**{k: v for k, v in SQLITE_PRAGMAS.items() if k != "journal_mode"}, "query_only": "ON"}
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", lambda dbapi_connection, record: configure_sqlite(dbapi_connection))
+if read_engine is not engine and read_engine.dialect.name == "sqlite":
+    event.listen(read_engine, "connect",
+                 lambda dbapi_connection, record: configure_sqlite(dbapi_connection, SQLITE_READ_PRAGMAS))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+def pool_stats() -> dict:
+    """Occupancy and checkout wait times of the write and read pools"""
+    result = {}
+    for name, bound in (("write", engine), ("read", read_engine)):
+        if name == "read" and bound is engine:
+            result[name] = {"shared_with": "write"}
+            continue
+        pool = bound.pool
+        stats = {"pool": type(pool).__name__, "url": bound.url.render_as_string(hide_password=True)}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        wait = getattr(pool, "wait_stats", None)
+        if wait:
+            stats.update({
+                "checkouts": wait["checkouts"],
+                "wait_seconds": round(wait["wait_seconds"], 6),
+                "avg_wait_ms": round(wait["wait_seconds"] * 1000 / wait["checkouts"], 3) if wait["checkouts"] else 0,
+                "max_wait_ms": round(wait["max_wait_seconds"] * 1000, 3),
+                "timeouts": wait["timeouts"],
+            })
+        result[name] = stats
+    return result
+
+
 Base = declarative_base()
 
 
@@ -56,37 +199,46 @@ class IncidentStatus(enum.Enum):
     RESOLVED = "resolved"
 
 
+def _dimension_column(name: str, **kwargs) -> Column:
+    """Interned id column in encoding mode, plain text otherwise"""
+    return Column(Dimension(name) if DIMENSION_ENCODING else String(DIMENSIONS[name]), **kwargs)
+
+
 class SecurityEvent(Base):
     """Security event model with all required fields"""
     __tablename__ = "security_events"
+    __table_args__ = (Index("ix_security_events_user_timestamp", "user", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     user = Column(String(100), index=True)
     ip_address = Column(String(45), index=True)
-    geo_country = Column(String(100), index=True)
-    geo_city = Column(String(100))
+    geo_country = _dimension_column("geo_country", index=True)
+    geo_city = _dimension_column("geo_city")
     device_id = Column(String(100), index=True)
-    device_compliance = Column(String(50))
-    app_name = Column(String(200))
+    device_compliance = _dimension_column("device_compliance")
+    app_name = _dimension_column("app_name")
     sign_in_result = Column(Enum(SignInResult), index=True)
     mfa_required = Column(Boolean, default=False)
     mfa_result = Column(Enum(MFAResult))
     risk_level = Column(Enum(RiskLevel), index=True)
-    oauth_app_name = Column(String(200))
+    oauth_app_name = _dimension_column("oauth_app_name")
     oauth_scopes = Column(Text)  # JSON string or comma-separated
     role_assigned = Column(Boolean, default=False)
-    role_name = Column(String(100))
+    role_name = _dimension_column("role_name")
     azure_activity = Column(Enum(AzureActivityType))
     alert_name = Column(String(200))
     alert_severity = Column(Enum(SeverityLevel))
-    mitre_tactic = Column(String(100))
-    mitre_technique = Column(String(100))
+    mitre_tactic = _dimension_column("mitre_tactic")
+    mitre_technique = _dimension_column("mitre_technique")
     detection_id = Column(String(100), index=True)
     detection_triggered = Column(Boolean, default=False, index=True)
-    scenario_type = Column(String(100), index=True)  # mfa_fatigue, impossible_travel, oauth_abuse, privilege_escalation
+    scenario_type = _dimension_column("scenario_type", index=True)  # mfa_fatigue, impossible_travel, oauth_abuse, privilege_escalation
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Interned by the session before each flush in encoding mode
+    __dimension_columns__ = tuple(DIMENSIONS) if DIMENSION_ENCODING else ()
+
 
 class Detection(Base):
     """Detection rule model"""
@@ -118,6 +270,7 @@ class Alert(Base):
     user = Column(String(100), index=True)
     ip_address = Column(String(45))
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    first_event_at = Column(DateTime, nullable=True)  # Earliest event behind the alert when before timestamp
     scenario_type = Column(String(100), index=True)
     mitre_tactic = Column(String(100))
     mitre_technique = Column(String(100))
@@ -128,6 +281,7 @@ class Alert(Base):
 class Incident(Base):
     """Incident response model"""
     __tablename__ = "incidents"
+    __table_args__ = (Index("ix_incidents_facets", "status", "severity", "scenario_type"),)
 
     id = Column(Integer, primary_key=True, index=True)
     incident_id = Column(String(100), unique=True, index=True)
@@ -146,11 +300,22 @@ class Incident(Base):
     mttd_minutes = Column(Float, nullable=True)  # Mean Time To Detect
     mttr_minutes = Column(Float, nullable=True)  # Mean Time To Respond
     response_actions = Column(Text)  # JSON array of actions taken
+    merged_into = Column(String(100), nullable=True, index=True)  # Survivor incident when absorbed by correlation
     created_at = Column(DateTime, default=datetime.utcnow)
 
     alert = relationship("Alert", foreign_keys=[alert_id])
 
 
+class IncidentAlert(Base):
+    """Incident membership of correlated alerts"""
+    __tablename__ = "incident_alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    incident_id = Column(String(100), ForeignKey("incidents.incident_id"), index=True)
+    alert_id = Column(Integer, ForeignKey("alerts.id"), unique=True, index=True)
+    linked_at = Column(DateTime, default=datetime.utcnow)
+
+
 class ResponseAction(Base):
     """Simulated response actions"""
     __tablename__ = "response_actions"
@@ -165,14 +330,259 @@ class ResponseAction(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+class DetectionWatermark(Base):
+    """Per-rule progress of scheduled SQL detections"""
+    __tablename__ = "detection_watermarks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    detection_id = Column(String(100), unique=True, index=True)
+    last_event_id = Column(Integer, default=0)  # Highest security_events.id already evaluated
+    last_event_timestamp = Column(DateTime, nullable=True)  # Timestamp of that event, to notice a rebuilt table
+    last_run_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 
+class ScheduledDetectionRun(Base):
+    """One execution of a scheduled SQL detection"""
+    __tablename__ = "scheduled_detection_runs"
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
+    id = Column(Integer, primary_key=True, index=True)
+    detection_id = Column(String(100), index=True)
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    duration_ms = Column(Float)
+    rows_scanned = Column(Integer, default=0)
+    alerts_created = Column(Integer, default=0)
+    watermark_from = Column(Integer)
+    watermark_to = Column(Integer)
+    batches = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
+
+class DetectionStats(Base):
+    """Alert counters per detection, maintained on alert insert"""
+    __tablename__ = "detection_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    detection_id = Column(String(100), unique=True, index=True)
+    alert_count = Column(Integer, default=0)
+    last_fired_at = Column(DateTime, nullable=True)
+    example_event_ids = Column(Text)  # JSON array of the most recent triggering event ids
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DetectionAlertBucket(Base):
+    """Hourly alert counts per detection for rolling rates"""
+    __tablename__ = "detection_alert_buckets"
+    __table_args__ = (UniqueConstraint("detection_id", "hour", name="uq_detection_alert_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    detection_id = Column(String(100), index=True)
+    hour = Column(DateTime, index=True)
+    alert_count = Column(Integer, default=0)
+
+
+class LatencySketch(Base):
+    """Mergeable quantile sketch of MTTD or MTTR per day, severity and scenario"""
+    __tablename__ = "latency_sketches"
+    __table_args__ = (
+        UniqueConstraint("metric", "day", "severity", "scenario_type", name="uq_latency_sketch"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    metric = Column(String(10))  # mttd, mttr
+    day = Column(DateTime, index=True)
+    severity = Column(String(20))  # SeverityLevel name
+    scenario_type = Column(String(100))  # Empty string when the incident has none
+    count = Column(Integer, default=0)
+    total = Column(Float, default=0)
+    min_value = Column(Float, nullable=True)
+    max_value = Column(Float, nullable=True)
+    bins = Column(Text)  # JSON: {"zero": n, "bins": {log-bucket index: n}}
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserBaseline(Base):
+    """Persisted behavioural profile of one user"""
+    __tablename__ = "user_baselines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user = Column(String(100), unique=True, index=True)
+    profile = Column(Text)  # JSON: known countries, cities, devices, apps, hour histogram, sign-in counters
+    events_seen = Column(Integer, default=0)
+    last_seen = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UebaScore(Base):
+    """Latest behavioural anomaly scores per user"""
+    __tablename__ = "ueba_scores"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user = Column(String(100), unique=True, index=True)
+    window_start = Column(DateTime)
+    window_end = Column(DateTime)
+    method = Column(String(20))  # robust_z, ewma
+    failure_rate = Column(Float, nullable=True)
+    failure_rate_score = Column(Float, nullable=True)
+    mfa_timeout_rate = Column(Float, nullable=True)
+    mfa_timeout_score = Column(Float, nullable=True)
+    distinct_ips = Column(Float, nullable=True)
+    distinct_ips_score = Column(Float, nullable=True)
+    risk_score = Column(Float, index=True)  # Highest metric score
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IpIntel(Base):
+    """Enrichment of source addresses seen on ingest"""
+    __tablename__ = "ip_intel"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ip_address = Column(String(45), unique=True, index=True)
+    country = Column(String(100), nullable=True)
+    city = Column(String(100), nullable=True)
+    asn = Column(Integer, nullable=True)
+    as_org = Column(String(200), nullable=True)
+    hosting = Column(Boolean, default=False)
+    anonymizer = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ResponseJob(Base):
+    """Queued execution of a response action"""
+    __tablename__ = "response_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), unique=True, index=True)
+    idempotency_key = Column(String(200), unique=True, nullable=True)
+    incident_id = Column(String(100), ForeignKey("incidents.incident_id"), index=True)
+    action_type = Column(String(100))
+    status = Column(String(20), default="queued", index=True)  # queued, running, retrying, succeeded, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON returned by the executor
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    owner = Column(String(100), nullable=True, index=True)  # Process holding the job in its queue
+
+
+class Lease(Base):
+    """Time-limited ownership of singleton background work, shared by all worker processes"""
+    __tablename__ = "leases"
+
+    name = Column(String(100), primary_key=True)
+    owner = Column(String(100))
+    acquired_at = Column(DateTime)
+    expires_at = Column(DateTime)
+
+
+class SchemaVersion(Base):
+    """Fingerprint of the model definitions the database tables were last created from"""
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(40))
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Dimension tables exist only in encoding mode; the cache reads them through the read pool
+DIMENSION_TABLES = {name: dimension_table(Base.metadata, name) for name in DIMENSIONS} if DIMENSION_ENCODING else {}
+dimension_cache.configure(DIMENSION_TABLES, read_engine)
+
+
+def schema_fingerprint(metadata=None) -> str:
+    """Hash of every table's columns, indexes and constraints as declared in the models"""
+    metadata = metadata if metadata is not None else Base.metadata
+    parts = []
+    for name, table in sorted(metadata.tables.items()):
+        if name == SchemaVersion.__tablename__:
+            continue
+        parts.append(name)
+        for column in table.columns:
+            parts.append(f"{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}:{column.unique}")
+        # Sorted text, since index and constraint collections are unordered sets
+        parts.extend(sorted(
+            [f"index:{index.name}:{index.unique}:{','.join(str(e) for e in index.expressions)}"
+             for index in table.indexes]
+            + [f"{type(constraint).__name__}:{constraint.name}:{','.join(constraint.columns.keys())}"
+               for constraint in table.constraints]
+        ))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
+def _check_dimension_mode(bind):
+    """Refuse to start against ``security_events`` stored in the other dimension mode"""
+    inspector = inspect(bind)
+    if not inspector.has_table(SecurityEvent.__tablename__):
+        return
+    column = next((c for c in inspector.get_columns(SecurityEvent.__tablename__) if c["name"] == "geo_country"), None)
+    if column is None:
+        return
+    encoded = isinstance(column["type"], Integer)
+    if encoded != DIMENSION_ENCODING:
+        raise RuntimeError(
+            f"security_events is stored {'with' if encoded else 'without'} dimension encoding but "
+            f"DIMENSION_ENCODING is {'off' if encoded else 'on'}; "
+            f"run encode_dimensions.py --{'decode' if encoded else 'encode'} to convert it"
+        )
+
+
+def _add_missing_columns(bind):
+    """Add nullable columns declared since an existing table was created; ``create_all`` only adds tables"""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable or column.primary_key:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                for index in table.indexes:
+                    if list(index.columns.keys()) == [column.name]:
+                        index.create(connection, checkfirst=True)
+
+
+def init_db(bind=None) -> bool:
+    """Create missing tables and nullable columns unless the stored schema fingerprint already matches the models
+
+    Returns whether schema work ran. The check is a single-row read, so worker
+    processes starting against an up-to-date database skip ``create_all``.
+    """
+    bind = bind if bind is not None else engine
+    fingerprint = schema_fingerprint()
+    try:
+        with bind.connect() as connection:
+            current = connection.execute(
+                SchemaVersion.__table__.select().with_only_columns(SchemaVersion.fingerprint)
+                .where(SchemaVersion.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        current = None  # no schema_version table yet
+    if current == fingerprint:
+        return False
+    _check_dimension_mode(bind)
+    try:
+        Base.metadata.create_all(bind=bind)
+        _add_missing_columns(bind)
+    except SQLAlchemyError:
+        # Workers started side by side race on the same DDL; whatever is still missing is created now
+        Base.metadata.create_all(bind=bind)
+        _add_missing_columns(bind)
+    with bind.begin() as connection:
+        table = SchemaVersion.__table__
+        values = {"fingerprint": fingerprint, "applied_at": datetime.utcnow()}
+        if connection.execute(table.update().where(table.c.id == 1).values(**values)).rowcount == 0:
+            connection.execute(table.insert().values(id=1, **values))
+    return True
+
+
+def get_db(request: Request = None):
+    """Get database session: read-only for GET and HEAD requests, the write pool otherwise"""
+    read = request is not None and request.method in ("GET", "HEAD")
+    db = ReadSessionLocal() if read else SessionLocal()
     try:
         yield db
     finally:
@@ -6,9 +6,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from datetime import datetime, timedelta
 from typing import Optional
-from app.models import get_db, SecurityEvent, Alert, Incident, Detection, RiskLevel, SeverityLevel
+from app.models import get_db, SecurityEvent, Alert, Detection, RiskLevel, SeverityLevel, UebaScore, SignInResult, MFAResult
 from app.schemas import DashboardKPISchema
 from collections import Counter
+from app.components.ueba import compute_ueba_scores, serialize_score, METHODS
+from app.components.sketches import latency_percentiles, rebuild_latency_sketches
+from app.components.hot_tier import hot_tier
 
 router = APIRouter()
 
@@ -76,16 +79,14 @@ async def get_dashboard_kpis(
         Alert.user.isnot(None)
     ).distinct().count()
     
-    # Calculate MTTD and MTTR
-    incidents = db.query(Incident).filter(
-        Incident.detected_at.isnot(None)
-    ).all()
-    
-    mttd_list = [inc.mttd_minutes for inc in incidents if inc.mttd_minutes is not None]
-    mttd = sum(mttd_list) / len(mttd_list) if mttd_list else 0
-    
-    mttr_list = [inc.mttr_minutes for inc in incidents if inc.mttr_minutes is not None]
-    mttr = sum(mttr_list) / len(mttr_list) if mttr_list else 0
+    # MTTD and MTTR from the merged latency sketches (user is not a sketch dimension)
+    latency = latency_percentiles(
+        db,
+        start=datetime.fromisoformat(start_date) if start_date else None,
+        end=datetime.fromisoformat(end_date) if end_date else None,
+        severity=severity,
+        scenario_type=scenario_type,
+    )
     
     # Top MITRE tactics
     tactics = db.query(Alert.mitre_tactic).filter(
@@ -99,12 +100,63 @@ async def get_dashboard_kpis(
         "total_alerts": total_alerts,
         "high_severity_alerts": high_severity_alerts,
         "distinct_impacted_users": distinct_users,
-        "mttd_minutes": round(mttd, 2),
-        "mttr_minutes": round(mttr, 2),
+        "mttd_minutes": latency["mttd"]["mean"] or 0,
+        "mttr_minutes": latency["mttr"]["mean"] or 0,
+        "mttd_percentiles": latency["mttd"],
+        "mttr_percentiles": latency["mttr"],
         "top_tactics": top_tactics
     }
 
 
+@router.get("/dashboard/response-times")
+async def get_response_times(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    scenario_type: Optional[str] = Query(None),
+    severity: Optional[str] = Query(None),
+    group_by: Optional[str] = Query(None, description="severity, scenario_type or day"),
+    db: Session = Depends(get_db)
+):
+    """Get MTTD/MTTR percentiles merged from the latency sketches"""
+    if group_by and group_by not in ("severity", "scenario_type", "day"):
+        return {"error": f"Unknown group_by: {group_by}"}
+    if severity and severity.upper() not in SeverityLevel.__members__:
+        return {"error": f"Unknown severity: {severity}"}
+    return latency_percentiles(
+        db,
+        start=datetime.fromisoformat(start_date) if start_date else None,
+        end=datetime.fromisoformat(end_date) if end_date else None,
+        severity=severity,
+        scenario_type=scenario_type,
+        group_by=group_by,
+    )
+
+
+@router.post("/dashboard/response-times/rebuild")
+def rebuild_response_times(db: Session = Depends(get_db)):
+    """Rebuild the latency sketches from the incidents table"""
+    return {"success": True, "sketches": rebuild_latency_sketches(db)}
+
+
+def _default_window(start_date: Optional[str], end_date: Optional[str]):
+    """(start, end) of a trend query; without an end date the window is at most the last 7 days"""
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    if end is None:
+        week_ago = datetime.utcnow() - timedelta(days=7)
+        start = max(start, week_ago) if start else week_ago
+    return start, end
+
+
+def _window_filters(column, start: Optional[datetime], end: Optional[datetime]) -> list:
+    filters = []
+    if start:
+        filters.append(column >= start)
+    if end:
+        filters.append(column <= end)
+    return filters
+
+
 @router.get("/dashboard/alert-trends")
 async def get_alert_trends(
     start_date: Optional[str] = Query(None),
@@ -112,19 +164,15 @@ async def get_alert_trends(
     db: Session = Depends(get_db)
 ):
     """Get alert trends over time"""
-    filters = []
-    if start_date:
-        filters.append(Alert.timestamp >= datetime.fromisoformat(start_date))
-    if end_date:
-        filters.append(Alert.timestamp <= datetime.fromisoformat(end_date))
-    else:
-        # Default to last 7 days
-        filters.append(Alert.timestamp >= datetime.utcnow() - timedelta(days=7))
-    
+    start, end = _default_window(start_date, end_date)
+    trends = hot_tier.alert_trends(db, start, end)
+    if trends is not None:
+        return trends
+
     alerts = db.query(
         func.date(Alert.timestamp).label('date'),
         func.count(Alert.id).label('count')
-    ).filter(*filters).group_by(func.date(Alert.timestamp)).all()
+    ).filter(*_window_filters(Alert.timestamp, start, end)).group_by(func.date(Alert.timestamp)).all()
     
     return [{"date": str(a.date), "count": a.count} for a in alerts]
 
@@ -136,22 +184,20 @@ async def get_sign_in_stats(
     db: Session = Depends(get_db)
 ):
     """Get sign-in success vs failure statistics"""
-    filters = []
-    if start_date:
-        filters.append(SecurityEvent.timestamp >= datetime.fromisoformat(start_date))
-    if end_date:
-        filters.append(SecurityEvent.timestamp <= datetime.fromisoformat(end_date))
-    else:
-        filters.append(SecurityEvent.timestamp >= datetime.utcnow() - timedelta(days=7))
-    
+    start, end = _default_window(start_date, end_date)
+    stats = hot_tier.sign_in_stats(db, start, end)
+    if stats is not None:
+        return stats
+
+    filters = _window_filters(SecurityEvent.timestamp, start, end)
     success_count = db.query(SecurityEvent).filter(
         *filters,
-        SecurityEvent.sign_in_result == "success"
+        SecurityEvent.sign_in_result == SignInResult.SUCCESS
     ).count()
     
     fail_count = db.query(SecurityEvent).filter(
         *filters,
-        SecurityEvent.sign_in_result == "fail"
+        SecurityEvent.sign_in_result == SignInResult.FAIL
     ).count()
     
     return {
@@ -167,27 +213,25 @@ async def get_mfa_stats(
     db: Session = Depends(get_db)
 ):
     """Get MFA success vs failure statistics"""
-    filters = []
-    if start_date:
-        filters.append(SecurityEvent.timestamp >= datetime.fromisoformat(start_date))
-    if end_date:
-        filters.append(SecurityEvent.timestamp <= datetime.fromisoformat(end_date))
-    else:
-        filters.append(SecurityEvent.timestamp >= datetime.utcnow() - timedelta(days=7))
-    
+    start, end = _default_window(start_date, end_date)
+    stats = hot_tier.mfa_stats(db, start, end)
+    if stats is not None:
+        return stats
+
+    filters = _window_filters(SecurityEvent.timestamp, start, end)
     pass_count = db.query(SecurityEvent).filter(
         *filters,
-        SecurityEvent.mfa_result == "pass"
+        SecurityEvent.mfa_result == MFAResult.PASS
     ).count()
     
     fail_count = db.query(SecurityEvent).filter(
         *filters,
-        SecurityEvent.mfa_result == "fail"
+        SecurityEvent.mfa_result == MFAResult.FAIL
     ).count()
     
     timeout_count = db.query(SecurityEvent).filter(
         *filters,
-        SecurityEvent.mfa_result == "timeout"
+        SecurityEvent.mfa_result == MFAResult.TIMEOUT
     ).count()
     
     return {
@@ -195,3 +239,32 @@ async def get_mfa_stats(
         "fail": fail_count,
         "timeout": timeout_count
     }
+
+
+@router.get("/dashboard/ueba")
+async def get_ueba_scores(
+    limit: int = Query(25, ge=1, le=500),
+    min_score: Optional[float] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get users ranked by behavioural anomaly score from the latest UEBA run"""
+    filters = []
+    if min_score is not None:
+        filters.append(UebaScore.risk_score >= min_score)
+    scores = db.query(UebaScore).filter(*filters).order_by(UebaScore.risk_score.desc()).limit(limit).all()
+    return [serialize_score(s) for s in scores]
+
+
+@router.post("/dashboard/ueba/run")
+def run_ueba_scoring(
+    method: str = Query("robust_z"),
+    lookback_days: int = Query(30, ge=2, le=365),
+    score_hours: int = Query(24, ge=1, le=168),
+    db: Session = Depends(get_db)
+):
+    """Recompute UEBA anomaly scores for all users"""
+    if method not in METHODS:
+        return {"error": f"method must be one of: {', '.join(METHODS)}"}
+    if score_hours >= lookback_days * 24:
+        return {"error": "score_hours must be shorter than lookback_days * 24"}
+    return compute_ueba_scores(db, lookback_days=lookback_days, score_hours=score_hours, method=method)
@@ -3,9 +3,14 @@ Detection rules API endpoints
 """
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
+from datetime import datetime
 from typing import Optional
-from app.models import get_db, Detection, SecurityEvent, Alert
+from app.models import get_db, Detection, SecurityEvent, DetectionStats, DetectionWatermark, ScheduledDetectionRun
 from app.schemas import DetectionSchema
+from app.components.sequences import sequence_engine, sequence_lock, scan_history
+from app.components.scheduler import detection_scheduler, serialize_run
+from app.components.detection_stats import get_all_detection_stats, rebuild_detection_stats
+from app.components.profiling import rule_profiler
 
 router = APIRouter()
 
@@ -20,6 +25,107 @@ async def get_detections(db: Session = Depends(get_db)):
     ]
 
 
+@router.get("/detections/stats")
+async def get_detection_stats(db: Session = Depends(get_db)):
+    """Get alert counts, last-fired time, 24h/7d rates and example events for every rule"""
+    return get_all_detection_stats(db)
+
+
+@router.post("/detections/stats/rebuild")
+def rebuild_stats(db: Session = Depends(get_db)):
+    """Recompute detection counters from the alerts table"""
+    return {"detections": rebuild_detection_stats(db)}
+
+
+@router.get("/detections/profile")
+async def get_rule_profile(sort_by: str = Query("estimated_total_ms")):
+    """Get per-detection evaluation cost: events, hits, state size and latency"""
+    with sequence_lock:
+        sequence_engine.sync_profiles()
+    return {
+        "enabled": rule_profiler.enabled,
+        "sample_every": rule_profiler.sample_mask + 1,
+        "rules": rule_profiler.report(sort_by=sort_by),
+    }
+
+
+@router.post("/detections/profile/reset")
+async def reset_rule_profile():
+    """Clear collected rule profiles"""
+    rule_profiler.reset()
+    return {"success": True}
+
+
+@router.get("/detections/sequences/state")
+async def get_sequence_state(top: int = Query(10, ge=1, le=100)):
+    """Get live sequence-engine state and memory held per active user"""
+    with sequence_lock:
+        return sequence_engine.stats(top=top)
+
+
+@router.post("/detections/sequences/scan")
+async def scan_sequences(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    persist: bool = Query(False),
+    db: Session = Depends(get_db)
+):
+    """Run sequence patterns over stored event history"""
+    return scan_history(
+        db,
+        start=datetime.fromisoformat(start_date) if start_date else None,
+        end=datetime.fromisoformat(end_date) if end_date else None,
+        persist=persist
+    )
+
+
+@router.get("/detections/scheduled")
+async def get_scheduled_detections(db: Session = Depends(get_db)):
+    """Get scheduled SQL detections with their watermarks"""
+    watermarks = {
+        w.detection_id: w
+        for w in db.query(DetectionWatermark).filter(
+            DetectionWatermark.detection_id.in_(list(detection_scheduler.rules))
+        ).all()
+    }
+    result = []
+    for rule in detection_scheduler.rules.values():
+        watermark = watermarks.get(rule.detection_id)
+        result.append({
+            "detection_id": rule.detection_id,
+            "alert_name": rule.alert_name,
+            "interval_seconds": int(rule.interval.total_seconds()),
+            "last_event_id": watermark.last_event_id if watermark else 0,
+            "last_run_at": watermark.last_run_at.isoformat() if watermark and watermark.last_run_at else None,
+        })
+    return {"running": detection_scheduler.running, "detections": result}
+
+
+@router.get("/detections/scheduled/runs")
+async def get_scheduled_runs(
+    detection_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Get recent scheduled detection runs with duration and scanned-row counts"""
+    filters = []
+    if detection_id:
+        filters.append(ScheduledDetectionRun.detection_id == detection_id)
+    runs = db.query(ScheduledDetectionRun).filter(*filters).order_by(
+        ScheduledDetectionRun.id.desc()
+    ).limit(limit).all()
+    return [serialize_run(r) for r in runs]
+
+
+@router.post("/detections/scheduled/{detection_id}/run")
+async def run_scheduled_detection(detection_id: str):
+    """Run a scheduled detection immediately"""
+    result = detection_scheduler.run(detection_id)
+    if result is None:
+        return {"error": "Scheduled detection not found"}
+    return result
+
+
 @router.get("/detections/{detection_id}")
 async def get_detection(detection_id: str, db: Session = Depends(get_db)):
     """Get a specific detection rule"""
@@ -33,8 +139,10 @@ async def get_detection(detection_id: str, db: Session = Depends(get_db)):
         SecurityEvent.detection_triggered == True
     ).limit(5).all()
     
-    # Get alert count
-    alert_count = db.query(Alert).filter(Alert.detection_id == detection_id).count()
+    # Get alert count from the materialized counters
+    alert_count = db.query(DetectionStats.alert_count).filter(
+        DetectionStats.detection_id == detection_id
+    ).scalar() or 0
     
     result = {c.name: getattr(detection, c.name) for c in detection.__table__.columns}
     # Convert enum values to strings
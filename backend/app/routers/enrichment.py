@@ -0,0 +1,49 @@
+"""
+IP enrichment API endpoints
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import List
+from app.models import get_db, IpIntel
+from app.components.enrichment import ip_enricher
+
+router = APIRouter()
+
+MAX_BULK_LOOKUP = 10000
+
+
+@router.get("/enrichment/stats")
+async def get_enrichment_stats():
+    """Get range database and cache statistics"""
+    return ip_enricher.stats()
+
+
+@router.post("/enrichment/reload")
+async def reload_ranges():
+    """Reload the IP range database file"""
+    try:
+        ip_enricher.load()
+    except (OSError, ValueError) as exc:
+        return {"error": str(exc)}
+    return ip_enricher.stats()
+
+
+@router.post("/enrichment/ip/lookup")
+async def lookup_ips(ips: List[str]):
+    """Resolve a batch of IP addresses"""
+    if len(ips) > MAX_BULK_LOOKUP:
+        return {"error": f"At most {MAX_BULK_LOOKUP} addresses per request"}
+    return ip_enricher.lookup_many(ips)
+
+
+@router.get("/enrichment/ip/{ip}")
+async def lookup_ip(ip: str, db: Session = Depends(get_db)):
+    """Resolve one IP address, with the stored intel record if it was seen on ingest"""
+    intel = ip_enricher.lookup(ip)
+    seen = db.query(IpIntel).filter(IpIntel.ip_address == ip).first()
+    return {
+        "ip_address": ip,
+        "intel": intel,
+        "seen_on_ingest": seen is not None,
+        "last_enriched_at": seen.updated_at.isoformat() if seen and seen.updated_at else None,
+    }
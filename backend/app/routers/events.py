@@ -5,8 +5,11 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 from app.models import get_db, SecurityEvent
+from app.schemas import SecurityEventIn
+from app.components.ingest import ingest_events, ingest_events_coalesced
+from app.components.writer import WRITE_COALESCING_ENABLED
 
 router = APIRouter()
 
@@ -53,6 +56,14 @@ async def get_events(
     }
 
 
+@router.post("/events/ingest")
+async def ingest(events: List[SecurityEventIn], db: Session = Depends(get_db)):
+    """Ingest security events and run stream detections over them"""
+    if WRITE_COALESCING_ENABLED:
+        return await ingest_events_coalesced(db, events)
+    return ingest_events(db, events)
+
+
 @router.get("/events/timeline")
 async def get_timeline_events(
     scenario_type: Optional[str] = Query(None),
@@ -0,0 +1,53 @@
+"""
+Entity graph API endpoints
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from time import perf_counter
+from app.models import get_db
+from app.components.graph import NODE_KINDS, ensure_graph, build_graph
+
+router = APIRouter()
+
+MAX_FAN_OUT = 200
+
+
+@router.get("/graph/neighbors")
+async def get_neighbors(
+    kind: str = Query(..., description="user, ip, device, oauth_app or country"),
+    value: str = Query(...),
+    hops: int = Query(1, ge=1, le=2),
+    limit: int = Query(25, ge=1, le=MAX_FAN_OUT, description="Neighbours taken per expanded node"),
+    neighbor_kind: Optional[str] = Query(None, description="Comma-separated kinds to return"),
+    order: str = Query("count", description="count or last_seen"),
+    db: Session = Depends(get_db)
+):
+    """Get 1- or 2-hop neighbours of an entity"""
+    kinds = [k.strip() for k in neighbor_kind.split(",") if k.strip()] if neighbor_kind else None
+    unknown = [k for k in [kind] + (kinds or []) if k not in NODE_KINDS]
+    if unknown:
+        return {"error": f"Unknown entity kind: {', '.join(unknown)}"}
+    if order not in ("count", "last_seen"):
+        return {"error": "order must be 'count' or 'last_seen'"}
+
+    graph = ensure_graph(db)
+    started = perf_counter()
+    with graph.lock:
+        result = graph.neighbors(kind, value, hops=hops, limit=limit, kinds=kinds, order=order)
+    if result is None:
+        return {"error": "Entity not found"}
+    result["elapsed_ms"] = round((perf_counter() - started) * 1000, 3)
+    return result
+
+
+@router.get("/graph/stats")
+async def get_graph_stats(db: Session = Depends(get_db)):
+    """Get entity graph size"""
+    return ensure_graph(db).stats()
+
+
+@router.post("/graph/rebuild")
+async def rebuild_graph(db: Session = Depends(get_db)):
+    """Rebuild the entity graph from stored events"""
+    return build_graph(db)
@@ -3,63 +3,127 @@ Incidents API endpoints
 """
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
+from sqlalchemy import func, distinct, select, and_, or_
+from datetime import datetime
 from typing import Optional
-from app.models import get_db, Incident, Alert, IncidentStatus, SeverityLevel
+from app.models import get_db, Incident, Alert, IncidentAlert, SecurityEvent, IncidentStatus, SeverityLevel
+from app.components.correlation import correlate_pending
+from app.components.stream import stream_processor, STREAM_OWNER_REQUIRED
+from app.components.baselines import ensure_baselines, rebuild_baselines
+import enum
 import json
 
 router = APIRouter()
 
 
+INCIDENT_COLUMNS = [c.name for c in Incident.__table__.columns]
+FACETS = ("status", "severity", "scenario_type")
+
+
+def _incident_dict(incident: Incident) -> dict:
+    item = {}
+    for name in INCIDENT_COLUMNS:
+        value = getattr(incident, name)
+        item[name] = value.value if isinstance(value, enum.Enum) else value
+    return item
+
+
+def _parse_enum(enum_class, value: str):
+    """Accept an enum member by name or by value, case-insensitively"""
+    try:
+        return enum_class[value.upper()]
+    except KeyError:
+        try:
+            return enum_class(value.lower())
+        except ValueError:
+            return None
+
+
+def _facet_counts(db: Session, selected: dict):
+    """Facet counts by status, severity and scenario type from one grouped query
+
+    Each facet counts incidents matching every filter except its own, so the
+    queue can show how many incidents picking another value would yield.
+    """
+    rows = db.query(
+        Incident.status, Incident.severity, Incident.scenario_type, func.count(Incident.id)
+    ).filter(Incident.merged_into.is_(None)).group_by(
+        Incident.status, Incident.severity, Incident.scenario_type
+    ).all()
+    counts = {name: {} for name in FACETS}
+    total = 0
+    for status, severity, scenario_type, count in rows:
+        values = dict(zip(FACETS, (status, severity, scenario_type)))
+        misses = [name for name, wanted in selected.items() if wanted is not None and values[name] != wanted]
+        if not misses:
+            total += count
+        for name in FACETS:
+            if all(miss == name for miss in misses):
+                value = values[name]
+                key = value.value if isinstance(value, enum.Enum) else value
+                counts[name][key] = counts[name].get(key, 0) + count
+    facets = {
+        name: [{"value": v, "count": n} for v, n in sorted(c.items(), key=lambda item: item[1], reverse=True)]
+        for name, c in counts.items()
+    }
+    return facets, total
+
+
 @router.get("/incidents")
 async def get_incidents(
     status: Optional[str] = Query(None),
     severity: Optional[str] = Query(None),
     scenario_type: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
-    """Get all incidents with optional filters"""
-    filters = []
+    """Get one page of the incident queue, newest first, with facet counts"""
+    selected = {"status": None, "severity": None, "scenario_type": scenario_type or None}
     if status:
-        # Convert string to enum if needed
-        try:
-            status_enum = IncidentStatus[status.upper()]
-            filters.append(Incident.status == status_enum)
-        except:
-            # Try as value instead
-            try:
-                status_enum = IncidentStatus(status.lower())
-                filters.append(Incident.status == status_enum)
-            except:
-                filters.append(Incident.status == status)
+        selected["status"] = _parse_enum(IncidentStatus, status)
+        if selected["status"] is None:
+            return {"error": f"Unknown status: {status}"}
     if severity:
-        try:
-            severity_enum = SeverityLevel[severity.upper()]
-            filters.append(Incident.severity == severity_enum)
-        except:
-            filters.append(Incident.severity == severity)
-    if scenario_type:
-        filters.append(Incident.scenario_type == scenario_type)
-    
-    incidents = db.query(Incident).filter(*filters).order_by(
-        Incident.detected_at.desc()
-    ).all()
-    
-    # Convert enum values to strings for JSON serialization
-    result = []
-    for i in incidents:
-        item = {}
-        for c in i.__table__.columns:
-            value = getattr(i, c.name)
-            # Convert enum to string
-            if hasattr(value, 'value'):
-                item[c.name] = value.value
-            elif hasattr(value, 'name'):
-                item[c.name] = value.name
-            else:
-                item[c.name] = value
-        result.append(item)
-    
-    return result
+        selected["severity"] = _parse_enum(SeverityLevel, severity)
+        if selected["severity"] is None:
+            return {"error": f"Unknown severity: {severity}"}
+
+    filters = [getattr(Incident, name) == value for name, value in selected.items() if value is not None]
+    filters.append(Incident.merged_into.is_(None))
+    if cursor:
+        decoded = _decode_cursor(cursor)
+        if decoded is None:
+            return {"error": "Invalid cursor"}
+        filters.append(_after_cursor(Incident.detected_at, Incident.id, *decoded))
+
+    rows = db.query(Incident).filter(*filters).order_by(
+        Incident.detected_at.desc().nulls_last(), Incident.id.desc()
+    ).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_cursor(page[-1].detected_at, page[-1].id)
+
+    facets, total = _facet_counts(db, selected)
+    return {
+        "items": [_incident_dict(i) for i in page],
+        "next_cursor": next_cursor,
+        "total": total,
+        "facets": facets,
+    }
+
+
+@router.post("/incidents/correlate")
+async def correlate_incidents(db: Session = Depends(get_db)):
+    """Group alerts that are not yet linked to an incident into correlated incidents"""
+    if STREAM_OWNER_REQUIRED:
+        # Only the stream owner's engine holds the current clusters
+        result = stream_processor.run_once()
+        if result is None:
+            return {"error": "Correlation runs in the worker owning the event stream; new alerts are linked there"}
+        return result
+    return correlate_pending(db)
 
 
 @router.get("/incidents/{incident_id}")
@@ -82,91 +146,266 @@ async def get_incident(incident_id: str, db: Session = Depends(get_db)):
     return result
 
 
-@router.get("/users/{user}/investigation")
-async def get_user_investigation(user: str, db: Session = Depends(get_db)):
-    """Get comprehensive investigation data for a user"""
-    from app.models import SecurityEvent
-    
-    # Get all events for user
-    events = db.query(SecurityEvent).filter(
-        SecurityEvent.user == user
-    ).order_by(SecurityEvent.timestamp.desc()).all()
-    
-    # Get alerts for user
-    alerts = db.query(Alert).filter(
-        Alert.user == user
-    ).order_by(Alert.timestamp.desc()).all()
-    
-    # Get incidents for user
-    incidents = db.query(Incident).filter(
-        Incident.user == user
-    ).order_by(Incident.detected_at.desc()).all()
-    
-    # Extract unique IPs, devices, apps, OAuth apps
-    unique_ips = list(set([e.ip_address for e in events if e.ip_address]))
-    unique_devices = list(set([e.device_id for e in events if e.device_id]))
-    unique_apps = list(set([e.app_name for e in events if e.app_name]))
-    unique_oauth = list(set([e.oauth_app_name for e in events if e.oauth_app_name]))
-    
-    # Get role changes
-    role_changes = [e for e in events if e.role_assigned]
-    
-    # Get OAuth consents
-    oauth_consents = [e for e in events if e.oauth_app_name]
-    
-    # Get geolocation changes
-    geo_changes = []
-    seen_locations = set()
-    for e in events:
-        if e.geo_country and e.geo_city:
-            loc_key = f"{e.geo_country}-{e.geo_city}"
-            if loc_key not in seen_locations:
-                geo_changes.append({
-                    "country": e.geo_country,
-                    "city": e.geo_city,
-                    "timestamp": e.timestamp.isoformat(),
-                    "ip_address": e.ip_address
-                })
-                seen_locations.add(loc_key)
-    
-    def serialize_item(item):
-        """Convert database item to dict, handling enums"""
-        result = {}
-        for c in item.__table__.columns:
-            value = getattr(item, c.name)
-            if hasattr(value, 'value'):
-                result[c.name] = value.value
-            elif hasattr(value, 'name'):
-                result[c.name] = value.name
-            else:
-                result[c.name] = value
-        return result
-    
+@router.get("/incidents/{incident_id}/alerts")
+async def get_incident_alerts(incident_id: str, db: Session = Depends(get_db)):
+    """Get the alerts correlated into an incident"""
+    alerts = db.query(Alert).join(
+        IncidentAlert, IncidentAlert.alert_id == Alert.id
+    ).filter(IncidentAlert.incident_id == incident_id).order_by(Alert.timestamp.asc()).all()
+
+    result = []
+    for a in alerts:
+        item = {}
+        for c in a.__table__.columns:
+            value = getattr(a, c.name)
+            item[c.name] = value.value if hasattr(value, 'value') else value
+        result.append(item)
+    return result
+
+
+def serialize_item(item):
+    """Convert database item to dict, handling enums"""
+    result = {}
+    for c in item.__table__.columns:
+        value = getattr(item, c.name)
+        if hasattr(value, 'value'):
+            result[c.name] = value.value
+        elif hasattr(value, 'name'):
+            result[c.name] = value.name
+        else:
+            result[c.name] = value
+    return result
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _entity_summary(db: Session, user: str, column, top: int) -> dict:
+    """Distinct values of one event column with counts and first/last seen"""
+    filters = [SecurityEvent.user == user, column.isnot(None)]
+    total = db.query(func.count(distinct(column))).filter(*filters).scalar() or 0
+    last_seen = func.max(SecurityEvent.timestamp)
+    rows = db.query(
+        column, func.count(SecurityEvent.id), func.min(SecurityEvent.timestamp), last_seen
+    ).filter(*filters).group_by(column).order_by(last_seen.desc()).limit(top).all()
     return {
-        "user": user,
-        "events": [serialize_item(e) for e in events],
-        "alerts": [serialize_item(a) for a in alerts],
-        "incidents": [serialize_item(i) for i in incidents],
-        "unique_ips": unique_ips,
-        "unique_devices": unique_devices,
-        "unique_apps": unique_apps,
-        "unique_oauth_apps": unique_oauth,
-        "role_changes": [
-            {
-                "timestamp": e.timestamp.isoformat(),
-                "role_name": e.role_name,
-                "ip_address": e.ip_address
-            }
-            for e in role_changes
+        "total": total,
+        "items": [
+            {"value": value, "count": count, "first_seen": _iso(first), "last_seen": _iso(last)}
+            for value, count, first, last in rows
         ],
-        "oauth_consents": [
+        "truncated": total > len(rows),
+    }
+
+
+def _geolocation_summary(db: Session, user: str, top: int) -> dict:
+    """Distinct locations with the IP of their first appearance, via window functions"""
+    partition = (SecurityEvent.geo_country, SecurityEvent.geo_city)
+    ranked = select(
+        SecurityEvent.geo_country.label("country"),
+        SecurityEvent.geo_city.label("city"),
+        SecurityEvent.ip_address.label("ip_address"),
+        SecurityEvent.timestamp.label("first_seen"),
+        func.row_number().over(partition_by=partition, order_by=SecurityEvent.timestamp.asc()).label("rn"),
+        func.count(SecurityEvent.id).over(partition_by=partition).label("count"),
+        func.max(SecurityEvent.timestamp).over(partition_by=partition).label("last_seen"),
+    ).where(
+        SecurityEvent.user == user,
+        SecurityEvent.geo_country.isnot(None),
+        SecurityEvent.geo_city.isnot(None)
+    ).subquery()
+    rows = db.execute(
+        select(ranked).where(ranked.c.rn == 1).order_by(ranked.c.first_seen.asc()).limit(top + 1)
+    ).all()
+    total = len(rows)
+    if total > top:
+        locations = db.query(SecurityEvent.geo_country, SecurityEvent.geo_city).filter(
+            SecurityEvent.user == user,
+            SecurityEvent.geo_country.isnot(None),
+            SecurityEvent.geo_city.isnot(None)
+        ).distinct().subquery()
+        total = db.query(func.count()).select_from(locations).scalar()
+    return {
+        "total": total,
+        "items": [
             {
-                "timestamp": e.timestamp.isoformat(),
-                "app_name": e.oauth_app_name,
-                "scopes": e.oauth_scopes,
-                "ip_address": e.ip_address
+                "country": r.country,
+                "city": r.city,
+                "ip_address": r.ip_address,
+                "count": r.count,
+                "first_seen": _iso(r.first_seen),
+                "last_seen": _iso(r.last_seen),
             }
-            for e in oauth_consents
+            for r in rows[:top]
         ],
-        "geolocation_changes": geo_changes
+        "truncated": len(rows) > top,
+    }
+
+
+def _grouped_summary(db: Session, model, user_column, time_column, keys, filters, top: int) -> dict:
+    """Rows grouped by ``keys`` with counts and first/last seen
+
+    ``total`` counts the groups, like the other sections; ``rows`` counts the
+    rows they cover.
+    """
+    last_seen = func.max(time_column)
+    base = [user_column.isnot(None)] + filters
+    rows = db.query(
+        *keys, func.count(), func.min(time_column), last_seen
+    ).select_from(model).filter(*base).group_by(*keys).order_by(last_seen.desc()).limit(top + 1).all()
+    total, row_count = len(rows), sum(row[len(keys)] for row in rows)
+    if total > top:
+        groups = db.query(func.count().label("rows")).select_from(model).filter(*base).group_by(*keys).subquery()
+        total, row_count = db.query(func.count(), func.sum(groups.c.rows)).one()
+    items = []
+    for row in rows[:top]:
+        values = list(row)
+        first, last = values[-2], values[-1]
+        item = {}
+        for key, value in zip(keys, values[:len(keys)]):
+            item[key.key] = value.value if hasattr(value, 'value') else value
+        item.update({"count": values[len(keys)], "first_seen": _iso(first), "last_seen": _iso(last)})
+        items.append(item)
+    return {"total": total, "rows": int(row_count or 0), "items": items, "truncated": len(rows) > top}
+
+
+@router.get("/users/{user}/investigation")
+async def get_user_investigation(user: str, top: int = Query(20, ge=1, le=200), db: Session = Depends(get_db)):
+    """Get bounded, sectioned investigation summaries for a user"""
+    event_count, first_seen, last_seen = db.query(
+        func.count(SecurityEvent.id), func.min(SecurityEvent.timestamp), func.max(SecurityEvent.timestamp)
+    ).filter(SecurityEvent.user == user).one()
+
+    alerts = _grouped_summary(
+        db, Alert, Alert.user, Alert.timestamp, [Alert.detection_id, Alert.alert_name, Alert.severity],
+        [Alert.user == user], top
+    )
+    incidents = _grouped_summary(
+        db, Incident, Incident.user, Incident.detected_at, [Incident.status, Incident.severity],
+        [Incident.user == user, Incident.merged_into.is_(None)], top
+    )
+    role_changes = _grouped_summary(
+        db, SecurityEvent, SecurityEvent.user, SecurityEvent.timestamp, [SecurityEvent.role_name],
+        [SecurityEvent.user == user, SecurityEvent.role_assigned == True], top
+    )
+    oauth_consents = _grouped_summary(
+        db, SecurityEvent, SecurityEvent.user, SecurityEvent.timestamp,
+        [SecurityEvent.oauth_app_name, SecurityEvent.oauth_scopes],
+        [SecurityEvent.user == user, SecurityEvent.oauth_app_name.isnot(None)], top
+    )
+
+    return {
+        "user": user,
+        "summary": {
+            "events": event_count,
+            "alerts": alerts["rows"],
+            "incidents": incidents["rows"],
+            "first_seen": _iso(first_seen),
+            "last_seen": _iso(last_seen),
+        },
+        "baseline": _baseline_summary(db, user, top),
+        "sections": {
+            "ips": _entity_summary(db, user, SecurityEvent.ip_address, top),
+            "devices": _entity_summary(db, user, SecurityEvent.device_id, top),
+            "apps": _entity_summary(db, user, SecurityEvent.app_name, top),
+            "oauth_apps": _entity_summary(db, user, SecurityEvent.oauth_app_name, top),
+            "geolocations": _geolocation_summary(db, user, top),
+            "role_changes": role_changes,
+            "oauth_consents": oauth_consents,
+            "alerts": alerts,
+            "incidents": incidents,
+        },
+    }
+
+
+def _baseline_summary(db: Session, user: str, top: int = 10) -> Optional[dict]:
+    store = ensure_baselines(db)
+    with store.lock:
+        profile = store.get(user)
+        return profile.summary(top) if profile else None
+
+
+@router.get("/users/{user}/baseline")
+async def get_user_baseline(user: str, top: int = Query(10, ge=1, le=64), db: Session = Depends(get_db)):
+    """Get the behavioural baseline of a user"""
+    baseline = _baseline_summary(db, user, top)
+    if baseline is None:
+        return {"error": "No baseline for user"}
+    return baseline
+
+
+@router.post("/baselines/rebuild")
+async def rebuild_user_baselines(db: Session = Depends(get_db)):
+    """Rebuild all user baselines from stored events"""
+    return {"users": rebuild_baselines(db)}
+
+
+def _encode_cursor(timestamp, row_id) -> str:
+    """Keyset position; rows without a timestamp sort last and encode an empty one"""
+    return f"{timestamp.isoformat() if timestamp else ''}|{row_id}"
+
+
+def _decode_cursor(cursor: str):
+    """(timestamp or None, id) of a cursor from ``_encode_cursor``; None when it is malformed"""
+    timestamp, separator, row_id = cursor.rpartition("|")
+    try:
+        if not separator:
+            raise ValueError(cursor)
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(row_id)
+    except ValueError:
+        return None
+
+
+def _after_cursor(time_column, id_column, cursor_time, cursor_id):
+    """Rows after the cursor in ``time DESC NULLS LAST, id DESC`` order"""
+    if cursor_time is None:
+        return and_(time_column.is_(None), id_column < cursor_id)
+    return or_(
+        time_column < cursor_time,
+        and_(time_column == cursor_time, id_column < cursor_id),
+        time_column.is_(None),
+    )
+
+
+INVESTIGATION_SECTIONS = {
+    "events": (SecurityEvent, SecurityEvent.timestamp, []),
+    "role_changes": (SecurityEvent, SecurityEvent.timestamp, [SecurityEvent.role_assigned == True]),
+    "oauth_consents": (SecurityEvent, SecurityEvent.timestamp, [SecurityEvent.oauth_app_name.isnot(None)]),
+    "alerts": (Alert, Alert.timestamp, []),
+    "incidents": (Incident, Incident.detected_at, [Incident.merged_into.is_(None)]),
+}
+
+
+@router.get("/users/{user}/investigation/{section}")
+async def get_user_investigation_section(
+    user: str,
+    section: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Get one page of raw rows for an investigation section, newest first"""
+    if section not in INVESTIGATION_SECTIONS:
+        return {"error": "Unknown investigation section"}
+    model, time_column, filters = INVESTIGATION_SECTIONS[section]
+    filters = [model.user == user] + filters
+    if cursor:
+        decoded = _decode_cursor(cursor)
+        if decoded is None:
+            return {"error": "Invalid cursor"}
+        filters.append(_after_cursor(time_column, model.id, *decoded))
+
+    rows = db.query(model).filter(*filters).order_by(
+        time_column.desc().nulls_last(), model.id.desc()
+    ).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_cursor(getattr(last, time_column.key), last.id)
+    return {
+        "section": section,
+        "items": [serialize_item(r) for r in page],
+        "next_cursor": next_cursor,
     }
@@ -0,0 +1,98 @@
+"""
+Live feed API endpoints
+"""
+from fastapi import APIRouter, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.components.live_feed import live_feed, format_sse, HEARTBEAT, OVERFLOW, TOPICS, LIVE_FEED_ENABLED
+import asyncio
+
+router = APIRouter()
+
+
+def _parse_topics(topics: Optional[str]):
+    if not topics:
+        return list(TOPICS), []
+    requested = [t.strip() for t in topics.split(",") if t.strip()]
+    return requested, [t for t in requested if t not in TOPICS]
+
+
+@router.get("/live/feed")
+async def stream_live_feed(
+    topics: Optional[str] = Query(None, description="Comma-separated: alerts, incidents, kpis (default all)"),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """Stream new alerts, incident status changes and KPI deltas as Server-Sent Events"""
+    requested, unknown = _parse_topics(topics)
+    if unknown:
+        return {"error": f"Unknown topic: {', '.join(unknown)}"}
+    if not LIVE_FEED_ENABLED:
+        return {"error": "Live feed is disabled"}
+    subscriber = live_feed.subscribe(requested, last_event_id)
+    if subscriber is None:
+        return {"error": "Too many live feed subscribers"}
+
+    async def events():
+        try:
+            # Lets EventSource clients know the stream is open before the first change arrives
+            yield "retry: 3000\n\n"
+            while True:
+                message = await subscriber.queue.get()
+                yield format_sse(message)
+                if message is OVERFLOW:
+                    return
+        finally:
+            live_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/live/ws")
+async def live_feed_socket(websocket: WebSocket, topics: Optional[str] = None, last_event_id: Optional[int] = None):
+    """Same feed over a WebSocket: one JSON message per change"""
+    requested, unknown = _parse_topics(topics)
+    await websocket.accept()
+    if unknown or not LIVE_FEED_ENABLED:
+        await websocket.close(code=1008, reason="Unknown topic" if unknown else "Live feed is disabled")
+        return
+    subscriber = live_feed.subscribe(requested, last_event_id)
+    if subscriber is None:
+        await websocket.close(code=1013, reason="Too many live feed subscribers")
+        return
+
+    async def watch_disconnect():
+        # Clients do not send anything; this only notices the close
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        while not watcher.done():
+            getter = asyncio.ensure_future(subscriber.queue.get())
+            await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break
+            message = getter.result()
+            if message is HEARTBEAT:
+                await websocket.send_json({"type": "heartbeat"})
+            elif message is OVERFLOW:
+                await websocket.send_json({"type": "overflow"})
+                await websocket.close(code=1013, reason="Slow consumer")
+                break
+            else:
+                await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        live_feed.unsubscribe(subscriber)
+
+
+@router.get("/live/stats")
+async def get_live_feed_stats():
+    """Get live feed subscriber, queue and drop statistics"""
+    return live_feed.stats()
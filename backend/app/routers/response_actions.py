@@ -1,104 +1,138 @@
 """
 Response actions API endpoints
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query
 from sqlalchemy.orm import Session
-from datetime import datetime
-from app.models import get_db, Incident, ResponseAction, IncidentStatus
+from typing import Optional
+from app.models import get_db, Incident, ResponseAction, ResponseJob
+from app.schemas import BulkResponseActionIn
+from app.components.response import (
+    ACTION_DESCRIPTIONS, MAX_BULK_INCIDENTS, execute_action, execute_bulk_actions, merged_error,
+    select_incident_ids, stage_action
+)
+from app.components.jobs import response_jobs, serialize_job
+from app.components.writer import write_coalescer, WRITE_COALESCING_ENABLED
 
 router = APIRouter()
 
 
+@router.post("/incidents/response/bulk")
+async def execute_bulk_response_actions(request: BulkResponseActionIn, db: Session = Depends(get_db)):
+    """Execute simulated response actions across many incidents in one transaction
+
+    Each incident moves one status step per request, however many actions are
+    applied. Explicit ids of incidents merged into another are reported as
+    ``merged`` and left unchanged, as the filter form never selects them.
+    """
+    unknown = [a for a in request.action_types if a not in ACTION_DESCRIPTIONS]
+    if unknown or not request.action_types:
+        return {"error": f"Invalid action type: {', '.join(unknown) or 'none given'}"}
+    if (request.incident_ids is None) == (request.filter is None):
+        return {"error": "Provide either incident_ids or filter"}
+
+    if request.incident_ids is not None:
+        incident_ids = request.incident_ids
+    else:
+        f = request.filter
+        filters = []
+        if f.status:
+            filters.append(Incident.status == f.status)
+        if f.severity:
+            filters.append(Incident.severity == f.severity)
+        if f.scenario_type:
+            filters.append(Incident.scenario_type == f.scenario_type)
+        if f.user:
+            filters.append(Incident.user == f.user)
+        if f.detected_after:
+            filters.append(Incident.detected_at >= f.detected_after)
+        if f.detected_before:
+            filters.append(Incident.detected_at <= f.detected_before)
+        incident_ids = select_incident_ids(db, filters)
+    if len(incident_ids) > MAX_BULK_INCIDENTS:
+        return {"error": f"At most {MAX_BULK_INCIDENTS} incidents per bulk request"}
+    return execute_bulk_actions(db, incident_ids, request.action_types)
+
+
 @router.post("/incidents/{incident_id}/response/{action_type}")
 async def execute_response_action(
     incident_id: str,
     action_type: str,
     db: Session = Depends(get_db)
 ):
-    """Execute a simulated response action"""
-    incident = db.query(Incident).filter(Incident.incident_id == incident_id).first()
-    if not incident:
-        return {"error": "Incident not found"}
-    
-    action_descriptions = {
-        "disable_user": {
-            "name": "Disable User Account",
-            "description": "In production, this would disable the user account in Azure AD, preventing all future sign-ins. The user would need admin intervention to re-enable the account."
-        },
-        "revoke_sessions": {
-            "name": "Revoke All Active Sessions",
-            "description": "In production, this would invalidate all active tokens and sessions for the user, forcing them to re-authenticate. This would immediately log them out of all devices and applications."
-        },
-        "password_reset": {
-            "name": "Require Password Reset",
-            "description": "In production, this would force the user to reset their password on next sign-in. This helps ensure the account hasn't been compromised and the password is changed."
-        },
-        "isolate_endpoint": {
-            "name": "Isolate Endpoint",
-            "description": "In production, this would isolate the device from the network, preventing it from accessing corporate resources while allowing investigation. This is typically done via Microsoft Defender for Endpoint or similar EDR solution."
-        },
-        "block_oauth": {
-            "name": "Block OAuth Application",
-            "description": "In production, this would revoke consent and block the OAuth application, preventing it from accessing user data. This would also revoke all existing tokens issued to the application."
-        }
-    }
-    
-    if action_type not in action_descriptions:
+    """Execute a simulated response action; incidents merged into another are rejected with the survivor's id"""
+    if action_type not in ACTION_DESCRIPTIONS:
         return {"error": "Invalid action type"}
-    
-    action_info = action_descriptions[action_type]
-    
-    # Create response action record
-    response_action = ResponseAction(
-        incident_id=incident_id,
-        action_type=action_type,
-        action_name=action_info["name"],
-        description=action_info["description"],
-        simulated=True,
-        executed_at=datetime.utcnow()
-    )
-    db.add(response_action)
-    
-    # Update incident status
-    if incident.status == IncidentStatus.OPEN:
-        incident.status = IncidentStatus.INVESTIGATING
-        incident.acknowledged_at = datetime.utcnow()
-    elif incident.status == IncidentStatus.INVESTIGATING:
-        incident.status = IncidentStatus.CONTAINED
-        incident.contained_at = datetime.utcnow()
-    elif incident.status == IncidentStatus.CONTAINED:
-        incident.status = IncidentStatus.RESOLVED
-        incident.resolved_at = datetime.utcnow()
-        # Calculate MTTR
-        if incident.detected_at:
-            mttr = (datetime.utcnow() - incident.detected_at).total_seconds() / 60
-            incident.mttr_minutes = mttr
-    
-    # Update response_actions JSON
-    existing_actions = incident.response_actions or "[]"
-    import json
-    try:
-        actions_list = json.loads(existing_actions)
-    except:
-        actions_list = []
-    
-    actions_list.append({
-        "action_type": action_type,
-        "action_name": action_info["name"],
-        "executed_at": datetime.utcnow().isoformat()
-    })
-    incident.response_actions = json.dumps(actions_list)
-    
-    db.commit()
-    
+
+    if WRITE_COALESCING_ENABLED:
+        status, merged_into = await write_coalescer.run(lambda session: stage_action(session, incident_id, action_type))
+    else:
+        incident = db.query(Incident).filter(Incident.incident_id == incident_id).first()
+        merged_into = incident.merged_into if incident else None
+        status = execute_action(db, incident, action_type).status.value if incident and not merged_into else None
+    if merged_into:
+        return merged_error(incident_id, merged_into)
+    if status is None:
+        return {"error": "Incident not found"}
+
+    action_info = ACTION_DESCRIPTIONS[action_type]
     return {
         "success": True,
         "action": action_info,
-        "incident_status": incident.status.value,
+        "incident_status": status,
         "message": f"Simulated action executed. {action_info['description']}"
     }
 
 
+@router.post("/incidents/{incident_id}/response/{action_type}/async")
+async def queue_response_action(
+    incident_id: str,
+    action_type: str,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db)
+):
+    """Queue a simulated response action for background execution"""
+    if action_type not in ACTION_DESCRIPTIONS:
+        return {"error": "Invalid action type"}
+    incident = db.query(Incident.merged_into).filter(Incident.incident_id == incident_id).first()
+    if incident is None:
+        return {"error": "Incident not found"}
+    if incident.merged_into:
+        return merged_error(incident_id, incident.merged_into)
+    return response_jobs.submit(db, incident_id, action_type, idempotency_key)
+
+
+@router.get("/response-jobs")
+async def get_response_jobs(
+    status: Optional[str] = Query(None),
+    incident_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Get recent response jobs"""
+    filters = []
+    if status:
+        filters.append(ResponseJob.status == status)
+    if incident_id:
+        filters.append(ResponseJob.incident_id == incident_id)
+    jobs = db.query(ResponseJob).filter(*filters).order_by(ResponseJob.id.desc()).limit(limit).all()
+    return [serialize_job(j) for j in jobs]
+
+
+@router.get("/response-jobs/stats")
+async def get_response_job_stats():
+    """Get worker pool and queue statistics"""
+    return response_jobs.stats()
+
+
+@router.get("/response-jobs/{job_id}")
+async def get_response_job(job_id: str, db: Session = Depends(get_db)):
+    """Get the status of a response job"""
+    job = db.query(ResponseJob).filter(ResponseJob.job_id == job_id).first()
+    if not job:
+        return {"error": "Job not found"}
+    return serialize_job(job)
+
+
 @router.get("/incidents/{incident_id}/response-actions")
 async def get_response_actions(incident_id: str, db: Session = Depends(get_db)):
     """Get all response actions for an incident"""
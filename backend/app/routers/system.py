@@ -0,0 +1,90 @@
+"""
+System API endpoints
+"""
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.models import get_db, pool_stats, SQLITE_PRAGMAS
+from app.components.dimensions import dimension_cache
+from app.components.hot_tier import hot_tier
+from app.components.metrics import registry, render_pools
+from app.components.slow_queries import slow_query_log
+from app.components.startup import startup_state, worker_id
+from app.components.stream import stream_processor
+from app.components.writer import write_coalescer
+import os
+
+router = APIRouter()
+
+
+@router.get("/system/writer")
+async def get_writer_stats():
+    """Get group-commit writer statistics"""
+    return write_coalescer.stats()
+
+
+@router.get("/system/database")
+async def get_database_settings(db: Session = Depends(get_db)):
+    """Get the effective database connection settings"""
+    dialect = db.get_bind().dialect.name
+    if dialect != "sqlite":
+        return {"dialect": dialect}
+    return {
+        "dialect": dialect,
+        "pragmas": {
+            name: db.connection().exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_PRAGMAS
+        },
+    }
+
+
+@router.get("/system/dimensions")
+async def get_dimension_stats():
+    """Get the dimension intern cache's size per column and intern/reload counts"""
+    return dimension_cache.stats()
+
+
+@router.get("/system/hot-tier")
+async def get_hot_tier_stats():
+    """Get the in-memory recent-event tier's coverage, size and hit counts"""
+    return hot_tier.stats()
+
+
+@router.get("/system/pools")
+async def get_pool_stats():
+    """Get read and write connection pool occupancy and checkout wait times"""
+    return pool_stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Get per-route request, SQL and connection pool metrics in Prometheus text format"""
+    return PlainTextResponse(registry.render() + render_pools(pool_stats()), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/system/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(100, ge=1, le=1000),
+    fingerprint: Optional[str] = Query(None, description="Only entries for one normalized statement"),
+):
+    """Get recent slow statements, newest first, with per-statement totals and query plans"""
+    return slow_query_log.report(limit=limit, fingerprint=fingerprint)
+
+
+@router.post("/system/slow-queries/reset")
+async def reset_slow_queries(threshold_ms: Optional[float] = Query(None, ge=0, description="New slow threshold")):
+    """Clear the slow-query log, optionally changing the threshold"""
+    slow_query_log.reset(threshold_ms=threshold_ms)
+    return {"success": True, "threshold_ms": slow_query_log.threshold_ms}
+
+
+@router.get("/system/startup")
+async def get_startup_info():
+    """Get this worker's identity, schema check outcome and warm-up timings"""
+    return {"pid": os.getpid(), "worker_id": worker_id(), **startup_state}
+
+
+@router.get("/system/stream")
+async def get_stream_stats():
+    """Get whether this worker owns stream detection and its last pass"""
+    return stream_processor.stats()
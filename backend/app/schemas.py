@@ -102,6 +102,8 @@ class DashboardKPISchema(BaseModel):
     distinct_impacted_users: int
     mttd_minutes: float
     mttr_minutes: float
+    mttd_percentiles: dict
+    mttr_percentiles: dict
     top_tactics: List[dict]
 
 
@@ -118,3 +120,48 @@ class TimelineEventSchema(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class SecurityEventIn(BaseModel):
+    """Security event submitted for ingest"""
+    timestamp: Optional[datetime] = None
+    user: str
+    ip_address: Optional[str] = None
+    geo_country: Optional[str] = None
+    geo_city: Optional[str] = None
+    device_id: Optional[str] = None
+    device_compliance: Optional[str] = None
+    app_name: Optional[str] = None
+    sign_in_result: Optional[SignInResult] = None
+    mfa_required: Optional[bool] = False
+    mfa_result: Optional[MFAResult] = None
+    risk_level: Optional[RiskLevel] = None
+    oauth_app_name: Optional[str] = None
+    oauth_scopes: Optional[str] = None
+    role_assigned: Optional[bool] = False
+    role_name: Optional[str] = None
+    azure_activity: Optional[AzureActivityType] = None
+    alert_name: Optional[str] = None
+    alert_severity: Optional[SeverityLevel] = None
+    mitre_tactic: Optional[str] = None
+    mitre_technique: Optional[str] = None
+    detection_id: Optional[str] = None
+    detection_triggered: bool = False
+    scenario_type: Optional[str] = None
+
+
+class IncidentFilterIn(BaseModel):
+    """Incident selection for bulk operations"""
+    status: Optional[IncidentStatus] = None
+    severity: Optional[SeverityLevel] = None
+    scenario_type: Optional[str] = None
+    user: Optional[str] = None
+    detected_after: Optional[datetime] = None
+    detected_before: Optional[datetime] = None
+
+
+class BulkResponseActionIn(BaseModel):
+    """Response actions applied to a list of incidents or to every incident matching a filter"""
+    action_types: List[str]
+    incident_ids: Optional[List[str]] = None
+    filter: Optional[IncidentFilterIn] = None
@@ -0,0 +1,77 @@
+"""
+Response job throughput test for Detection Engineering Simulation Dashboard
+Queues response actions against existing incidents on an in-process worker pool
+with the simulated executor and reports throughput, retries and queue-to-finish
+latency percentiles.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import SessionLocal, init_db, Incident, ResponseJob
+from app.components.jobs import ResponseJobQueue, SimulatedExecutor
+from time import perf_counter, sleep
+import argparse
+import json
+
+
+def run(jobs, workers, latency_ms, jitter_ms, failure_rate, action_type="revoke_sessions"):
+    init_db()
+    db = SessionLocal()
+    try:
+        incident_ids = [i for (i,) in db.query(Incident.incident_id).limit(jobs).all()]
+        if not incident_ids:
+            return {"error": "No incidents to act on; run generate_data.py first"}
+        queue = ResponseJobQueue(
+            workers=workers,
+            executor=SimulatedExecutor(latency_ms=latency_ms, jitter_ms=jitter_ms, failure_rate=failure_rate, seed=1)
+        )
+        queue.start()
+        started = perf_counter()
+        job_ids = [
+            queue.submit(db, incident_ids[n % len(incident_ids)], action_type)["job_id"] for n in range(jobs)
+        ]
+        submitted = perf_counter() - started
+        while True:
+            stats = queue.stats()
+            if not stats["queued"] and not stats["waiting_retry"] and not stats["busy_workers"]:
+                break
+            sleep(0.05)
+        elapsed = perf_counter() - started
+        queue.stop()
+
+        db.expire_all()
+        rows = db.query(ResponseJob).filter(ResponseJob.job_id.in_(job_ids)).all()
+        latencies = sorted(
+            (r.finished_at - r.created_at).total_seconds() * 1000 for r in rows if r.finished_at
+        )
+    finally:
+        db.close()
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1) if latencies else None
+
+    return {
+        "jobs": jobs,
+        "workers": workers,
+        "executor_latency_ms": latency_ms,
+        "failure_rate": failure_rate,
+        "submit_s": round(submitted, 3),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(stats["succeeded"] / elapsed, 1),
+        "succeeded": stats["succeeded"],
+        "failed": stats["failed"],
+        "retries": stats["retried"],
+        "latency_ms": {"p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": latencies[-1] if latencies else None},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the response job queue")
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.jobs, args.workers, args.latency_ms, args.jitter_ms, args.failure_rate), indent=2))
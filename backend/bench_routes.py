@@ -0,0 +1,484 @@
+"""
+API route benchmark suite for Detection Engineering Simulation Dashboard
+Seeds synthetic databases at several sizes (10k, 1M and 10M events by default;
+cached under benchmarks/data and reused) and calls every /api/v1 route in
+process: GET routes are discovered from the app, with path parameters filled
+from the seeded data, and the write routes (ingest, response actions) have
+explicit request bodies. Admin rebuild/run endpoints and the live event stream are
+listed as skipped.
+
+Each route is timed for p50/p99 latency, then called once more instrumented for
+SQL query count, rows scanned, full table scans and peak Python memory. SQLite
+does not report rows read per statement, so rows scanned is measured as
+virtual machine steps (sampled through the progress handler) and full scans are
+taken from EXPLAIN QUERY PLAN of every statement the route ran.
+
+--save writes the results as a JSON baseline; --compare checks them against a
+baseline and exits 1 when a route regresses beyond --threshold.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+from time import perf_counter
+import argparse
+import contextlib
+import gc
+import json
+import platform
+import re
+import sqlite3
+import subprocess
+import tempfile
+import tracemalloc
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_SIZES = "10k,1m,10m"
+SEED = 7
+DAYS = 30
+# Sequence scan and baselines over the full history are skipped above this size
+FULL_DERIVED_MAX_EVENTS = 1_000_000
+PROGRESS_STEP = 100
+
+# Admin endpoints that rebuild state or reload configuration rather than serve traffic
+SKIPPED_ROUTES = {
+    "POST /api/v1/dashboard/response-times/rebuild": "admin rebuild",
+    "POST /api/v1/dashboard/ueba/run": "admin rebuild",
+    "POST /api/v1/detections/stats/rebuild": "admin rebuild",
+    "POST /api/v1/detections/profile/reset": "admin reset",
+    "POST /api/v1/detections/sequences/scan": "admin rebuild",
+    "POST /api/v1/detections/scheduled/{detection_id}/run": "admin run",
+    "POST /api/v1/enrichment/reload": "admin reload",
+    "POST /api/v1/graph/rebuild": "admin rebuild",
+    "POST /api/v1/incidents/correlate": "admin rebuild",
+    "POST /api/v1/baselines/rebuild": "admin rebuild",
+    "POST /api/v1/system/slow-queries/reset": "admin reset",
+    "GET /api/v1/live/feed": "event stream",
+}
+
+# Required query parameters of GET routes, formatted with the sampled values
+QUERY_PARAMS = {
+    "/api/v1/graph/neighbors": {"kind": "user", "value": "{user}"},
+}
+
+# Gated metrics: (relative threshold multiplier, absolute change ignored as noise)
+GATES = {
+    "p50_ms": (1.0, 2.0),
+    "p99_ms": (1.0, 10.0),
+    "queries": (1.0, 0),
+    "vm_steps": (1.0, 10_000),
+    "peak_kb": (1.0, 256),
+}
+
+
+def parse_size(value: str) -> int:
+    """``10k`` / ``1m`` / ``250000`` to an event count"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)])
+
+
+def size_label(events: int) -> str:
+    if events % 1_000_000 == 0:
+        return f"{events // 1_000_000}m"
+    if events % 1_000 == 0:
+        return f"{events // 1_000}k"
+    return str(events)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2) if values else None
+
+
+# --- worker side: runs in a subprocess with DATABASE_URL pointing at the sized database ---
+
+def seed(events: int):
+    """Load the synthetic dataset for ``events`` background events into DATABASE_URL"""
+    from app.models import Base, engine, SessionLocal, Incident
+    from app.components.correlation import correlate_pending
+    from app.components.detection_stats import rebuild_detection_stats
+    from app.components.sketches import rebuild_latency_sketches
+    from app.components.jobs import response_jobs
+    from app.components.synthetic import DatasetSpec, generate_dataset, DEFAULT_SCENARIO_MIX
+    from generate_data import create_detections, build_derived_data
+
+    scale = max(1, events // 10_000)
+    spec = DatasetSpec(
+        seed=SEED, users=max(8, events // 50), events=events, days=DAYS,
+        scenario_mix={name: count * scale for name, count in DEFAULT_SCENARIO_MIX.items()},
+    )
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        create_detections(db)
+        generate_dataset(spec, engine=engine, defer_indexes=True)
+        if events <= FULL_DERIVED_MAX_EVENTS:
+            build_derived_data(db)
+        else:
+            correlate_pending(db)
+            rebuild_detection_stats(db)
+            rebuild_latency_sketches(db)
+        # One queued response job for GET /response-jobs/{job_id}; the queue's workers are not started here
+        incident_id = db.query(Incident.incident_id).order_by(Incident.detected_at.desc()).limit(1).scalar()
+        if incident_id:
+            response_jobs.submit(db, incident_id, "revoke_sessions", idempotency_key="bench-routes")
+    finally:
+        db.close()
+
+
+def sample_values(db) -> dict:
+    """Existing identifiers to fill route path parameters with"""
+    from sqlalchemy import func
+    from app.models import Detection, Incident, IncidentAlert, SecurityEvent, ResponseJob
+
+    incident_id = (
+        db.query(IncidentAlert.incident_id)
+        .group_by(IncidentAlert.incident_id)
+        .order_by(func.count().desc())
+        .limit(1).scalar()
+    ) or db.query(Incident.incident_id).order_by(Incident.detected_at.desc()).limit(1).scalar()
+    user = db.query(Incident.user).filter(Incident.incident_id == incident_id).scalar() if incident_id else None
+    return {
+        "detection_id": db.query(Detection.detection_id).limit(1).scalar(),
+        "incident_id": incident_id,
+        "user": user or db.query(SecurityEvent.user).limit(1).scalar(),
+        "ip": db.query(SecurityEvent.ip_address).filter(SecurityEvent.user == user).limit(1).scalar(),
+        "job_id": db.query(ResponseJob.job_id).order_by(ResponseJob.id).limit(1).scalar(),
+        "action_type": "revoke_sessions",
+    }
+
+
+def ingest_batch(samples: dict, n: int = 10) -> list:
+    """Ordinary successful sign-ins; they raise no alerts so repeated runs leave incidents unchanged"""
+    now = datetime.utcnow()
+    return [{
+        "timestamp": now.isoformat(),
+        "user": samples["user"],
+        "ip_address": samples["ip"] or "10.0.0.1",
+        "geo_country": "United States",
+        "geo_city": "Seattle",
+        "app_name": "Microsoft 365",
+        "sign_in_result": "success",
+        "mfa_required": False,
+    } for _ in range(n)]
+
+
+def build_cases(app, samples: dict):
+    """(name, method, url, body) for every benchmarked route, plus skipped and uncovered routes"""
+    from fastapi.routing import APIRoute
+    from app.routers.incidents import INVESTIGATION_SECTIONS
+
+    cases, skipped, covered = [], {}, set()
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not route.path.startswith("/api/v1"):
+            continue
+        for method in sorted(route.methods):
+            key = f"{method} {route.path}"
+            if key in SKIPPED_ROUTES:
+                skipped[key] = SKIPPED_ROUTES[key]
+                covered.add(key)
+            if method != "GET" or key in covered:
+                continue
+            params = {name: samples.get(name) for name in re.findall(r"{(\w+)}", route.path)}
+            missing = [name for name, value in params.items() if value is None and name != "section"]
+            if missing:
+                skipped[key] = f"no sample {', '.join(missing)}"
+                covered.add(key)
+                continue
+            query = {k: v.format(**samples) for k, v in QUERY_PARAMS.get(route.path, {}).items()}
+            sections = list(INVESTIGATION_SECTIONS) if "section" in params else [None]
+            for section in sections:
+                url = route.path.format(**{**params, "section": section})
+                name = key if section is None else f"{key} [{section}]"
+                cases.append((name, "GET", url, query or None))
+            covered.add(key)
+
+    # Write routes last so reads see the seeded data only
+    incident_id, action_type = samples["incident_id"], samples["action_type"]
+    writes = [
+        ("POST /api/v1/enrichment/ip/lookup", "/api/v1/enrichment/ip/lookup", [samples["ip"] or "8.8.8.8"]),
+        ("POST /api/v1/events/ingest", "/api/v1/events/ingest", ingest_batch(samples)),
+    ]
+    if incident_id:
+        writes += [
+            ("POST /api/v1/incidents/{incident_id}/response/{action_type}",
+             f"/api/v1/incidents/{incident_id}/response/{action_type}", None),
+            ("POST /api/v1/incidents/{incident_id}/response/{action_type}/async",
+             f"/api/v1/incidents/{incident_id}/response/{action_type}/async", None),
+            ("POST /api/v1/incidents/response/bulk", "/api/v1/incidents/response/bulk",
+             {"action_types": [action_type], "incident_ids": [incident_id]}),
+        ]
+    for name, url, body in writes:
+        cases.append((name, "POST", url, body))
+        covered.add(name)
+
+    uncovered = sorted(
+        f"{method} {route.path}" for route in app.routes
+        if isinstance(route, APIRoute) and route.path.startswith("/api/v1")
+        for method in route.methods if f"{method} {route.path}" not in covered
+    )
+    return cases, skipped, uncovered
+
+
+class Instrumentation:
+    """Counts statements and SQLite VM steps on the given engines, keeping statements for EXPLAIN"""
+
+    def __init__(self, engine, *others):
+        from sqlalchemy import event
+        self.engine = engine
+        self.active = False
+        self.queries = 0
+        self.steps = 0
+        self.statements = []
+        self._hooked = []
+        for bound in {engine, *others}:
+            event.listen(bound, "before_cursor_execute", self._before)
+
+    def _progress(self):
+        self.steps += PROGRESS_STEP
+        return 0
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.active:
+            return
+        self.queries += 1
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+        if self.engine.dialect.name == "sqlite":
+            dbapi_connection = conn.connection.dbapi_connection
+            dbapi_connection.set_progress_handler(self._progress, PROGRESS_STEP)
+            self._hooked.append(dbapi_connection)
+
+    def start(self):
+        self.queries, self.steps, self.statements = 0, 0, []
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        # Timed calls must not pay for the handler
+        for dbapi_connection in self._hooked:
+            dbapi_connection.set_progress_handler(None, 0)
+        self._hooked = []
+
+    def full_scans(self) -> list:
+        """Tables read without an index by the recorded SELECTs"""
+        from app.models import Base
+        if self.engine.dialect.name != "sqlite":
+            return []
+        scans = set()
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement, parameters in self.statements:
+                try:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                except Exception:
+                    continue
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if detail.startswith("SCAN ") and " INDEX " not in detail and "CONSTANT ROW" not in detail:
+                        scans.add(detail[5:].split(" ")[0])
+        finally:
+            raw.close()
+        # Scans of subqueries and CTEs are already accounted to the tables they read
+        return sorted(scans & set(Base.metadata.tables))
+
+
+def bench_size(iterations: int, route_seconds: float, writes: bool) -> dict:
+    """Benchmark every route against the database in DATABASE_URL"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.models import engine, read_engine, SessionLocal, SecurityEvent
+
+    db = SessionLocal()
+    try:
+        samples = sample_values(db)
+        total_events = db.query(SecurityEvent).count()
+    finally:
+        db.close()
+
+    # GET routes run on the read pool, the rest on the write pool
+    instrumentation = Instrumentation(engine, read_engine)
+    cases, skipped, uncovered = build_cases(app, samples)
+    results = {}
+    # Without a with-block the app's startup hooks (scheduler, job workers) do not run
+    client = TestClient(app)
+    for name, method, url, body in cases:
+        if method != "GET" and not writes:
+            skipped[name] = "writes disabled"
+            continue
+
+        def call():
+            if method == "GET":
+                return client.get(url, params=body)
+            return client.post(url, json=body)
+
+        response = call()  # warm-up: caches, lazy imports
+        failure = None
+        if response.status_code != 200:
+            failure = f"HTTP {response.status_code}"
+        elif response.headers.get("content-type", "").startswith("application/json"):
+            payload = response.json()
+            if isinstance(payload, dict) and "error" in payload:
+                failure = payload["error"]
+        # Release the warm-up response before timing; unbounded routes return the whole table at large sizes
+        response = payload = None
+
+        latencies = []
+        gc.collect()
+        budget_end = perf_counter() + route_seconds
+        # Slow routes on large sizes stop early once the time budget is spent (at least 3 calls)
+        while len(latencies) < iterations and (len(latencies) < 3 or perf_counter() < budget_end):
+            started = perf_counter()
+            call()
+            latencies.append(perf_counter() - started)
+
+        instrumentation.start()
+        tracemalloc.start()
+        try:
+            response = call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            instrumentation.stop()
+
+        results[name] = {
+            "calls": len(latencies),
+            "p50_ms": _percentile(latencies, 0.5),
+            "p99_ms": _percentile(latencies, 0.99),
+            "queries": instrumentation.queries,
+            "vm_steps": instrumentation.steps,
+            "full_scans": instrumentation.full_scans(),
+            "peak_kb": round(peak / 1024, 1),
+            "response_kb": round(len(response.content) / 1024, 1),
+        }
+        if failure:
+            results[name]["error"] = failure
+        print(f"  {name}: p50 {results[name]['p50_ms']} ms, {results[name]['queries']} queries",
+              file=sys.stderr, flush=True)
+    return {
+        "events": total_events,
+        "iterations": iterations,
+        "routes": results,
+        "skipped": skipped,
+        "uncovered": uncovered,
+    }
+
+
+def worker(args):
+    if args.worker_seed:
+        from app.models import SecurityEvent, SessionLocal
+        db = SessionLocal()
+        try:
+            seeded = db.query(SecurityEvent.id).limit(1).first() is not None
+        except Exception:
+            seeded = False
+        finally:
+            db.close()
+        if not seeded:
+            print(f"Seeding {args.worker_seed} events...", file=sys.stderr, flush=True)
+            started = perf_counter()
+            seed(args.worker_seed)
+            print(f"Seeded in {perf_counter() - started:.1f}s", file=sys.stderr, flush=True)
+    else:
+        print(json.dumps(bench_size(args.iterations, args.route_seconds, not args.read_only)), file=result_stream)
+
+
+# --- driver side ---
+
+def _worker(database: str, arguments: list) -> str:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", SCHEDULED_DETECTIONS_ENABLED="0",
+               RESPONSE_JOBS_ENABLED="0")
+    command = [sys.executable, os.path.abspath(__file__)] + arguments
+    return subprocess.run(command, env=env, stdout=subprocess.PIPE, check=True, text=True).stdout
+
+
+def run_size(events: int, args) -> dict:
+    """Seed (or reuse) the cached database for ``events`` and benchmark a scratch copy of it"""
+    os.makedirs(args.data_dir, exist_ok=True)
+    cached = os.path.join(args.data_dir, f"events_{size_label(events)}.db")
+    _worker(cached, ["--worker-seed", str(events)])
+    with tempfile.TemporaryDirectory() as scratch:
+        # Write routes add rows; a fresh copy keeps every run measuring the same data
+        path = os.path.join(scratch, "bench.db")
+        with sqlite3.connect(cached) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+        arguments = ["--worker-bench", "--iterations", str(args.iterations),
+                     "--route-seconds", str(args.route_seconds)]
+        if args.read_only:
+            arguments.append("--read-only")
+        return json.loads(_worker(path, arguments))
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Regressions of ``current`` against ``baseline`` beyond ``threshold`` (0.2 = 20% slower)"""
+    regressions = []
+    for size, result in current["sizes"].items():
+        base_routes = baseline.get("sizes", {}).get(size, {}).get("routes", {})
+        for route, metrics in result["routes"].items():
+            base = base_routes.get(route)
+            if not base:
+                continue
+            if "error" in metrics and "error" not in base:
+                regressions.append({"size": size, "route": route, "metric": "error", "current": metrics["error"]})
+            for metric, (multiplier, noise) in GATES.items():
+                old, new = base.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + threshold * multiplier) and new - old > noise:
+                    regressions.append({
+                        "size": size, "route": route, "metric": metric, "baseline": old, "current": new,
+                        "change": f"+{(new - old) / old * 100:.0f}%" if old else "new",
+                    })
+            for table in set(metrics.get("full_scans", [])) - set(base.get("full_scans", [])):
+                regressions.append({"size": size, "route": route, "metric": "full_scan", "current": table})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every API route across dataset sizes")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated event counts, e.g. 10k,1m,10m")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per route")
+    parser.add_argument("--route-seconds", type=float, default=20,
+                        help="Time budget for the timed calls of one route")
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARK_DIR, "data"),
+                        help="Where seeded databases are cached")
+    parser.add_argument("--read-only", action="store_true", help="Skip ingest and response-action routes")
+    parser.add_argument("--save", help="Write results to this JSON baseline file")
+    parser.add_argument("--compare", help="Baseline JSON file to check results against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--worker-seed", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-bench", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_seed or args.worker_bench:
+        # stdout carries the worker's result; application and generator output goes to stderr
+        result_stream = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            worker(args)
+        sys.exit(0)
+
+    results = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "sizes": {},
+    }
+    for events in (parse_size(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Benchmarking {size_label(events)} events...", file=sys.stderr, flush=True)
+        results["sizes"][size_label(events)] = run_size(events, args)
+
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(results, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+        print(json.dumps({"threshold": args.threshold, "regressions": regressions}, indent=2))
+        sys.exit(1 if regressions else 0)
+    if not args.save:
+        print(json.dumps(results, indent=2))
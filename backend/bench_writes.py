@@ -0,0 +1,139 @@
+"""
+Mixed read/write throughput test for Detection Engineering Simulation Dashboard
+Runs concurrent clients issuing incident reads and single response-action
+writes against a scratch copy of the SQLite database, once per configuration:
+SQLite default pragmas with a commit per write, tuned pragmas (WAL etc.) with a
+commit per write, and tuned pragmas with writes group-committed by the writer.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import DATABASE_URL, SQLITE_PRAGMAS, configure_sqlite, Incident
+from app.components.response import stage_action
+from app.components.writer import WriteCoalescer
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from threading import Thread, Event
+from time import perf_counter, sleep
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": "", "mmap_size": "0"}
+
+CONFIGURATIONS = {
+    "default": (DEFAULT_PRAGMAS, False),
+    "pragmas": (SQLITE_PRAGMAS, False),
+    "group_commit": (SQLITE_PRAGMAS, True),
+}
+
+
+def _copy_database(source: str, target: str):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2) if values else None
+
+
+def run_configuration(path, pragmas, coalesce, clients, seconds, write_ratio, seed=3):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False},
+                           pool_size=clients + 2, max_overflow=0)
+    event.listen(engine, "connect", lambda dbapi_connection, record: configure_sqlite(dbapi_connection, pragmas))
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    writer = WriteCoalescer(session_factory=session_factory) if coalesce else None
+    if writer:
+        writer.start()
+
+    db = session_factory()
+    incident_ids = [i for (i,) in db.query(Incident.incident_id).all()]
+    db.close()
+
+    stop = Event()
+    read_latency, write_latency, errors = [], [], []
+
+    def client(n):
+        rng = random.Random(seed + n)
+        db = session_factory()
+        try:
+            while not stop.is_set():
+                started = perf_counter()
+                try:
+                    if rng.random() < write_ratio:
+                        incident_id = rng.choice(incident_ids)
+                        if writer:
+                            writer.submit(lambda session: stage_action(session, incident_id, "revoke_sessions")).result()
+                        else:
+                            stage_action(db, incident_id, "revoke_sessions")
+                            db.commit()
+                        write_latency.append(perf_counter() - started)
+                    else:
+                        db.query(Incident).filter(Incident.incident_id == rng.choice(incident_ids)).first()
+                        db.query(Incident).order_by(Incident.detected_at.desc()).limit(50).all()
+                        db.rollback()
+                        read_latency.append(perf_counter() - started)
+                except Exception as exc:
+                    db.rollback()
+                    errors.append(type(exc).__name__)
+        finally:
+            db.close()
+
+    threads = [Thread(target=client, args=(n,)) for n in range(clients)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    if writer:
+        writer.stop()
+    engine.dispose()
+
+    result = {
+        "ops_per_s": round((len(read_latency) + len(write_latency)) / elapsed, 1),
+        "reads_per_s": round(len(read_latency) / elapsed, 1),
+        "writes_per_s": round(len(write_latency) / elapsed, 1),
+        "read_ms": {"p50": _percentile(read_latency, 0.5), "p99": _percentile(read_latency, 0.99)},
+        "write_ms": {"p50": _percentile(write_latency, 0.5), "p99": _percentile(write_latency, 0.99)},
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+    }
+    if writer:
+        stats = writer.stats()
+        result["avg_batch_size"] = stats["avg_batch_size"]
+        result["largest_batch"] = stats["largest_batch"]
+    return result
+
+
+def run(database, clients, seconds, write_ratio, configurations):
+    results = {"clients": clients, "seconds": seconds, "write_ratio": write_ratio}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in configurations:
+            pragmas, coalesce = CONFIGURATIONS[name]
+            path = os.path.join(scratch, f"{name}.db")
+            _copy_database(database, path)
+            results[name] = run_configuration(path, pragmas, coalesce, clients, seconds, write_ratio)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark mixed read/write throughput on SQLite")
+    parser.add_argument("--database", default=DATABASE_URL.replace("sqlite:///", "", 1),
+                        help="SQLite database file to copy (default: DATABASE_URL)")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--config", action="append", choices=list(CONFIGURATIONS),
+                        help="Configuration to run (repeatable; default: all)")
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"Database {args.database} not found; run generate_data.py first")
+    print(json.dumps(run(args.database, args.clients, args.seconds, args.write_ratio,
+                         args.config or list(CONFIGURATIONS)), indent=2))
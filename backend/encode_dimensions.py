@@ -0,0 +1,125 @@
+"""
+Dimension encoding migration for Detection Engineering Simulation Dashboard
+Rebuilds security_events of a SQLite database with its low-cardinality text
+columns stored as ids into dim_<column> tables (--encode) or back as plain
+text (--decode), in one transaction, and reports the size before and after.
+Run it with the server stopped, then start the server with DIMENSION_ENCODING
+set to match.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import DATABASE_URL, SecurityEvent
+from app.components.dimensions import DIMENSIONS, dimension_table
+from sqlalchemy import Integer, MetaData, String
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateIndex, CreateTable
+from time import perf_counter
+import argparse
+import json
+import sqlite3
+
+TABLE = SecurityEvent.__tablename__
+
+
+def _is_encoded(connection) -> bool:
+    types = {row[1]: row[2].upper() for row in connection.execute(f"PRAGMA table_info({TABLE})")}
+    if "geo_country" not in types:
+        raise SystemExit(f"{TABLE} does not exist")
+    return types["geo_country"] == "INTEGER"
+
+
+def _target_table(encode: bool):
+    """security_events as stored in the target mode, with its indexes"""
+    metadata = MetaData()
+    table = SecurityEvent.__table__.to_metadata(metadata)
+    for name, length in DIMENSIONS.items():
+        table.c[name].type = Integer() if encode else String(length)
+    return table, {name: dimension_table(metadata, name) for name in DIMENSIONS}
+
+
+def _size(connection) -> int:
+    return connection.execute("PRAGMA page_count").fetchone()[0] * connection.execute("PRAGMA page_size").fetchone()[0]
+
+
+def convert(path: str, encode: bool, vacuum: bool) -> dict:
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        if _is_encoded(connection) == encode:
+            return {"database": path, "encoded": encode, "changed": False}
+        started = perf_counter()
+        size_before = _size(connection)
+        table, dimensions = _target_table(encode)
+        columns = [c.name for c in table.columns]
+        old = f"{TABLE}_before_encoding"
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for dimension in dimensions.values():
+                connection.execute(str(CreateTable(dimension, if_not_exists=True).compile(dialect=sqlite.dialect())))
+            if encode:
+                for name, dimension in dimensions.items():
+                    connection.execute(
+                        f"INSERT OR IGNORE INTO {dimension.name} (value) "
+                        f"SELECT DISTINCT {name} FROM {TABLE} WHERE {name} IS NOT NULL"
+                    )
+            lookup = "(SELECT id FROM {} WHERE value = e.{})" if encode else "(SELECT value FROM {} WHERE id = e.{})"
+            select = ", ".join(
+                lookup.format(dimensions[c].name, c) if c in dimensions else f"e.{c}" for c in columns
+            )
+            # Index names are kept by the renamed table, so they go before the new table is created
+            for index in table.indexes:
+                connection.execute(f"DROP INDEX IF EXISTS {index.name}")
+            connection.execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+            connection.execute(str(CreateTable(table).compile(dialect=sqlite.dialect())))
+            connection.execute(
+                f"INSERT INTO {TABLE} ({', '.join(columns)}) SELECT {select} FROM {old} AS e ORDER BY e.id"
+            )
+            connection.execute(f"DROP TABLE {old}")
+            for index in table.indexes:
+                connection.execute(str(CreateIndex(index).compile(dialect=sqlite.dialect())))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if vacuum:
+            connection.execute("VACUUM")
+        rows = connection.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        return {
+            "database": path,
+            "encoded": encode,
+            "changed": True,
+            "events": rows,
+            "dimension_values": {
+                name: connection.execute(f"SELECT COUNT(*) FROM {dimension.name}").fetchone()[0]
+                for name, dimension in dimensions.items()
+            },
+            "size_before_mb": round(size_before / 1e6, 1),
+            "size_after_mb": round(_size(connection) / 1e6, 1),
+            "elapsed_s": round(perf_counter() - started, 2),
+        }
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert security_events between plain and dimension-encoded storage")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--encode", action="store_true", help="Store dimension columns as interned ids")
+    mode.add_argument("--decode", action="store_true", help="Store dimension columns as plain text")
+    parser.add_argument("--database", help="SQLite database file (default: the DATABASE_URL database)")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip reclaiming the freed pages afterwards")
+    args = parser.parse_args()
+
+    path = args.database
+    if path is None:
+        url = make_url(DATABASE_URL)
+        if url.get_backend_name() != "sqlite" or not url.database:
+            raise SystemExit("Only SQLite database files can be converted")
+        path = url.database
+    print(json.dumps(convert(path, args.encode, not args.no_vacuum), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,32 @@
 """
 Generate sample data for Detection Engineering Simulation Dashboard
-Creates realistic attack scenarios: MFA Fatigue, Impossible Travel, OAuth Consent Abuse, Privilege Escalation
+Creates realistic attack scenarios: MFA Fatigue, Impossible Travel, OAuth Consent Abuse, Privilege Escalation,
+over a background of ordinary sign-in activity. The defaults produce the small demo dataset; the options scale
+it to millions of events for load testing. Output is reproducible for a given --seed and --end.
 """
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.models import (
-    Base, engine, SessionLocal, SecurityEvent, Detection, Alert, Incident,
-    RiskLevel, SeverityLevel, SignInResult, MFAResult, AzureActivityType, IncidentStatus
+    engine, init_db, SessionLocal, SecurityEvent, Detection, Alert, Incident, IncidentAlert, SeverityLevel,
+    ResponseAction, ResponseJob, DetectionWatermark, ScheduledDetectionRun, DetectionStats, DetectionAlertBucket,
+    LatencySketch, UserBaseline, UebaScore, IpIntel
 )
-from datetime import datetime, timedelta
-import random
+from app.components.correlation import correlate_pending
+from app.components.sequences import scan_history
+from app.components.detection_stats import rebuild_detection_stats
+from app.components.baselines import rebuild_baselines
+from app.components.sketches import rebuild_latency_sketches
+from app.components.synthetic import (
+    DatasetSpec, generate_dataset, DEFAULT_SCENARIO_MIX, FILE_FORMATS, SCENARIOS
+)
+from datetime import datetime
+import argparse
 import json
 
-# Initialize database
-Base.metadata.create_all(bind=engine)
-db = SessionLocal()
-
-# Sample data
-USERS = ["alice.johnson@company.com", "bob.smith@company.com", "charlie.brown@company.com", 
-         "diana.prince@company.com", "eve.wilson@company.com", "frank.miller@company.com",
-         "grace.lee@company.com", "henry.davis@company.com"]
-
-IP_ADDRESSES = ["192.168.1.100", "10.0.0.45", "172.16.0.23", "203.0.113.42", 
-                "198.51.100.15", "203.0.113.89", "198.51.100.203"]
-
-GEO_LOCATIONS = [
-    {"country": "United States", "city": "New York", "ip": "203.0.113.42"},
-    {"country": "United States", "city": "San Francisco", "ip": "198.51.100.15"},
-    {"country": "United Kingdom", "city": "London", "ip": "203.0.113.89"},
-    {"country": "Germany", "city": "Berlin", "ip": "198.51.100.203"},
-    {"country": "Japan", "city": "Tokyo", "ip": "203.0.113.100"},
-    {"country": "Australia", "city": "Sydney", "ip": "198.51.100.250"},
-]
-
-DEVICE_IDS = ["DEV-001", "DEV-002", "DEV-003", "DEV-004", "DEV-005"]
-APPS = ["Microsoft Office 365", "Azure Portal", "SharePoint Online", "Teams", "Outlook"]
 
-OAUTH_APPS = ["ThirdPartyAnalytics", "CloudBackupService", "MarketingAutomation", "LegacyIntegration"]
-HIGH_RISK_SCOPES = ["Mail.Read", "Files.Read.All", "offline_access", "User.ReadWrite.All", "Directory.ReadWrite.All"]
-LOW_RISK_SCOPES = ["User.Read", "openid", "profile"]
-
-ROLES = ["Global Administrator", "Security Administrator", "User Administrator", "Billing Administrator", "Exchange Administrator"]
-
-
-def create_detections():
+def create_detections(db):
     """Create detection rules"""
     detections = [
         {
@@ -151,389 +132,113 @@ def create_detections():
             "mitre_tactic": "Defense Evasion",
             "mitre_technique": "Disable or Modify Security Tools",
             "mitre_technique_id": "T1562.001"
+        },
+        {
+            "detection_id": "DET-009",
+            "name": "Identity Takeover Attack Chain",
+            "description": "Detects impossible travel followed by a high-risk OAuth consent and a privileged role assignment for the same user",
+            "required_signals": json.dumps(["detection_id=DET-002", "oauth_scopes", "role_assigned=true", "timestamp"]),
+            "detection_logic": "Per user, match in order: impossible travel alert, OAuth consent with high-risk scopes within 24 hours, privileged role assignment within 12 hours of the consent.",
+            "expected_false_positives": "Rare. A travelling administrator onboarding a new integration may match; verify each step with the user.",
+            "severity": SeverityLevel.CRITICAL,
+            "recommended_response": "1. Disable user account 2. Revoke all sessions 3. Block the OAuth application 4. Remove the role assignment 5. Review audit logs",
+            "mitre_tactic": "Privilege Escalation",
+            "mitre_technique": "Valid Accounts: Cloud Accounts",
+            "mitre_technique_id": "T1078.004"
         }
     ]
 
     for det_data in detections:
         detection = Detection(**det_data)
         db.add(detection)
-    
+
     db.commit()
     print(f"Created {len(detections)} detection rules")
 
 
-def generate_mfa_fatigue_scenario():
-    """Generate MFA Fatigue attack scenario"""
-    user = random.choice(USERS)
-    base_time = datetime.utcnow() - timedelta(hours=2)
-    ip = random.choice(IP_ADDRESSES)
-    geo = random.choice(GEO_LOCATIONS)
-    
-    events = []
-    
-    # Generate 8-15 failed MFA prompts
-    num_prompts = random.randint(8, 15)
-    for i in range(num_prompts):
-        event = SecurityEvent(
-            timestamp=base_time + timedelta(minutes=i*2),
-            user=user,
-            ip_address=ip,
-            geo_country=geo["country"],
-            geo_city=geo["city"],
-            device_id=random.choice(DEVICE_IDS),
-            device_compliance="Compliant",
-            app_name=random.choice(APPS),
-            sign_in_result=SignInResult.FAIL,
-            mfa_required=True,
-            mfa_result=random.choice([MFAResult.FAIL, MFAResult.TIMEOUT]),
-            risk_level=RiskLevel.MEDIUM,
-            scenario_type="mfa_fatigue",
-            detection_triggered=False
-        )
-        events.append(event)
-    
-    # Final successful sign-in
-    success_event = SecurityEvent(
-        timestamp=base_time + timedelta(minutes=num_prompts*2 + 1),
-        user=user,
-        ip_address=ip,
-        geo_country=geo["country"],
-        geo_city=geo["city"],
-        device_id=random.choice(DEVICE_IDS),
-        device_compliance="Compliant",
-        app_name=random.choice(APPS),
-        sign_in_result=SignInResult.SUCCESS,
-        mfa_required=True,
-        mfa_result=MFAResult.PASS,
-        risk_level=RiskLevel.HIGH,
-        alert_name="MFA Fatigue Attack Detected",
-        alert_severity=SeverityLevel.HIGH,
-        mitre_tactic="Initial Access",
-        mitre_technique="Multi-Factor Authentication Request Generation",
-        detection_id="DET-001",
-        detection_triggered=True,
-        scenario_type="mfa_fatigue"
-    )
-    events.append(success_event)
-    
-    # Create alert
-    alert = Alert(
-        alert_name="MFA Fatigue Attack Detected",
-        severity=SeverityLevel.HIGH,
-        detection_id="DET-001",
-        user=user,
-        ip_address=ip,
-        timestamp=success_event.timestamp,
-        scenario_type="mfa_fatigue",
-        mitre_tactic="Initial Access",
-        mitre_technique="Multi-Factor Authentication Request Generation"
-    )
-    db.add(alert)
-    
-    # Create incident
-    incident = Incident(
-        incident_id=f"INC-{random.randint(1000, 9999)}",
-        title=f"MFA Fatigue Attack - {user}",
-        description=f"User {user} received {num_prompts} MFA prompts with failures/timeouts, followed by successful authentication",
-        severity=SeverityLevel.HIGH,
-        status=IncidentStatus.OPEN,
-        scenario_type="mfa_fatigue",
-        user=user,
-        detection_id="DET-001",
-        detected_at=success_event.timestamp,
-        mttd_minutes=random.uniform(5, 15)
-    )
-    db.add(incident)
-    
-    for event in events:
-        db.add(event)
-    
-    db.commit()
-    print(f"Generated MFA Fatigue scenario for {user} with {len(events)} events")
+def parse_scenario_mix(value):
+    """``mfa_fatigue=30,oauth_abuse=5``; scenario types not listed keep their default count"""
+    mix = dict(DEFAULT_SCENARIO_MIX)
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        name, _, count = part.partition("=")
+        if name not in SCENARIOS or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"Expected scenario=count with scenario in {', '.join(SCENARIOS)}")
+        mix[name] = int(count)
+    return mix
 
 
-def generate_impossible_travel_scenario():
-    """Generate Impossible Travel attack scenario"""
-    user = random.choice(USERS)
-    base_time = datetime.utcnow() - timedelta(hours=1)
-    
-    # First location (e.g., New York)
-    loc1 = GEO_LOCATIONS[0]
-    event1 = SecurityEvent(
-        timestamp=base_time,
-        user=user,
-        ip_address=loc1["ip"],
-        geo_country=loc1["country"],
-        geo_city=loc1["city"],
-        device_id=random.choice(DEVICE_IDS),
-        device_compliance="Compliant",
-        app_name=random.choice(APPS),
-        sign_in_result=SignInResult.SUCCESS,
-        mfa_required=True,
-        mfa_result=MFAResult.PASS,
-        risk_level=RiskLevel.LOW,
-        scenario_type="impossible_travel",
-        detection_triggered=False
-    )
-    db.add(event1)
-    
-    # Second location far away (e.g., Tokyo) within 30 minutes
-    loc2 = GEO_LOCATIONS[4]  # Tokyo
-    event2 = SecurityEvent(
-        timestamp=base_time + timedelta(minutes=random.randint(15, 30)),
-        user=user,
-        ip_address=loc2["ip"],
-        geo_country=loc2["country"],
-        geo_city=loc2["city"],
-        device_id=random.choice(DEVICE_IDS),
-        device_compliance="Compliant",
-        app_name=random.choice(APPS),
-        sign_in_result=SignInResult.SUCCESS,
-        mfa_required=True,
-        mfa_result=MFAResult.PASS,
-        risk_level=RiskLevel.HIGH,
-        alert_name="Impossible Travel Detected",
-        alert_severity=SeverityLevel.HIGH,
-        mitre_tactic="Initial Access",
-        mitre_technique="Valid Accounts",
-        detection_id="DET-002",
-        detection_triggered=True,
-        scenario_type="impossible_travel"
-    )
-    db.add(event2)
-    
-    # Create alert
-    alert = Alert(
-        alert_name="Impossible Travel Detected",
-        severity=SeverityLevel.HIGH,
-        detection_id="DET-002",
-        user=user,
-        ip_address=loc2["ip"],
-        timestamp=event2.timestamp,
-        scenario_type="impossible_travel",
-        mitre_tactic="Initial Access",
-        mitre_technique="Valid Accounts"
-    )
-    db.add(alert)
-    
-    # Create incident
-    incident = Incident(
-        incident_id=f"INC-{random.randint(1000, 9999)}",
-        title=f"Impossible Travel - {user}",
-        description=f"User {user} authenticated from {loc1['city']}, {loc1['country']} and then {loc2['city']}, {loc2['country']} within 30 minutes",
-        severity=SeverityLevel.HIGH,
-        status=IncidentStatus.OPEN,
-        scenario_type="impossible_travel",
-        user=user,
-        detection_id="DET-002",
-        detected_at=event2.timestamp,
-        mttd_minutes=random.uniform(10, 25)
-    )
-    db.add(incident)
-    
-    db.commit()
-    print(f"Generated Impossible Travel scenario for {user}")
-
+def build_derived_data(db):
+    """Sequence alerts, correlated incidents and the materialized stats over the loaded history"""
+    # Raise multi-stage chain alerts over the generated history
+    chains = scan_history(db, persist=True)
+    print(f"Sequence scan raised {chains['alerts_created']} attack-chain alerts")
 
-def generate_oauth_consent_abuse_scenario():
-    """Generate OAuth Consent Abuse scenario"""
-    user = random.choice(USERS)
-    base_time = datetime.utcnow() - timedelta(hours=3)
-    geo = random.choice(GEO_LOCATIONS)
-    app_name = random.choice(OAUTH_APPS)
-    scopes = ", ".join(random.sample(HIGH_RISK_SCOPES, 3))
-    
-    event = SecurityEvent(
-        timestamp=base_time,
-        user=user,
-        ip_address=geo["ip"],
-        geo_country=geo["country"],
-        geo_city=geo["city"],
-        device_id=random.choice(DEVICE_IDS),
-        oauth_app_name=app_name,
-        oauth_scopes=scopes,
-        risk_level=RiskLevel.MEDIUM,
-        alert_name="OAuth App Consent with High-Risk Scopes",
-        alert_severity=SeverityLevel.MEDIUM,
-        mitre_tactic="Persistence",
-        mitre_technique="Cloud Accounts",
-        detection_id="DET-005",
-        detection_triggered=True,
-        scenario_type="oauth_abuse"
-    )
-    db.add(event)
-    
-    # Create alert
-    alert = Alert(
-        alert_name="OAuth App Consent with High-Risk Scopes",
-        severity=SeverityLevel.MEDIUM,
-        detection_id="DET-005",
-        user=user,
-        ip_address=geo["ip"],
-        timestamp=base_time,
-        scenario_type="oauth_abuse",
-        mitre_tactic="Persistence",
-        mitre_technique="Cloud Accounts"
-    )
-    db.add(alert)
-    
-    # Create incident
-    incident = Incident(
-        incident_id=f"INC-{random.randint(1000, 9999)}",
-        title=f"OAuth Consent Abuse - {app_name}",
-        description=f"User {user} consented to OAuth app '{app_name}' with high-risk scopes: {scopes}",
-        severity=SeverityLevel.MEDIUM,
-        status=IncidentStatus.OPEN,
-        scenario_type="oauth_abuse",
-        user=user,
-        detection_id="DET-005",
-        detected_at=base_time,
-        mttd_minutes=random.uniform(15, 45)
-    )
-    db.add(incident)
-    
-    db.commit()
-    print(f"Generated OAuth Consent Abuse scenario for {user} with app {app_name}")
+    # Group scenario alerts into correlated incidents
+    print("\nCorrelating alerts into incidents...")
+    summary = correlate_pending(db)
+    print(f"Linked {summary['processed_alerts']} alerts, merged {summary['incidents_merged']} incidents")
+    rebuild_detection_stats(db)
+    rebuild_latency_sketches(db)
+    print(f"Built behavioural baselines for {rebuild_baselines(db)} users")
 
 
-def generate_privilege_escalation_scenario():
-    """Generate Privilege Escalation scenario"""
-    user = random.choice(USERS)
-    # Outside business hours (e.g., 2 AM)
-    base_time = datetime.utcnow().replace(hour=2, minute=0, second=0) - timedelta(days=1)
-    geo = random.choice(GEO_LOCATIONS)
-    role = random.choice(ROLES)
-    
-    # Role assignment event
-    event1 = SecurityEvent(
-        timestamp=base_time,
-        user=user,
-        ip_address=geo["ip"],
-        geo_country=geo["country"],
-        geo_city=geo["city"],
-        role_assigned=True,
-        role_name=role,
-        risk_level=RiskLevel.HIGH,
-        alert_name="Privileged Role Assigned Outside Business Hours",
-        alert_severity=SeverityLevel.HIGH,
-        mitre_tactic="Privilege Escalation",
-        mitre_technique="Cloud Account",
-        detection_id="DET-006",
-        detection_triggered=True,
-        scenario_type="privilege_escalation"
-    )
-    db.add(event1)
-    
-    # Follow-up suspicious activity
-    event2 = SecurityEvent(
-        timestamp=base_time + timedelta(minutes=10),
-        user=user,
-        ip_address=geo["ip"],
-        geo_country=geo["country"],
-        geo_city=geo["city"],
-        azure_activity=AzureActivityType.POLICY_CHANGE,
-        risk_level=RiskLevel.HIGH,
-        scenario_type="privilege_escalation",
-        detection_triggered=False
-    )
-    db.add(event2)
-    
-    # Create alert
-    alert = Alert(
-        alert_name="Privileged Role Assigned Outside Business Hours",
-        severity=SeverityLevel.HIGH,
-        detection_id="DET-006",
-        user=user,
-        ip_address=geo["ip"],
-        timestamp=base_time,
-        scenario_type="privilege_escalation",
-        mitre_tactic="Privilege Escalation",
-        mitre_technique="Cloud Account"
-    )
-    db.add(alert)
-    
-    # Create incident
-    incident = Incident(
-        incident_id=f"INC-{random.randint(1000, 9999)}",
-        title=f"Privilege Escalation - {role} assigned to {user}",
-        description=f"User {user} was assigned privileged role '{role}' outside business hours, followed by suspicious policy changes",
-        severity=SeverityLevel.HIGH,
-        status=IncidentStatus.OPEN,
-        scenario_type="privilege_escalation",
-        user=user,
-        detection_id="DET-006",
-        detected_at=base_time,
-        mttd_minutes=random.uniform(20, 60)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic detection engineering data")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=8, help="User population size")
+    parser.add_argument("--events", type=int, default=200, help="Background sign-in events")
+    parser.add_argument("--days", type=float, default=7, help="Time span ending at --end")
+    parser.add_argument("--end", help="End of the time span as an ISO timestamp (default: now)")
+    parser.add_argument("--scenarios", type=parse_scenario_mix, default=dict(DEFAULT_SCENARIO_MIX),
+                        help="Attack scenario counts, e.g. mfa_fatigue=300,attack_chain=50")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Generator processes")
+    parser.add_argument("--output", help="Write files to this directory instead of the database")
+    parser.add_argument("--format", choices=FILE_FORMATS, default="jsonl", help="File format with --output")
+    parser.add_argument("--append", action="store_true", help="Keep existing data")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="Drop event indexes during the load and rebuild them afterwards")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="Skip sequence scan, correlation and stats rebuilds after loading")
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        seed=args.seed, users=args.users, events=args.events, days=args.days,
+        end=datetime.fromisoformat(args.end) if args.end else None, scenario_mix=args.scenarios,
     )
-    db.add(incident)
-    
-    db.commit()
-    print(f"Generated Privilege Escalation scenario for {user} with role {role}")
-
-
-def generate_normal_events():
-    """Generate normal baseline events"""
-    base_time = datetime.utcnow() - timedelta(days=7)
-    
-    for i in range(200):  # 200 normal events
-        user = random.choice(USERS)
-        geo = random.choice(GEO_LOCATIONS)
-        event = SecurityEvent(
-            timestamp=base_time + timedelta(hours=i*0.8),
-            user=user,
-            ip_address=geo["ip"],
-            geo_country=geo["country"],
-            geo_city=geo["city"],
-            device_id=random.choice(DEVICE_IDS),
-            device_compliance=random.choice(["Compliant", "NonCompliant"]),
-            app_name=random.choice(APPS),
-            sign_in_result=random.choice([SignInResult.SUCCESS, SignInResult.FAIL]),
-            mfa_required=random.choice([True, False]),
-            mfa_result=random.choice([MFAResult.PASS, MFAResult.FAIL]) if random.choice([True, False]) else None,
-            risk_level=random.choice([RiskLevel.LOW, RiskLevel.MEDIUM]),
-            scenario_type="normal",
-            detection_triggered=False
-        )
-        db.add(event)
-    
-    db.commit()
-    print("Generated 200 normal baseline events")
 
-
-if __name__ == "__main__":
     print("Generating Detection Engineering Simulation data...")
     print("=" * 60)
-    
-    # Clear existing data
-    db.query(SecurityEvent).delete()
-    db.query(Detection).delete()
-    db.query(Alert).delete()
-    db.query(Incident).delete()
-    db.commit()
-    
-    # Create detections
-    create_detections()
-    
-    # Generate attack scenarios (multiple instances)
-    print("\nGenerating attack scenarios...")
-    for _ in range(3):
-        generate_mfa_fatigue_scenario()
-    for _ in range(2):
-        generate_impossible_travel_scenario()
-    for _ in range(2):
-        generate_oauth_consent_abuse_scenario()
-    for _ in range(2):
-        generate_privilege_escalation_scenario()
-    
-    # Generate normal events
-    print("\nGenerating normal baseline events...")
-    generate_normal_events()
-    
-    print("\n" + "=" * 60)
-    print("Data generation complete!")
-    print(f"Total events: {db.query(SecurityEvent).count()}")
-    print(f"Total alerts: {db.query(Alert).count()}")
-    print(f"Total incidents: {db.query(Incident).count()}")
-    print(f"Total detections: {db.query(Detection).count()}")
-    
-    db.close()
+
+    if args.output:
+        print(json.dumps(generate_dataset(spec, output_dir=args.output, fmt=args.format, workers=args.workers), indent=2))
+        sys.exit(0)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if not args.append:
+            # Clear existing data, and the state derived from it that would otherwise point at reused ids
+            for model in (ResponseJob, ResponseAction, IncidentAlert, Incident, Alert, Detection, SecurityEvent,
+                          DetectionWatermark, ScheduledDetectionRun, DetectionStats, DetectionAlertBucket,
+                          LatencySketch, UserBaseline, UebaScore, IpIntel):
+                db.query(model).delete()
+            db.commit()
+
+            # Create detections
+            create_detections(db)
+
+        print(f"\nGenerating {spec.events} events for {spec.users} users across {spec.shards} shards...")
+        result = generate_dataset(spec, engine=engine, workers=args.workers, defer_indexes=args.defer_indexes)
+        print(json.dumps(result, indent=2))
+
+        if not args.skip_derived:
+            build_derived_data(db)
+
+        print("\n" + "=" * 60)
+        print("Data generation complete!")
+        print(f"Total events: {db.query(SecurityEvent).count()}")
+        print(f"Total alerts: {db.query(Alert).count()}")
+        print(f"Total incidents: {db.query(Incident).count()}")
+        print(f"Total detections: {db.query(Detection).count()}")
+    finally:
+        db.close()
@@ -0,0 +1,64 @@
+"""
+Rule cost report for Detection Engineering Simulation Dashboard
+Replays stored events through the in-process detection rules with profiling
+enabled, or fetches the live profile from a running API server.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models import SessionLocal
+from app.components.profiling import RuleProfiler, format_report
+from app.components.sequences import scan_history
+from datetime import datetime
+from time import perf_counter
+from urllib.request import urlopen
+import argparse
+import json
+
+
+def replay_report(start_date=None, end_date=None, sample_every=1):
+    """Profile sequence rules over stored history"""
+    profiler = RuleProfiler(enabled=True, sample_every=sample_every)
+    db = SessionLocal()
+    try:
+        started = perf_counter()
+        result = scan_history(
+            db,
+            start=datetime.fromisoformat(start_date) if start_date else None,
+            end=datetime.fromisoformat(end_date) if end_date else None,
+            profiler=profiler
+        )
+        elapsed = perf_counter() - started
+    finally:
+        db.close()
+    title = (f"Replayed {result['events_scanned']} events in {elapsed:.2f}s, "
+             f"{len(result['matches'])} matches, peak state {result['peak_state_bytes']} bytes")
+    return profiler.report(), title
+
+
+def live_report(base_url):
+    """Fetch the profile collected by a running server"""
+    with urlopen(f"{base_url.rstrip('/')}/api/v1/detections/profile") as response:
+        data = json.load(response)
+    return data["rules"], f"Live profile from {base_url} (1 in {data['sample_every']} evaluations timed)"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report per-detection rule evaluation cost")
+    parser.add_argument("--url", help="Read the live profile from a running server, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--start-date", help="Replay events from this ISO timestamp")
+    parser.add_argument("--end-date", help="Replay events up to this ISO timestamp")
+    parser.add_argument("--sample-every", type=int, default=1, help="Time one in N evaluations during replay")
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON")
+    args = parser.parse_args()
+
+    if args.url:
+        rows, title = live_report(args.url)
+    else:
+        rows, title = replay_report(args.start_date, args.end_date, args.sample_every)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(format_report(rows, title))
@@ -0,0 +1,271 @@
+"""
+Event replay load generator for Detection Engineering Simulation Dashboard
+Streams events from generated or exported files (JSONL or CSV, e.g. from
+generate_data.py --output) into POST /api/v1/events/ingest at a controlled
+rate, either following the original timestamp deltas (optionally sped up) or at
+a fixed or linearly ramping events-per-second target. Many async clients send
+batches concurrently; the run reports achieved throughput, request latency and
+ingest-to-alert latency percentiles, with a progress line every few seconds.
+
+Latencies are measured from each batch's scheduled send time, so time spent
+waiting for a free client counts against the server (no coordinated omission).
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Iterator, List, Optional
+import argparse
+import asyncio
+import csv
+import json
+
+import httpx
+
+BOOLEAN_FIELDS = ("mfa_required", "role_assigned", "detection_triggered")
+DROPPED_FIELDS = ("created_at",)
+
+
+def read_events(path: str) -> Iterator[dict]:
+    """Events from a JSONL or CSV file, in file order"""
+    with open(path, newline="") as handle:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(handle):
+                event = {k: v for k, v in row.items() if v != "" and k not in DROPPED_FIELDS}
+                for field in BOOLEAN_FIELDS:
+                    if field in event:
+                        event[field] = event[field].lower() in ("1", "true", "yes")
+                yield event
+        else:
+            for line in handle:
+                if line.strip():
+                    event = json.loads(line)
+                    for field in DROPPED_FIELDS:
+                        event.pop(field, None)
+                    yield event
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(values[-1] * 1000, 1)}
+
+
+class Schedule:
+    """Send offset (seconds from start) of the n-th event"""
+
+    def __init__(self, eps: Optional[float], ramp_to: Optional[float], ramp_seconds: float, speedup: float):
+        self.eps = eps
+        self.ramp_to = ramp_to if ramp_to is not None else eps
+        self.ramp_seconds = ramp_seconds
+        self.speedup = speedup
+        self.first_ts = None
+        self.pass_start = 0.0
+        self.replay_offset = 0.0
+
+    def restart(self):
+        """Begin another pass over the file; timestamp pacing continues from the current offset"""
+        self.first_ts = None
+        self.pass_start = self.replay_offset
+
+    def offset(self, n: int, timestamp: Optional[datetime]) -> float:
+        if self.eps is None:
+            # Original pacing: event time deltas divided by the speedup
+            if timestamp is None:
+                return self.replay_offset
+            if self.first_ts is None:
+                self.first_ts = timestamp
+            self.replay_offset = max(
+                self.replay_offset, self.pass_start + (timestamp - self.first_ts).total_seconds() / self.speedup
+            )
+            return self.replay_offset
+        if self.ramp_to == self.eps or not self.ramp_seconds:
+            return n / self.eps
+        # Linear ramp r(t) = a + b t; solve a t + b t^2 / 2 = n during the ramp, constant rate after it
+        a, b = self.eps, (self.ramp_to - self.eps) / self.ramp_seconds
+        ramp_events = (a + self.ramp_to) / 2 * self.ramp_seconds
+        if n >= ramp_events:
+            return self.ramp_seconds + (n - ramp_events) / self.ramp_to
+        if b == 0:
+            return n / a
+        return (-a + (a * a + 2 * b * n) ** 0.5) / b
+
+
+class Replay:
+    def __init__(self, args):
+        self.args = args
+        self.schedule = Schedule(args.eps, args.ramp_to, args.ramp_seconds, args.speedup)
+        self.request_latency: List[float] = []
+        self.alert_latency: List[float] = []
+        self.lag: List[float] = []
+        self.sent = self.requests = self.errors = self.alerts = self.incidents = 0
+        self.status_codes = {}
+        self.started = None
+        self.time_shift: Optional[timedelta] = None
+
+    def _retime(self, event: dict) -> Optional[datetime]:
+        ts = event.get("timestamp")
+        if not ts:
+            return None
+        ts = datetime.fromisoformat(ts)
+        if self.args.retime:
+            # Shift the recording so its first event happens now, keeping the original deltas
+            if self.time_shift is None:
+                self.time_shift = datetime.utcnow() - ts
+            event["timestamp"] = (ts + self.time_shift).isoformat()
+        return ts
+
+    def batches(self) -> Iterator[tuple]:
+        """(scheduled offset, events) batches, honouring --limit and --loop"""
+        n = 0
+        while True:
+            batch, batch_offset = [], None
+            for event in read_events(self.args.file):
+                if self.args.limit and n >= self.args.limit:
+                    break
+                offset = self.schedule.offset(n, self._retime(event))
+                n += 1
+                if batch and offset - batch_offset > self.args.max_batch_wait:
+                    # Do not hold early events back waiting for a full batch
+                    yield batch_offset, batch
+                    batch = []
+                if not batch:
+                    batch_offset = offset
+                batch.append(event)
+                if len(batch) >= self.args.batch_size:
+                    yield batch_offset, batch
+                    batch = []
+            if batch:
+                yield batch_offset, batch
+            if not self.args.loop or (self.args.limit and n >= self.args.limit):
+                return
+            self.schedule.restart()
+            self.time_shift = None
+
+    async def client(self, http: httpx.AsyncClient, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            offset, batch = item
+            due = self.started + offset
+            delay = due - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.lag.append(-delay)
+            try:
+                response = await http.post(self.args.path, json=batch)
+                elapsed = monotonic() - due
+                self.status_codes[response.status_code] = self.status_codes.get(response.status_code, 0) + 1
+                body = response.json() if response.status_code == 200 else {}
+                if response.status_code != 200 or "error" in body:
+                    self.errors += 1
+                else:
+                    self.request_latency.append(elapsed)
+                    # Stream detections run inside the request, so the response carries the new alerts
+                    for _ in body.get("alerts", []):
+                        self.alert_latency.append(elapsed)
+                    self.alerts += len(body.get("alerts", []))
+                    self.incidents += body.get("incidents_created", 0)
+            except httpx.HTTPError:
+                self.errors += 1
+            self.sent += len(batch)
+            self.requests += 1
+
+    async def report(self):
+        previous_sent, previous_time = 0, self.started
+        while True:
+            await asyncio.sleep(self.args.report_every)
+            now = monotonic()
+            recent = self.request_latency[-1000:]
+            print(json.dumps({
+                "elapsed_s": round(now - self.started, 1),
+                "sent": self.sent,
+                "eps": round((self.sent - previous_sent) / (now - previous_time), 1),
+                "target_eps": round(self._target_eps(now - self.started), 1) if self.args.eps else None,
+                "latency_ms": percentiles(recent),
+                "alerts": self.alerts,
+                "errors": self.errors,
+            }), file=sys.stderr, flush=True)
+            previous_sent, previous_time = self.sent, now
+
+    def _target_eps(self, t: float) -> float:
+        s = self.schedule
+        if not s.ramp_seconds or t >= s.ramp_seconds:
+            return s.ramp_to
+        return s.eps + (s.ramp_to - s.eps) * t / s.ramp_seconds
+
+    async def run(self) -> dict:
+        transport = None
+        if self.args.in_process:
+            from app.main import app
+            transport = httpx.ASGITransport(app=app)
+        limits = httpx.Limits(max_connections=self.args.clients, max_keepalive_connections=self.args.clients)
+        async with httpx.AsyncClient(base_url=self.args.url, transport=transport, limits=limits,
+                                     timeout=self.args.timeout) as http:
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.args.clients * 4)
+            self.started = monotonic()
+            clients = [asyncio.create_task(self.client(http, queue)) for _ in range(self.args.clients)]
+            reporter = asyncio.create_task(self.report())
+            deadline = self.started + self.args.duration if self.args.duration else None
+            for offset, batch in self.batches():
+                if deadline and self.started + offset >= deadline:
+                    break
+                await queue.put((offset, batch))
+            for _ in clients:
+                await queue.put(None)
+            await asyncio.gather(*clients)
+            reporter.cancel()
+        elapsed = monotonic() - self.started
+        return {
+            "file": self.args.file,
+            "mode": "timestamps" if self.args.eps is None else ("ramp" if self.args.ramp_to else "fixed"),
+            "clients": self.args.clients,
+            "batch_size": self.args.batch_size,
+            "elapsed_s": round(elapsed, 2),
+            "events_sent": self.sent,
+            "requests": self.requests,
+            "achieved_eps": round(self.sent / elapsed, 1) if elapsed else 0,
+            "errors": self.errors,
+            "status_codes": self.status_codes,
+            "request_latency_ms": percentiles(self.request_latency),
+            "ingest_to_alert_ms": percentiles(self.alert_latency),
+            "behind_schedule_ms": percentiles(self.lag),
+            "alerts": self.alerts,
+            "incidents_created": self.incidents,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay event files against the ingest API at a controlled rate")
+    parser.add_argument("file", help="JSONL or CSV event file")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/api/v1/events/ingest")
+    parser.add_argument("--eps", type=float, help="Target events per second (default: original timestamp pacing)")
+    parser.add_argument("--ramp-to", type=float, help="Ramp linearly from --eps to this rate")
+    parser.add_argument("--ramp-seconds", type=float, default=0, help="Duration of the ramp")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Time compression for timestamp pacing")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent async clients")
+    parser.add_argument("--batch-size", type=int, default=50, help="Events per ingest request")
+    parser.add_argument("--max-batch-wait", type=float, default=0.25,
+                        help="Send a partial batch once its events span this many seconds of schedule")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--limit", type=int, help="Stop after this many events")
+    parser.add_argument("--loop", action="store_true", help="Start the file again when it ends")
+    parser.add_argument("--retime", action="store_true",
+                        help="Rewrite timestamps so the recording starts now (keeps deltas)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--report-every", type=float, default=5, help="Seconds between progress lines on stderr")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Call the app in this process instead of over HTTP (no server needed)")
+    args = parser.parse_args()
+    if args.ramp_to is not None and args.eps is None:
+        parser.error("--ramp-to needs --eps as the starting rate")
+    print(json.dumps(asyncio.run(Replay(args).run()), indent=2))
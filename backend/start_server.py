@@ -1,18 +1,199 @@
 #!/usr/bin/env python
-"""Simple script to start the backend server"""
+"""
+Start the backend server
+
+Without options this runs a single auto-reloading development server. With
+--production the app is imported once (schema check, detection rules, imports),
+warmed up (baselines, entity graph, hot routes) and only then forked into
+--workers processes sharing one listening socket, so every worker serves its
+first request warm. --no-preload lets uvicorn start the workers instead; each
+then imports the app and warms up in its own startup hook.
+
+Workers share the database but not memory. With more than one worker, ingest
+only stores events and the worker holding the stream_processor lease runs
+sequence detection and correlation over them; the entity graph and hot tier
+of every worker pick up other workers' events from the database. The live
+feed stays per worker: a subscriber sees changes committed by the worker it
+is connected to, which includes the stream owner's alerts and incidents only
+when that is the same worker. Run one worker when the feed must be complete.
+
+--measure-startup launches the server with the remaining options, polls until
+the first request is served and reports the cold-start time and the latency of
+the first call to each hot route against a repeated call.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from time import perf_counter, sleep
+import argparse
+import json
+import signal
+import socket
+import subprocess
+
 import uvicorn
 
-if __name__ == "__main__":
+PROBE_ROUTES = ["/api/v1/dashboard/kpis", "/api/v1/incidents", "/api/v1/events?limit=50", "/api/v1/graph/stats"]
+
+
+def serve_development(args):
     print("=" * 60)
     print("Starting Detection Engineering Dashboard Backend")
     print("=" * 60)
-    print("Backend will be available at: http://localhost:8000")
-    print("API docs will be at: http://localhost:8000/docs")
+    print(f"Backend will be available at: http://{args.host}:{args.port}")
+    print(f"API docs will be at: http://{args.host}:{args.port}/docs")
     print("Press Ctrl+C to stop the server")
     print("=" * 60)
-    uvicorn.run(
-        "app.main:app",
-        host="127.0.0.1",
-        port=8000,
-        reload=True
-    )
+    uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+
+
+def serve_workers(args):
+    """uvicorn's own multi-process mode: every worker imports and warms the app itself"""
+    os.environ["SERVER_WARMUP"] = "false" if args.no_warmup else "true"
+    os.environ["SERVER_WORKERS"] = str(args.workers)
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level, access_log=False, backlog=args.backlog)
+
+
+def serve_preforked(args):
+    """Import and warm the app once, then fork workers that inherit it"""
+    started = perf_counter()
+    # Read at import: decides whether ingest defers stream detection to the lease holder
+    os.environ["SERVER_WORKERS"] = str(args.workers)
+    from app.main import app
+    from app.models import engine, read_engine
+    from app.components.startup import startup_state, warm_up
+
+    if not args.no_warmup:
+        warm_up(app)
+    # Connections must not be shared across fork; each worker opens its own
+    engine.dispose()
+    read_engine.dispose()
+    print(json.dumps({
+        "preload_ms": round((perf_counter() - started) * 1000, 1),
+        "schema_created": startup_state["schema_created"],
+        "warmup_ms": (startup_state["warmup"] or {}).get("total_ms"),
+        "workers": args.workers,
+    }), flush=True)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(args.backlog)
+    listener.set_inheritable(True)
+
+    def spawn(worker_id: int) -> int:
+        pid = os.fork()
+        if pid:
+            return pid
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.environ["SERVER_WORKER_ID"] = str(worker_id)
+        config = uvicorn.Config(app, log_level=args.log_level, access_log=False)
+        try:
+            uvicorn.Server(config).run(sockets=[listener])
+        finally:
+            os._exit(0)
+
+    children = {spawn(i): i for i in range(args.workers)}
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_id = children.pop(pid, None)
+        if worker_id is not None and not stopping:
+            print(f"Worker {worker_id} (pid {pid}) exited with status {status}; restarting", file=sys.stderr, flush=True)
+            children[spawn(worker_id)] = worker_id
+    listener.close()
+
+
+def measure_startup(server_args, host, port, timeout):
+    """Time from launching the server to its first served request, then first versus repeated route calls"""
+    import httpx
+
+    command = [sys.executable, os.path.abspath(__file__)] + server_args + ["--host", host, "--port", str(port)]
+    started = perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://{host}:{port}"
+    result = {"command": " ".join(server_args)}
+    try:
+        # A fresh connection per call keeps delayed-ACK stalls on reused connections out of the timings
+        with httpx.Client(base_url=base_url, timeout=60, headers={"Connection": "close"}) as client:
+            while True:
+                if process.poll() is not None:
+                    return {**result, "error": f"server exited with status {process.returncode}"}
+                if perf_counter() - started > timeout:
+                    return {**result, "error": "timed out waiting for the first response"}
+                try:
+                    if client.get("/api/v1/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                sleep(0.02)
+            result["time_to_first_response_ms"] = round((perf_counter() - started) * 1000, 1)
+            routes = {}
+            for route in PROBE_ROUTES:
+                timings = []
+                for _ in range(2):
+                    call_started = perf_counter()
+                    client.get(route)
+                    timings.append(round((perf_counter() - call_started) * 1000, 1))
+                routes[route] = {"first_ms": timings[0], "repeat_ms": timings[1]}
+            result["routes"] = routes
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the Detection Engineering Dashboard backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--production", action="store_true",
+                        help="Multi-process server without auto-reload (default: development server)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-preload", action="store_true", help="Let each worker import the app itself")
+    parser.add_argument("--no-warmup", action="store_true", help="Accept traffic without warming caches first")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="Launch the server with the other options and report cold-start timings")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    if args.measure_startup:
+        server_args = ["--log-level", args.log_level]
+        if args.production:
+            server_args += ["--production", "--workers", str(args.workers)]
+        if args.no_preload:
+            server_args.append("--no-preload")
+        if args.no_warmup:
+            server_args.append("--no-warmup")
+        print(json.dumps(measure_startup(server_args, args.host, args.port, args.startup_timeout), indent=2))
+    elif not args.production:
+        serve_development(args)
+    elif args.no_preload or not hasattr(os, "fork"):
+        serve_workers(args)
+    else:
+        serve_preforked(args)
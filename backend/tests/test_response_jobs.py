@@ -0,0 +1,84 @@
+"""
+Response job queue tests
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from time import sleep
+import json
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models import init_db, configure_sqlite, Incident, IncidentStatus, ResponseAction, SeverityLevel
+from app.components.jobs import ResponseJobQueue, SimulatedExecutor
+
+
+def test_parallel_jobs_on_one_incident_keep_every_action(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda dbapi_connection, record: configure_sqlite(dbapi_connection))
+    init_db(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = session_factory()
+    db.add(Incident(incident_id="INC-1", title="t", severity=SeverityLevel.HIGH, status=IncidentStatus.OPEN,
+                    user="alice@example.com", detected_at=datetime.utcnow(), response_actions="[]"))
+    db.commit()
+
+    jobs = 3
+    queue = ResponseJobQueue(workers=jobs, session_factory=session_factory,
+                             executor=SimulatedExecutor(latency_ms=300, jitter_ms=0, failure_rate=0, seed=1))
+    queue.start(recover=False)
+    try:
+        for action_type in ("revoke_sessions", "password_reset", "disable_user"):
+            queue.submit(db, "INC-1", action_type)
+        for _ in range(200):
+            if queue.completed["succeeded"] + queue.completed["failed"] >= jobs:
+                break
+            sleep(0.05)
+    finally:
+        queue.stop()
+
+    db.expire_all()
+    incident = db.query(Incident).filter(Incident.incident_id == "INC-1").one()
+    assert queue.completed["succeeded"] == jobs
+    assert len(json.loads(incident.response_actions)) == jobs
+    assert db.query(ResponseAction).filter(ResponseAction.incident_id == "INC-1").count() == jobs
+    assert incident.status == IncidentStatus.RESOLVED
+    db.close()
+    engine.dispose()
+
+
+def test_job_on_merged_incident_fails_without_acting(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda dbapi_connection, record: configure_sqlite(dbapi_connection))
+    init_db(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = session_factory()
+    db.add(Incident(incident_id="INC-2", title="t", severity=SeverityLevel.HIGH, status=IncidentStatus.OPEN,
+                    user="alice@example.com", detected_at=datetime.utcnow(), response_actions="[]",
+                    merged_into="INC-1"))
+    db.commit()
+
+    queue = ResponseJobQueue(workers=1, session_factory=session_factory,
+                             executor=SimulatedExecutor(latency_ms=0, jitter_ms=0, failure_rate=0, seed=1))
+    queue.start(recover=False)
+    try:
+        queue.submit(db, "INC-2", "disable_user")
+        for _ in range(200):
+            if queue.completed["succeeded"] + queue.completed["failed"] >= 1:
+                break
+            sleep(0.05)
+    finally:
+        queue.stop()
+
+    db.expire_all()
+    incident = db.query(Incident).filter(Incident.incident_id == "INC-2").one()
+    assert queue.completed["failed"] == 1
+    assert incident.status == IncidentStatus.OPEN
+    assert db.query(ResponseAction).filter(ResponseAction.incident_id == "INC-2").count() == 0
+    db.close()
+    engine.dispose()
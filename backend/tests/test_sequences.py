@@ -0,0 +1,54 @@
+"""
+Sequence engine tests
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+from app.models import SecurityEvent
+from app.components.sequences import SequenceEngine, IDENTITY_TAKEOVER_CHAIN
+
+START = datetime(2026, 10, 1, 8, 0)
+USER = "alice@example.com"
+
+
+def _travel(event_id: int, hours: float) -> SecurityEvent:
+    return SecurityEvent(id=event_id, user=USER, timestamp=START + timedelta(hours=hours),
+                         detection_triggered=True, detection_id="DET-002")
+
+
+def _consent(event_id: int, hours: float) -> SecurityEvent:
+    return SecurityEvent(id=event_id, user=USER, timestamp=START + timedelta(hours=hours),
+                         oauth_app_name="Mail Sync", oauth_scopes="Mail.Read,offline_access")
+
+
+def _role(event_id: int, hours: float) -> SecurityEvent:
+    return SecurityEvent(id=event_id, user=USER, timestamp=START + timedelta(hours=hours),
+                         role_assigned=True, role_name="Global Administrator")
+
+
+def test_chain_restarting_mid_window_is_detected():
+    engine = SequenceEngine([IDENTITY_TAKEOVER_CHAIN])
+    # The first start is still pending when the real chain begins, then times out before its consent
+    events = [_travel(1, 0), _travel(2, 20), _consent(3, 30), _role(4, 31)]
+    matches = [match for event in events for match in engine.process(event)]
+
+    assert len(matches) == 1
+    assert matches[0].event_ids == (2, 3, 4)
+    assert matches[0].started_at == START + timedelta(hours=20)
+    assert engine.partial_counts == [0]
+    assert not engine.states
+
+
+def test_restarted_partial_is_not_evicted_by_the_replaced_deadline():
+    engine = SequenceEngine([IDENTITY_TAKEOVER_CHAIN])
+    engine.process(_travel(1, 0))
+    engine.process(_travel(2, 20))
+    # Past the first start's 24 hour deadline, within the second's
+    engine.evict_expired(int((START + timedelta(hours=25) - datetime(1970, 1, 1)).total_seconds()))
+
+    assert engine.states[USER][0][3] == (2,)
+    assert engine.partial_counts == [1]
+    assert engine.evicted == 0
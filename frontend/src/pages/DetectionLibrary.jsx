@@ -15,8 +15,13 @@ export default function DetectionLibrary() {
   const fetchDetections = async () => {
     setLoading(true)
     try {
-      const res = await api.get('/detections')
-      setDetections(res.data)
+      // Stats for every rule come from one call and are merged into the list
+      const [detectionsRes, statsRes] = await Promise.all([
+        api.get('/detections'),
+        api.get('/detections/stats'),
+      ])
+      const stats = Object.fromEntries(statsRes.data.map((s) => [s.detection_id, s]))
+      setDetections(detectionsRes.data.map((d) => ({ ...stats[d.detection_id], ...d })))
     } catch (error) {
       console.error('Error fetching detections:', error)
     } finally {
@@ -27,7 +32,8 @@ export default function DetectionLibrary() {
   const handleDetectionClick = async (detectionId) => {
     try {
       const res = await api.get(`/detections/${detectionId}`)
-      setSelectedDetection(res.data)
+      const listed = detections.find((d) => d.detection_id === detectionId)
+      setSelectedDetection({ ...listed, ...res.data })
     } catch (error) {
       console.error('Error fetching detection details:', error)
     }
@@ -95,6 +101,9 @@ export default function DetectionLibrary() {
                   <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">
                     Severity
                   </th>
+                  <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">
+                    Alerts
+                  </th>
                 </tr>
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
@@ -122,6 +131,10 @@ export default function DetectionLibrary() {
                         {detection.severity}
                       </span>
                     </td>
+                    <td className="px-6 py-4 whitespace-nowrap">
+                      <div className="text-sm text-gray-900">{detection.alert_count ?? 0}</div>
+                      <div className="text-xs text-gray-500">{detection.alerts_24h ?? 0} in 24h</div>
+                    </td>
                   </tr>
                 ))}
               </tbody>
@@ -174,6 +187,14 @@ export default function DetectionLibrary() {
                 <div>
                   <p className="text-sm font-medium text-gray-700">Alert Count</p>
                   <p className="text-sm text-gray-900 mt-1">{selectedDetection.alert_count}</p>
+                  {selectedDetection.alerts_7d !== undefined && (
+                    <p className="text-xs text-gray-600 mt-1">
+                      {selectedDetection.alerts_24h} in 24h, {selectedDetection.alerts_7d} in 7d
+                    </p>
+                  )}
+                  {selectedDetection.last_fired_at && (
+                    <p className="text-xs text-gray-600">Last fired: {new Date(selectedDetection.last_fired_at).toLocaleString()}</p>
+                  )}
                 </div>
               )}
               {selectedDetection.example_events && selectedDetection.example_events.length > 0 && (
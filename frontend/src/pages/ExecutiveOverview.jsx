@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react'
 import { LineChart, Line, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts'
 import { AlertTriangle, Users, Clock, TrendingUp, Shield } from 'lucide-react'
-import api from '../services/api'
+import api, { subscribeLiveFeed } from '../services/api'
 
 const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884d8']
 
@@ -10,6 +10,7 @@ export default function ExecutiveOverview() {
   const [alertTrends, setAlertTrends] = useState([])
   const [signInStats, setSignInStats] = useState(null)
   const [mfaStats, setMfaStats] = useState(null)
+  const [anomalies, setAnomalies] = useState([])
   const [filters, setFilters] = useState({
     startDate: '',
     endDate: '',
@@ -24,6 +25,19 @@ export default function ExecutiveOverview() {
     fetchData()
   }, [filters])
 
+  // KPI deltas are global, so they are applied only to the unfiltered view
+  useEffect(() => {
+    if (Object.values(filters).some(Boolean)) return
+    return subscribeLiveFeed(['kpis'], {
+      kpis: (delta) => setKpis((current) => current && {
+        ...current,
+        total_alerts: current.total_alerts + (delta.total_alerts || 0),
+        high_severity_alerts: current.high_severity_alerts + (delta.high_severity_alerts || 0),
+      }),
+      overflow: fetchData,
+    })
+  }, [filters])
+
   const fetchData = async () => {
     setLoading(true)
     try {
@@ -34,17 +48,19 @@ export default function ExecutiveOverview() {
       if (filters.scenarioType) params.append('scenario_type', filters.scenarioType)
       if (filters.severity) params.append('severity', filters.severity)
 
-      const [kpisRes, trendsRes, signInRes, mfaRes] = await Promise.all([
+      const [kpisRes, trendsRes, signInRes, mfaRes, uebaRes] = await Promise.all([
         api.get(`/dashboard/kpis?${params}`),
         api.get(`/dashboard/alert-trends?${params}`),
         api.get(`/dashboard/sign-in-stats?${params}`),
-        api.get(`/dashboard/mfa-stats?${params}`)
+        api.get(`/dashboard/mfa-stats?${params}`),
+        api.get('/dashboard/ueba?limit=10')
       ])
 
       setKpis(kpisRes.data)
       setAlertTrends(trendsRes.data)
       setSignInStats(signInRes.data)
       setMfaStats(mfaRes.data)
+      setAnomalies(uebaRes.data)
     } catch (error) {
       console.error('Error fetching data:', error)
       setError(`Failed to connect to backend. Make sure it's running on http://localhost:8000. Error: ${error.message}`)
@@ -53,6 +69,7 @@ export default function ExecutiveOverview() {
       setAlertTrends([])
       setSignInStats({ success: 0, fail: 0 })
       setMfaStats({ pass: 0, fail: 0, timeout: 0 })
+      setAnomalies([])
     } finally {
       setLoading(false)
     }
@@ -192,6 +209,11 @@ export default function ExecutiveOverview() {
             <div>
               <p className="text-sm font-medium text-gray-600">MTTD (min)</p>
               <p className="text-2xl font-bold text-gray-900 mt-1">{displayKpis.mttd_minutes?.toFixed(1) || '0'}</p>
+              {displayKpis.mttd_percentiles?.count > 0 && (
+                <p className="text-xs text-gray-500 mt-1">
+                  p50 {displayKpis.mttd_percentiles.p50} · p90 {displayKpis.mttd_percentiles.p90} · p99 {displayKpis.mttd_percentiles.p99}
+                </p>
+              )}
             </div>
             <Clock className="h-8 w-8 text-green-500" />
           </div>
@@ -202,6 +224,11 @@ export default function ExecutiveOverview() {
             <div>
               <p className="text-sm font-medium text-gray-600">MTTR (min)</p>
               <p className="text-2xl font-bold text-gray-900 mt-1">{displayKpis.mttr_minutes?.toFixed(1) || '0'}</p>
+              {displayKpis.mttr_percentiles?.count > 0 && (
+                <p className="text-xs text-gray-500 mt-1">
+                  p50 {displayKpis.mttr_percentiles.p50} · p90 {displayKpis.mttr_percentiles.p90} · p99 {displayKpis.mttr_percentiles.p99}
+                </p>
+              )}
             </div>
             <TrendingUp className="h-8 w-8 text-purple-500" />
           </div>
@@ -282,6 +309,37 @@ export default function ExecutiveOverview() {
           </ResponsiveContainer>
         </div>
       </div>
+
+      {/* Behavioural Anomalies */}
+      <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-200">
+        <h3 className="text-lg font-semibold text-gray-900 mb-4">Behavioural Anomalies (UEBA)</h3>
+        {anomalies.length === 0 ? (
+          <p className="text-sm text-gray-500">No anomaly scores yet</p>
+        ) : (
+          <table className="min-w-full divide-y divide-gray-200">
+            <thead className="bg-gray-50">
+              <tr>
+                <th className="px-4 py-2 text-left text-xs font-medium text-gray-500 uppercase">User</th>
+                <th className="px-4 py-2 text-left text-xs font-medium text-gray-500 uppercase">Risk Score</th>
+                <th className="px-4 py-2 text-left text-xs font-medium text-gray-500 uppercase">Sign-In Failure Rate</th>
+                <th className="px-4 py-2 text-left text-xs font-medium text-gray-500 uppercase">MFA Timeout Rate</th>
+                <th className="px-4 py-2 text-left text-xs font-medium text-gray-500 uppercase">Distinct IPs</th>
+              </tr>
+            </thead>
+            <tbody className="divide-y divide-gray-200">
+              {anomalies.map((a) => (
+                <tr key={a.user}>
+                  <td className="px-4 py-2 text-sm text-gray-900">{a.user}</td>
+                  <td className="px-4 py-2 text-sm font-semibold text-gray-900">{a.risk_score?.toFixed(1)}</td>
+                  <td className="px-4 py-2 text-sm text-gray-600">{a.failure_rate ?? '-'} (z {a.failure_rate_score ?? '-'})</td>
+                  <td className="px-4 py-2 text-sm text-gray-600">{a.mfa_timeout_rate ?? '-'} (z {a.mfa_timeout_score ?? '-'})</td>
+                  <td className="px-4 py-2 text-sm text-gray-600">{a.distinct_ips ?? '-'} (z {a.distinct_ips_score ?? '-'})</td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+        )}
+      </div>
     </div>
   )
 }
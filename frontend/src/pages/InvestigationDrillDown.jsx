@@ -6,8 +6,18 @@ import api from '../services/api'
 export default function InvestigationDrillDown() {
   const [selectedUser, setSelectedUser] = useState('')
   const [investigation, setInvestigation] = useState(null)
+  const [events, setEvents] = useState([])
+  const [eventsCursor, setEventsCursor] = useState(null)
   const [loading, setLoading] = useState(false)
 
+  const fetchEvents = async (user, cursor) => {
+    const params = new URLSearchParams({ limit: '10' })
+    if (cursor) params.append('cursor', cursor)
+    const res = await api.get(`/users/${user}/investigation/events?${params}`)
+    setEvents((prev) => (cursor ? [...prev, ...res.data.items] : res.data.items))
+    setEventsCursor(res.data.next_cursor)
+  }
+
   const handleInvestigate = async () => {
     if (!selectedUser) return
     
@@ -15,6 +25,7 @@ export default function InvestigationDrillDown() {
     try {
       const res = await api.get(`/users/${selectedUser}/investigation`)
       setInvestigation(res.data)
+      await fetchEvents(selectedUser, null)
     } catch (error) {
       console.error('Error fetching investigation:', error)
       alert('Error fetching investigation data')
@@ -60,19 +71,19 @@ export default function InvestigationDrillDown() {
             <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
               <div>
                 <p className="text-sm text-gray-600">Total Events</p>
-                <p className="text-2xl font-bold text-gray-900">{investigation.events?.length || 0}</p>
+                <p className="text-2xl font-bold text-gray-900">{investigation.summary.events}</p>
               </div>
               <div>
                 <p className="text-sm text-gray-600">Alerts</p>
-                <p className="text-2xl font-bold text-orange-600">{investigation.alerts?.length || 0}</p>
+                <p className="text-2xl font-bold text-orange-600">{investigation.summary.alerts}</p>
               </div>
               <div>
                 <p className="text-sm text-gray-600">Incidents</p>
-                <p className="text-2xl font-bold text-red-600">{investigation.incidents?.length || 0}</p>
+                <p className="text-2xl font-bold text-red-600">{investigation.summary.incidents}</p>
               </div>
               <div>
                 <p className="text-sm text-gray-600">Unique IPs</p>
-                <p className="text-2xl font-bold text-gray-900">{investigation.unique_ips?.length || 0}</p>
+                <p className="text-2xl font-bold text-gray-900">{investigation.sections.ips.total}</p>
               </div>
             </div>
           </div>
@@ -86,11 +97,11 @@ export default function InvestigationDrillDown() {
                 <h4 className="font-semibold text-gray-900">IP Addresses</h4>
               </div>
               <div className="space-y-1">
-                {investigation.unique_ips?.slice(0, 5).map((ip, idx) => (
-                  <p key={idx} className="text-sm text-gray-600 font-mono">{ip}</p>
+                {investigation.sections.ips.items.slice(0, 5).map((ip, idx) => (
+                  <p key={idx} className="text-sm text-gray-600 font-mono">{ip.value} <span className="text-xs text-gray-400">({ip.count})</span></p>
                 ))}
-                {investigation.unique_ips?.length > 5 && (
-                  <p className="text-xs text-gray-500">+{investigation.unique_ips.length - 5} more</p>
+                {investigation.sections.ips.total > 5 && (
+                  <p className="text-xs text-gray-500">+{investigation.sections.ips.total - 5} more</p>
                 )}
               </div>
             </div>
@@ -102,8 +113,8 @@ export default function InvestigationDrillDown() {
                 <h4 className="font-semibold text-gray-900">Devices</h4>
               </div>
               <div className="space-y-1">
-                {investigation.unique_devices?.slice(0, 5).map((device, idx) => (
-                  <p key={idx} className="text-sm text-gray-600">{device}</p>
+                {investigation.sections.devices.items.slice(0, 5).map((device, idx) => (
+                  <p key={idx} className="text-sm text-gray-600">{device.value} <span className="text-xs text-gray-400">({device.count})</span></p>
                 ))}
               </div>
             </div>
@@ -115,8 +126,8 @@ export default function InvestigationDrillDown() {
                 <h4 className="font-semibold text-gray-900">Applications</h4>
               </div>
               <div className="space-y-1">
-                {investigation.unique_apps?.slice(0, 5).map((app, idx) => (
-                  <p key={idx} className="text-sm text-gray-600">{app}</p>
+                {investigation.sections.apps.items.slice(0, 5).map((app, idx) => (
+                  <p key={idx} className="text-sm text-gray-600">{app.value} <span className="text-xs text-gray-400">({app.count})</span></p>
                 ))}
               </div>
             </div>
@@ -128,9 +139,9 @@ export default function InvestigationDrillDown() {
                 <h4 className="font-semibold text-gray-900">OAuth Apps</h4>
               </div>
               <div className="space-y-1">
-                {investigation.unique_oauth_apps?.length > 0 ? (
-                  investigation.unique_oauth_apps.map((app, idx) => (
-                    <p key={idx} className="text-sm text-gray-600">{app}</p>
+                {investigation.sections.oauth_apps.items.length > 0 ? (
+                  investigation.sections.oauth_apps.items.map((app, idx) => (
+                    <p key={idx} className="text-sm text-gray-600">{app.value}</p>
                   ))
                 ) : (
                   <p className="text-sm text-gray-500">None</p>
@@ -140,21 +151,21 @@ export default function InvestigationDrillDown() {
           </div>
 
           {/* Geolocation Changes */}
-          {investigation.geolocation_changes && investigation.geolocation_changes.length > 0 && (
+          {investigation.sections.geolocations.items.length > 0 && (
             <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-200">
               <div className="flex items-center gap-2 mb-4">
                 <MapPin className="h-5 w-5 text-red-600" />
                 <h3 className="text-lg font-semibold text-gray-900">Geolocation Changes</h3>
               </div>
               <div className="space-y-3">
-                {investigation.geolocation_changes.map((change, idx) => (
+                {investigation.sections.geolocations.items.map((change, idx) => (
                   <div key={idx} className="flex items-center justify-between p-3 bg-gray-50 rounded">
                     <div>
                       <p className="font-medium text-gray-900">{change.city}, {change.country}</p>
                       <p className="text-xs text-gray-600 font-mono">{change.ip_address}</p>
                     </div>
                     <p className="text-sm text-gray-500">
-                      {format(new Date(change.timestamp), 'MMM dd, HH:mm')}
+                      {format(new Date(change.first_seen), 'MMM dd, HH:mm')}
                     </p>
                   </div>
                 ))}
@@ -163,21 +174,21 @@ export default function InvestigationDrillDown() {
           )}
 
           {/* Role Changes */}
-          {investigation.role_changes && investigation.role_changes.length > 0 && (
+          {investigation.sections.role_changes.items.length > 0 && (
             <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-200">
               <div className="flex items-center gap-2 mb-4">
                 <Shield className="h-5 w-5 text-blue-600" />
                 <h3 className="text-lg font-semibold text-gray-900">Role Changes</h3>
               </div>
               <div className="space-y-3">
-                {investigation.role_changes.map((change, idx) => (
+                {investigation.sections.role_changes.items.map((change, idx) => (
                   <div key={idx} className="flex items-center justify-between p-3 bg-gray-50 rounded">
                     <div>
                       <p className="font-medium text-gray-900">{change.role_name}</p>
-                      <p className="text-xs text-gray-600 font-mono">{change.ip_address}</p>
+                      <p className="text-xs text-gray-600">{change.count} assignment(s)</p>
                     </div>
                     <p className="text-sm text-gray-500">
-                      {format(new Date(change.timestamp), 'MMM dd, HH:mm')}
+                      {format(new Date(change.last_seen), 'MMM dd, HH:mm')}
                     </p>
                   </div>
                 ))}
@@ -186,23 +197,23 @@ export default function InvestigationDrillDown() {
           )}
 
           {/* OAuth Consents */}
-          {investigation.oauth_consents && investigation.oauth_consents.length > 0 && (
+          {investigation.sections.oauth_consents.items.length > 0 && (
             <div className="bg-white p-6 rounded-lg shadow-sm border border-gray-200">
               <div className="flex items-center gap-2 mb-4">
                 <AlertTriangle className="h-5 w-5 text-orange-600" />
                 <h3 className="text-lg font-semibold text-gray-900">OAuth Consents</h3>
               </div>
               <div className="space-y-3">
-                {investigation.oauth_consents.map((consent, idx) => (
+                {investigation.sections.oauth_consents.items.map((consent, idx) => (
                   <div key={idx} className="p-3 bg-gray-50 rounded">
                     <div className="flex items-center justify-between mb-2">
-                      <p className="font-medium text-gray-900">{consent.app_name}</p>
+                      <p className="font-medium text-gray-900">{consent.oauth_app_name}</p>
                       <p className="text-sm text-gray-500">
-                        {format(new Date(consent.timestamp), 'MMM dd, HH:mm')}
+                        {format(new Date(consent.last_seen), 'MMM dd, HH:mm')}
                       </p>
                     </div>
-                    <p className="text-xs text-gray-600 mb-1">Scopes: {consent.scopes}</p>
-                    <p className="text-xs text-gray-500 font-mono">IP: {consent.ip_address}</p>
+                    <p className="text-xs text-gray-600 mb-1">Scopes: {consent.oauth_scopes}</p>
+                    <p className="text-xs text-gray-500">{consent.count} consent(s)</p>
                   </div>
                 ))}
               </div>
@@ -225,7 +236,7 @@ export default function InvestigationDrillDown() {
                   </tr>
                 </thead>
                 <tbody className="bg-white divide-y divide-gray-200">
-                  {investigation.events?.slice(0, 10).map((event) => (
+                  {events.map((event) => (
                     <tr key={event.id}>
                       <td className="px-4 py-3 whitespace-nowrap text-sm text-gray-900">
                         {format(new Date(event.timestamp), 'MMM dd, HH:mm')}
@@ -264,6 +275,14 @@ export default function InvestigationDrillDown() {
                 </tbody>
               </table>
             </div>
+            {eventsCursor && (
+              <button
+                onClick={() => fetchEvents(investigation.user, eventsCursor)}
+                className="mt-4 px-4 py-2 text-sm text-blue-600 border border-blue-600 rounded-md hover:bg-blue-50"
+              >
+                Load more
+              </button>
+            )}
           </div>
         </div>
       )}
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react'
 import { Shield, UserX, Lock, Smartphone, Ban, CheckCircle, Clock, AlertCircle } from 'lucide-react'
 import { format } from 'date-fns'
-import api from '../services/api'
+import api, { subscribeLiveFeed } from '../services/api'
 
 const ACTION_TYPES = [
   {
@@ -50,6 +50,10 @@ const STATUS_COLORS = {
 
 export default function ResponseActions() {
   const [incidents, setIncidents] = useState([])
+  const [facets, setFacets] = useState({ status: [], severity: [], scenario_type: [] })
+  const [queueFilters, setQueueFilters] = useState({ status: '', severity: '' })
+  const [nextCursor, setNextCursor] = useState(null)
+  const [total, setTotal] = useState(0)
   const [selectedIncident, setSelectedIncident] = useState(null)
   const [responseActions, setResponseActions] = useState([])
   const [loading, setLoading] = useState(true)
@@ -57,7 +61,20 @@ export default function ResponseActions() {
 
   useEffect(() => {
     fetchIncidents()
-  }, [])
+  }, [queueFilters])
+
+  // Status changes made elsewhere (other analysts, background jobs) update the queue in place;
+  // re-subscribed with the filters so an overflow refetches the current queue
+  useEffect(() => subscribeLiveFeed(['incidents'], {
+    incidents: ({ items }) => {
+      const changed = Object.fromEntries(items.map((i) => [i.incident_id, i]))
+      const merge = (incident) => changed[incident.incident_id] ? { ...incident, ...changed[incident.incident_id] } : incident
+      // Incidents absorbed by correlation leave the queue
+      setIncidents((current) => current.map(merge).filter((incident) => !incident.merged_into))
+      setSelectedIncident((current) => current && merge(current))
+    },
+    overflow: () => fetchIncidents(),
+  }), [queueFilters])
 
   useEffect(() => {
     if (selectedIncident) {
@@ -65,11 +82,19 @@ export default function ResponseActions() {
     }
   }, [selectedIncident])
 
-  const fetchIncidents = async () => {
-    setLoading(true)
+  const fetchIncidents = async (cursor = null) => {
+    if (!cursor) setLoading(true)
     try {
-      const res = await api.get('/incidents')
-      setIncidents(res.data)
+      const params = new URLSearchParams()
+      if (queueFilters.status) params.append('status', queueFilters.status)
+      if (queueFilters.severity) params.append('severity', queueFilters.severity)
+      if (cursor) params.append('cursor', cursor)
+      const res = await api.get(`/incidents?${params}`)
+      setIncidents(cursor ? [...incidents, ...res.data.items] : res.data.items)
+      setNextCursor(res.data.next_cursor)
+      setTotal(res.data.total)
+      setFacets(res.data.facets)
+      return res.data.items
     } catch (error) {
       console.error('Error fetching incidents:', error)
     } finally {
@@ -94,10 +119,10 @@ export default function ResponseActions() {
     try {
       const res = await api.post(`/incidents/${selectedIncident.incident_id}/response/${actionType}`)
       alert(res.data.message)
-      await fetchIncidents()
+      const refreshed = await fetchIncidents()
       await fetchResponseActions()
       // Update selected incident
-      const updatedIncident = incidents.find(i => i.incident_id === selectedIncident.incident_id)
+      const updatedIncident = (refreshed || []).find(i => i.incident_id === selectedIncident.incident_id)
       if (updatedIncident) {
         setSelectedIncident(updatedIncident)
       }
@@ -124,7 +149,27 @@ export default function ResponseActions() {
         <div className="lg:col-span-1">
           <div className="bg-white rounded-lg shadow-sm border border-gray-200">
             <div className="p-4 border-b border-gray-200">
-              <h3 className="font-semibold text-gray-900">Active Incidents</h3>
+              <h3 className="font-semibold text-gray-900">Active Incidents ({total})</h3>
+              {['status', 'severity'].map((facet) => (
+                <div key={facet} className="flex flex-wrap gap-2 mt-2">
+                  {facets[facet].map((f) => (
+                    <button
+                      key={f.value}
+                      onClick={() => setQueueFilters({
+                        ...queueFilters,
+                        [facet]: queueFilters[facet] === f.value ? '' : f.value
+                      })}
+                      className={`px-2 py-1 text-xs rounded-full border ${
+                        queueFilters[facet] === f.value
+                          ? 'bg-blue-600 text-white border-blue-600'
+                          : 'bg-white text-gray-700 border-gray-300'
+                      }`}
+                    >
+                      {f.value} ({f.count})
+                    </button>
+                  ))}
+                </div>
+              ))}
             </div>
             <div className="divide-y divide-gray-200 max-h-96 overflow-y-auto">
               {incidents.map((incident) => (
@@ -158,6 +203,14 @@ export default function ResponseActions() {
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <button
+                  onClick={() => fetchIncidents(nextCursor)}
+                  className="w-full p-3 text-sm text-blue-600 hover:bg-gray-50"
+                >
+                  Load more
+                </button>
+              )}
             </div>
           </div>
         </div>
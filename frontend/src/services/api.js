@@ -9,4 +9,16 @@ const api = axios.create({
   },
 })
 
+// Server-Sent Events feed of new alerts, incident status changes and KPI deltas.
+// EventSource reconnects on its own and resumes from the last event id it saw.
+export function subscribeLiveFeed(topics, handlers) {
+  const source = new EventSource(`${API_BASE_URL}/live/feed?topics=${topics.join(',')}`)
+  Object.entries(handlers).forEach(([topic, handler]) => {
+    source.addEventListener(topic, (event) => handler(JSON.parse(event.data)))
+  })
+  // Dropped as a slow consumer: EventSource reconnects, the page re-fetches to catch up
+  source.addEventListener('overflow', () => handlers.overflow && handlers.overflow())
+  return () => source.close()
+}
+
 export default api